@@ -0,0 +1,193 @@
+import argparse
+import math
+import time
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+HOURS_PER_WEEK = 7 * 24
+WEEK = HOURS_PER_WEEK * 3600
+# The epoch was a Thursday, hour 72 of a week starting on Monday.
+EPOCH_HOUR_OF_WEEK = 3 * 24
+SEED = 42
+
+# An arrival model is a dict with:
+#     'rate': The submissions per second in each hour of the week, Monday
+#             0:00 local time first, of shape (HOURS_PER_WEEK,), or of shape
+#             (num_groups, HOURS_PER_WEEK) with a rate per group, e.g. per VC.
+#     'start', 'end': The first and last submission it was fitted on.
+#     'groups': The names of the groups, if any.
+# Times are local wall clock seconds since the epoch, since people submit by
+# their clock. Job tables and exported jobs hold UTC seconds, which
+# wall_seconds converts.
+
+
+def wall_seconds(utc_seconds: np.ndarray) -> np.ndarray:
+    """Converts UTC seconds, e.g. of a job table, to local wall clock seconds."""
+    from timeindex import minutes_to_local
+
+    utc_seconds = np.asarray(utc_seconds, dtype=float)
+    minutes = np.floor(utc_seconds / 60)
+    local = minutes_to_local(minutes.astype(np.int64)).astype(np.int64)
+    return local * 60 + (utc_seconds - minutes * 60)
+
+
+def hour_of_week(seconds: np.ndarray) -> np.ndarray:
+    """Returns the hour of the week of wall clock seconds."""
+    hours = np.floor_divide(seconds, 3600).astype(np.int64)
+    return (hours + EPOCH_HOUR_OF_WEEK) % HOURS_PER_WEEK
+
+
+def exposure(start: float, end: float) -> np.ndarray:
+    """Returns the seconds of [start, end) in each hour of the week."""
+    hours = np.arange(math.floor(start / 3600), math.ceil(end / 3600))
+    lo = np.maximum(hours * 3600.0, start)
+    hi = np.minimum((hours + 1) * 3600.0, end)
+    return np.bincount(hour_of_week(hours * 3600), hi - lo, minlength=HOURS_PER_WEEK)
+
+
+def fit_rates(submitted: np.ndarray, groups: np.ndarray = None, names=None) -> dict:
+    """Estimates an arrival model by maximum likelihood.
+
+    The rate of an hour of the week is the number of submissions in it over
+    the time the trace spends in it.
+
+    Args:
+        submitted: The submission times in wall clock seconds; NaNs are left
+                   out.
+        groups: Optional group codes of the submissions, e.g. VCs.
+        names: The names of the groups.
+    """
+    known = ~np.isnan(submitted)
+    submitted = submitted[known]
+    start, end = float(submitted.min()), float(submitted.max())
+    seconds = exposure(start, end + 1)
+    bins = hour_of_week(submitted)
+    if groups is None:
+        counts = np.bincount(bins, minlength=HOURS_PER_WEEK)
+    else:
+        num_groups = len(names) if names is not None else int(groups.max()) + 1
+        counts = np.bincount(
+            groups[known].astype(np.int64) * HOURS_PER_WEEK + bins,
+            minlength=num_groups * HOURS_PER_WEEK,
+        ).reshape(num_groups, HOURS_PER_WEEK)
+    rate = np.divide(counts, seconds, out=np.zeros(counts.shape), where=seconds > 0)
+    model = {"rate": rate, "start": start, "end": end}
+    if names is not None:
+        model["groups"] = np.asarray(names)
+    return model
+
+
+def sample_arrivals(rng, model: dict, start: float, duration: float) -> tuple:
+    """Samples the submissions in [start, start + duration) by thinning.
+
+    Candidates come from a homogeneous Poisson process at the peak rate, all
+    drawn at once, and each is kept with probability rate / peak at its
+    time.
+
+    Returns:
+        The sorted submission times and the group code of each, 0 without
+        groups.
+    """
+    rates = np.atleast_2d(model["rate"])
+    times, groups = [], []
+    for group, rate in enumerate(rates):
+        peak = rate.max()
+        if peak <= 0:
+            continue
+        candidates = start + rng.random(rng.poisson(peak * duration)) * duration
+        keep = rng.random(len(candidates)) * peak < rate[hour_of_week(candidates)]
+        times.append(candidates[keep])
+        groups.append(np.full(np.count_nonzero(keep), group, dtype=np.int64))
+    if not times:
+        return np.empty(0), np.empty(0, dtype=np.int64)
+    times = np.concatenate(times)
+    order = np.argsort(times)
+    return times[order], np.concatenate(groups)[order]
+
+
+def first_arrivals(rng, model: dict, num: int, start: float = None) -> tuple:
+    """Samples the first num submissions from start, the model's start if
+    None, extending the sampled window until there are enough.
+
+    Returns:
+        The submission times and their group codes (see sample_arrivals).
+    """
+    if start is None:
+        start = model["start"]
+    mean_rate = np.sum(model["rate"]) / HOURS_PER_WEEK
+    window = max(num / mean_rate, WEEK)
+    times, groups = [], []
+    count = 0
+    while count < num:
+        t, g = sample_arrivals(rng, model, start, window)
+        times.append(t)
+        groups.append(g)
+        count += len(t)
+        start += window
+    return np.concatenate(times)[:num], np.concatenate(groups)[:num]
+
+
+def plot_rates(model: dict, sampled: np.ndarray = None, path="arrival_rates.pdf"):
+    """Plots the hourly rates of a model and of arrivals sampled from it."""
+    fig, ax = plt.subplots()
+    hours = np.arange(HOURS_PER_WEEK)
+    rate = np.atleast_2d(model["rate"]).sum(axis=0)
+    ax.step(hours, rate * 3600, where="post", label="fitted")
+    if sampled is not None:
+        seconds = exposure(sampled.min(), sampled.max() + 1)
+        counts = np.bincount(hour_of_week(sampled), minlength=HOURS_PER_WEEK)
+        ax.step(hours, counts / seconds * 3600, where="post", label="sampled")
+    ax.set_xlabel("Hour of the week (Monday 0:00 first)")
+    ax.set_ylabel("Submissions per hour")
+    ax.set_xlim(left=0, right=HOURS_PER_WEEK)
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fits and samples an hour-of-week arrival model."
+    )
+    parser.add_argument("--by-vc", action="store_true", help="fit a rate per VC")
+    parser.add_argument(
+        "--days", type=float, help="days to sample, the trace's if unset"
+    )
+    parser.add_argument("--seed", type=int, default=SEED)
+    args = parser.parse_args()
+
+    if args.by_vc:
+        from job_table import load_job_table
+
+        table = load_job_table()
+        model = fit_rates(
+            wall_seconds(table["submitted_time"]), table["vc"], table["vcs"]
+        )
+    else:
+        from job_export import load_job_columns
+
+        model = fit_rates(
+            wall_seconds(load_job_columns(columns=["submitted_time"])["submitted_time"])
+        )
+    rate = np.atleast_2d(model["rate"]).sum(axis=0) * 3600
+    print(f"mean rate per hour {rate.mean()}")
+    print(f"peak rate per hour {rate.max()} in hour {rate.argmax()} of the week")
+    print(f"lowest rate per hour {rate.min()} in hour {rate.argmin()} of the week")
+
+    if args.days is None:
+        duration = model["end"] - model["start"]
+    else:
+        duration = args.days * 86400
+    rng = np.random.default_rng(args.seed)
+    begin = time.perf_counter()
+    times, _ = sample_arrivals(rng, model, model["start"], duration)
+    print(
+        f"sampled {len(times)} submissions over {duration / 86400:.0f} days"
+        f" in {time.perf_counter() - begin:.3f} s"
+    )
+    plot_rates(model, times)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+import argparse
+import concurrent.futures
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import synthetic_trace
+
+BENCH_DIR = "../bench-traces"
+RESULTS_PATH = "bench_results.json"
+SCALES = [1, 10, 100]
+UTIL_DAYS = 7
+SEED = 42
+TOLERANCE = 0.2
+NUM_INTERRUPT_JOBS = 20
+STAGES = [
+    "load_cluster_log",
+    "filter_jobs",
+    "jobs_to_dict",
+    "simulate_scheduler",
+    "fit_scaling",
+    "gpu_utilization",
+    "get_utilization_data",
+    "count_interrupts",
+]
+
+
+def _reset_peak_rss():
+    """Resets the peak RSS of this process where the kernel supports it."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_mb() -> float:
+    """Returns the peak RSS since the last reset (or process start) in MB."""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+
+def trace_dir(scale: float, util_days: float = UTIL_DAYS, seed: int = SEED) -> str:
+    """Returns the synthetic trace directory of a scale, generating it once."""
+    logdir = os.path.join(BENCH_DIR, f"scale{scale:g}_days{util_days:g}_seed{seed}")
+    done = os.path.join(logdir, ".complete")
+    if not os.path.exists(done):
+        synthetic_trace.generate_trace(logdir, scale, util_days, seed)
+        open(done, "w").close()
+    return logdir
+
+
+def _run_stages(logdir: str, stages: list) -> list:
+    """Runs the pipeline stages on one trace, timing each selected stage.
+
+    Stages that are not selected still run if a later stage needs their
+    output, but they are not measured.
+    """
+    import matplotlib
+
+    matplotlib.use("Agg")
+
+    import calc_interrupts
+    import fit_scaling
+    import simulate_scheduler
+    import trace_analysis_mw
+    import utilization
+
+    trace_analysis_mw.LOGDIR = os.path.abspath(logdir)
+    state = {}
+
+    def load_cluster_log():
+        state["jobs"] = trace_analysis_mw.load_cluster_log()
+        return len(state["jobs"])
+
+    def filter_jobs():
+        state["filtered"] = trace_analysis_mw.filter_jobs(state["jobs"])
+        state["filtered"].sort(key=lambda x: x.submitted_time)
+        return len(state["jobs"])
+
+    def jobs_to_dict():
+        state["jobs_dict"] = trace_analysis_mw.jobs_to_dict(state["filtered"])
+        return len(state["filtered"])
+
+    def simulate():
+        state["executed"] = simulate_scheduler.simulate_scheduler(
+            state["jobs_dict"], sample_every=1, stretch=20
+        )
+        return len(state["jobs_dict"])
+
+    def fit():
+        fit_scaling.fit_scaling(
+            state["executed"], relative_runtime=True, out_dir=state["tmp"]
+        )
+        return len(state["executed"]["mw_start_time"])
+
+    def gpu_utilization():
+        # Built into the run's directory rather than loaded from the cache.
+        cube_dir = os.path.join(state["tmp"], "gpu_util")
+        state["gpu_util"] = utilization.build_utilization_cube(cube_dir)
+        return int(np.prod(state["gpu_util"]["util"].shape))
+
+    def get_utilization_data():
+        data = trace_analysis_mw.get_utilization_data(state["jobs"], state["gpu_util"])
+        return sum(len(v) for by_gpus in data.values() for v in by_gpus.values())
+
+    def count_interrupts():
+        jobs = state["jobs_dict"]
+        for jo in jobs[:NUM_INTERRUPT_JOBS]:
+            calc_interrupts.count_interrupts(jo, jobs)
+        return min(NUM_INTERRUPT_JOBS, len(jobs)) * len(jobs)
+
+    funcs = {
+        "load_cluster_log": (load_cluster_log, []),
+        "filter_jobs": (filter_jobs, ["load_cluster_log"]),
+        "jobs_to_dict": (jobs_to_dict, ["filter_jobs"]),
+        "simulate_scheduler": (simulate, ["jobs_to_dict"]),
+        "fit_scaling": (fit, ["simulate_scheduler"]),
+        "gpu_utilization": (gpu_utilization, []),
+        "get_utilization_data": (
+            get_utilization_data,
+            ["load_cluster_log", "gpu_utilization"],
+        ),
+        "count_interrupts": (count_interrupts, ["jobs_to_dict"]),
+    }
+    done = set()
+    results = []
+
+    def run(stage, measure):
+        if stage in done:
+            return
+        func, deps = funcs[stage]
+        for dep in deps:
+            run(dep, measure=dep in stages)
+        _reset_peak_rss()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            items = func()
+        seconds = time.perf_counter() - start
+        done.add(stage)
+        if measure:
+            results.append(
+                {
+                    "stage": stage,
+                    "seconds": seconds,
+                    "peak_rss_mb": _peak_rss_mb(),
+                    "items": items,
+                    "items_per_second": items / seconds if seconds > 0 else None,
+                }
+            )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Figures and cubes go to the run's directory.
+        state["tmp"] = tmp
+        for stage in stages:
+            run(stage, measure=True)
+    return results
+
+
+def run_benchmarks(
+    scales: list = SCALES,
+    stages: list = STAGES,
+    util_days: float = UTIL_DAYS,
+    seed: int = SEED,
+) -> dict:
+    """Times the pipeline stages on synthetic traces of several scales.
+
+    Each scale runs in a fresh process, so that peak RSS is not inflated by
+    earlier scales.
+
+    Args:
+        scales: Trace sizes relative to the Philly trace.
+        stages: The stages to measure, a subset of STAGES.
+        util_days: The number of days of utilization data per trace.
+        seed: The seed of the synthetic traces.
+
+    Returns:
+        A dict with the run's metadata and one result per scale and stage.
+    """
+    results = []
+    ctx = multiprocessing.get_context("spawn")
+    for scale in scales:
+        logdir = trace_dir(scale, util_days, seed)
+        with concurrent.futures.ProcessPoolExecutor(1, mp_context=ctx) as pool:
+            for result in pool.submit(_run_stages, logdir, stages).result():
+                result["scale"] = scale
+                results.append(result)
+                print(
+                    f"scale {scale:g} {result['stage']}: {result['seconds']:.3f} s, "
+                    f"{result['peak_rss_mb']:.1f} MB peak RSS"
+                )
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "util_days": util_days,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def compare_results(results: dict, baseline: dict, tolerance: float = TOLERANCE):
+    """Compares benchmark results against a saved baseline.
+
+    Args:
+        results: The output of run_benchmarks.
+        baseline: An earlier output of run_benchmarks.
+        tolerance: The relative slowdown or memory growth that is tolerated.
+
+    Returns:
+        A list of (scale, stage, metric, baseline value, value) tuples, one
+        for each metric that regressed by more than tolerance.
+    """
+    base = {(r["scale"], r["stage"]): r for r in baseline["results"]}
+    regressions = []
+    for r in results["results"]:
+        b = base.get((r["scale"], r["stage"]))
+        if b is None:
+            continue
+        for metric in ["seconds", "peak_rss_mb"]:
+            if r[metric] > b[metric] * (1 + tolerance):
+                regressions.append(
+                    (r["scale"], r["stage"], metric, b[metric], r[metric])
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the trace pipeline.")
+    parser.add_argument("--scales", type=float, nargs="+", default=SCALES)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--util-days", type=float, default=UTIL_DAYS)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--out", default=RESULTS_PATH)
+    parser.add_argument("--baseline", help="results to compare against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.scales, args.stages, args.util_days, args.seed)
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=4)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.tolerance)
+        for scale, stage, metric, before, after in regressions:
+            print(
+                f"REGRESSION scale {scale:g} {stage} {metric}: {before:.3f} -> {after:.3f}"
+            )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,19 @@
-import datetime
 import json
 
-DATE_FORMAT_STR = "%Y-%m-%d %H:%M:%S"
+from job_export import load_jobs
 
 
 def count_interrupts(jo1, jobs):
     interrupts = 0
     for att1 in jo1["attempts"]:
-        start1 = datetime.datetime.strptime(att1["start_time"],
-                                            DATE_FORMAT_STR)
-        end1 = datetime.datetime.strptime(att1["end_time"], DATE_FORMAT_STR)
+        start1 = att1["start_time"]
+        end1 = att1["end_time"]
         for jo2 in jobs:
             if jo1 == jo2:
                 continue
             for att2 in jo2["attempts"]:
-                start2 = datetime.datetime.strptime(att2["start_time"],
-                                                    DATE_FORMAT_STR)
-                end2 = datetime.datetime.strptime(att2["end_time"],
-                                                  DATE_FORMAT_STR)
+                start2 = att2["start_time"]
+                end2 = att2["end_time"]
                 if start1 < start2 < end1:
                     interrupts = interrupts + 1
                 if start1 < end2 < end1:
@@ -26,8 +22,7 @@ def count_interrupts(jo1, jobs):
 
 
 def main():
-    with open("jobs.json", "r") as json_file:
-        jobs = json.load(json_file)
+    jobs = load_jobs(columns=["id", "attempts"])
 
     interrupts = {}
     for job in jobs:
@@ -1,13 +1,10 @@
-import json
-
 import numpy as np
 
+from job_export import load_job_columns
 
-def find_max_num_gpus():
-    with open("jobs.json", "r") as json_file:
-        jobs = json.load(json_file)
 
-    num_gpus = [j["num_gpus"] for j in jobs]
+def find_max_num_gpus():
+    num_gpus = load_job_columns(columns=["num_gpus"])["num_gpus"]
     print(np.max(num_gpus))
 
 
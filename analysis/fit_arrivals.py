@@ -1,26 +1,16 @@
-import datetime
-import json
-
 import matplotlib.pyplot as plt
 import numpy as np
 import scipy
 
-DATE_FORMAT_STR = "%Y-%m-%d %H:%M:%S"
+from job_export import load_job_columns
 
 
 def fit_arrivals():
-    with open("jobs.json", "r") as json_file:
-        jobs = json.load(json_file)
-
-    print(f"number of jobs {len(jobs)}")
+    arrivals = load_job_columns(columns=["submitted_time"])["submitted_time"]
 
-    arrivals = []
-    for jo in jobs:
-        arr_date = datetime.datetime.strptime(jo["submitted_time"], DATE_FORMAT_STR)
-        arr_time = arr_date.timestamp()
-        arrivals.append(arr_time)
+    print(f"number of jobs {len(arrivals)}")
 
-    arrivals.sort()
+    arrivals = sorted(arrivals)
     fir = arrivals[0]
     arr_shifted = []
     for arr in arrivals:
@@ -1,9 +1,9 @@
-import json
-
 import matplotlib.pyplot as plt
 import numpy as np
 import scipy
 
+from job_export import load_jobs
+
 
 def dist(runtimes: [float], mean: float, std: float):
     dist = scipy.stats.norm
@@ -72,8 +72,7 @@ def fit_runtime(jobs: list):
 
 
 def main():
-    with open("jobs.json", "r") as json_file:
-        jobs = json.load(json_file)
+    jobs = load_jobs(columns=["runtime"])
     fit_runtime(jobs)
 
 
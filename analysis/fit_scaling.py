@@ -1,6 +1,10 @@
+import os
+
 import numpy as np
 import matplotlib.pyplot as plt
 
+FIGURE_DIR = "figures"
+
 
 def get_bin_mids(edges: np.ndarray) -> list:
     bin_mids = []
@@ -11,7 +15,7 @@ def get_bin_mids(edges: np.ndarray) -> list:
     return bin_mids
 
 
-def fit_time(metric: list, metric_name: str):
+def fit_time(metric: list, metric_name: str, out_dir: str = FIGURE_DIR):
     mean_metric = np.mean(metric)
     std_metric = np.std(metric)
 
@@ -31,17 +35,17 @@ def fit_time(metric: list, metric_name: str):
     ax.set_xlim(left=0, right=4 * mean_metric)
     plt.title(metric_name)
     # fig.tight_layout()
-    fig.savefig(f"{metric_name}.pdf")
+    fig.savefig(os.path.join(out_dir, f"{metric_name}.pdf"))
 
 
-def fit_frequency(metric: list, metric_name: str):
+def fit_frequency(metric, metric_name: str, out_dir: str = FIGURE_DIR):
     mean_metric = np.mean(metric)
     std_metric = np.std(metric)
 
     print(f"{metric_name} mean {mean_metric}")
     print(f"{metric_name} std {std_metric}")
 
-    counts = [metric.count(i) for i in range(1, 21)]
+    counts = np.bincount(metric, minlength=21)[1:21]
 
     fig, ax = plt.subplots()
 
@@ -51,55 +55,56 @@ def fit_frequency(metric: list, metric_name: str):
     ax.set_ylabel("Probability")
     plt.title(metric_name)
     fig.tight_layout()
-    fig.savefig(f"{metric_name}.pdf")
-
-
-def fit_scaling(jobs: list, relative_runtime: bool = False):
-    num_scale_ups = []
-    num_scale_downs = []
-    inter_scale_up_times = []
-    inter_scale_down_times = []
-    num_jobs_no_scale_ups = 0
-    num_jobs_no_scale_downs = 0
-    for jo in jobs:
-        if "scale_up" in jo:
-            num_scale_ups.append(len(jo["scale_up"]))
-        else:
-            num_scale_ups.append(0)
-            num_jobs_no_scale_ups += 1
-        if "scale_down" in jo:
-            num_scale_downs.append(len(jo["scale_down"]))
-        else:
-            num_scale_downs.append(0)
-            num_jobs_no_scale_downs += 1
-        jo_runtime = jo["runtime"]
-        if "scale_up" in jo:
-            for i, sca_up in enumerate(jo["scale_up"]):
-                if i == 0:
-                    inter_time = sca_up
-                else:
-                    inter_time = sca_up - jo["scale_up"][i - 1]
-                if relative_runtime:
-                    inter_time = inter_time / jo_runtime
-                inter_scale_up_times.append(inter_time)
-        if "scale_down" in jo:
-            for i, sca_down in enumerate(jo["scale_down"]):
-                if i == 0:
-                    inter_time = sca_down
-                else:
-                    inter_time = sca_down - jo["scale_down"][i - 1]
-                if relative_runtime:
-                    inter_time = inter_time / jo_runtime
-                inter_scale_down_times.append(inter_time)
-
-    print(f"total number of jobs {len(jobs)}")
-    print(f"num jobs with no scale ups {num_jobs_no_scale_ups}")
-    print(f"num jobs with no scale downs {num_jobs_no_scale_downs}")
-
-    fit_frequency(num_scale_ups, "num_scale_ups")
-    fit_frequency(num_scale_downs, "num_scale_downs")
-    fit_time(inter_scale_up_times, "inter_scale_up_times")
-    fit_time(inter_scale_down_times, "inter_scale_down_times")
+    fig.savefig(os.path.join(out_dir, f"{metric_name}.pdf"))
+
+
+def inter_event_times(schedule: dict, kind: str, relative_runtime: bool = False):
+    """Returns the times between consecutive scale events of each job.
+
+    The first event of a job counts from time 0, i.e. its time itself.
+
+    Args:
+        schedule: A schedule (see simulate_scheduler).
+        kind: 'scale_up' or 'scale_down'.
+        relative_runtime: If True, divides the times by the job's run time.
+    """
+    offsets = schedule[f"{kind}_offsets"]
+    times = schedule[kind]
+    counts = np.diff(offsets)
+    inter_times = np.diff(times, prepend=0.0)
+    inter_times[offsets[:-1][counts > 0]] = times[offsets[:-1][counts > 0]]
+    if relative_runtime:
+        inter_times = inter_times / np.repeat(schedule["runtime"], counts)
+    return inter_times
+
+
+def fit_scaling(
+    schedule: dict, relative_runtime: bool = False, out_dir: str = FIGURE_DIR
+):
+    """Prints and plots the scale events of a schedule.
+
+    The figures are written to out_dir as PDFs.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    num_scale_ups = np.diff(schedule["scale_up_offsets"])
+    num_scale_downs = np.diff(schedule["scale_down_offsets"])
+
+    print(f"total number of jobs {len(schedule['mw_start_time'])}")
+    print(f"num jobs with no scale ups {np.count_nonzero(num_scale_ups == 0)}")
+    print(f"num jobs with no scale downs {np.count_nonzero(num_scale_downs == 0)}")
+
+    fit_frequency(num_scale_ups, "num_scale_ups", out_dir)
+    fit_frequency(num_scale_downs, "num_scale_downs", out_dir)
+    fit_time(
+        inter_event_times(schedule, "scale_up", relative_runtime),
+        "inter_scale_up_times",
+        out_dir,
+    )
+    fit_time(
+        inter_event_times(schedule, "scale_down", relative_runtime),
+        "inter_scale_down_times",
+        out_dir,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,339 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import trace_analysis_mw
+from job_table import load_job_table
+
+# A server is fully free when all of its GPUS_PER_SERVER GPUs are; GPU masks
+# are uint16, so no server has more than MAX_GPUS.
+GPUS_PER_SERVER = 8
+MAX_GPUS = 16
+# Servers are binned by their number of free GPUs, 0 to MAX_GPUS, except
+# fully free GPUS_PER_SERVER-GPU servers, which get FREE_BIN.
+FREE_BIN = MAX_GPUS + 1
+NUM_BINS = MAX_GPUS + 2
+
+# Fragmentation is tracked without rescanning the cluster every minute:
+#   1. The GPU masks of the attempts are split into one busy interval per
+#      GPU, and a cumulative sum over their start and end minutes finds the
+#      minutes each GPU turns busy or free, so GPUs shared by overlapping
+#      attempts count once.
+#   2. A cumulative sum of those per machine gives its busy GPUs after every
+#      change, and so the bin it leaves and the bin it enters.
+#   3. A cumulative sum of the bin changes over the minutes they happen at
+#      gives the servers in every bin at every change point, from which
+#      all measures follow.
+# Times are UTC minutes since the epoch, like the utilization cube's. An
+# attempt holds its GPUs from the minute it starts until the minute it ends;
+# attempts without a start or end, or within one minute, are left out.
+#
+# A fragmentation series is a dict with, per change point (p rows):
+#     'minute': The minute from which the values hold until the next one.
+#     'free_servers': The fully free GPUS_PER_SERVER-GPU servers.
+#     'free_gpus': All free GPUs.
+#     'scattered_gpus': The free GPUs on servers that are not fully free.
+#     'largest_job': The most GPUs a job can get using fully free servers
+#                    and at most one other server.
+# After the last change point all servers are free.
+SERIES = ["free_servers", "free_gpus", "scattered_gpus", "largest_job"]
+
+
+def machine_capacities(table: dict) -> dict:
+    """Returns the servers of the cluster and their GPUs.
+
+    The servers are those of the job table, in order of their codes, then
+    those of cluster_machine_list that no job ran on. Servers missing from
+    the list have GPUS_PER_SERVER GPUs.
+
+    Returns:
+        A dict with the 'machines' ids and the 'capacity' of each.
+    """
+    with trace_analysis_mw.open_trace_file("cluster_machine_list") as f:
+        listed = pd.read_csv(f, index_col=False)
+    listed = dict(zip(listed.iloc[:, 0].astype(str), listed.iloc[:, 1].astype(int)))
+    used = set(table["machines"])
+    machines = list(table["machines"]) + [m for m in listed if m not in used]
+    capacity = np.array([listed.get(m, GPUS_PER_SERVER) for m in machines])
+    return {
+        "machines": np.array(machines, dtype=str),
+        "capacity": np.minimum(capacity, MAX_GPUS).astype(np.int64),
+    }
+
+
+def _bins(free: np.ndarray, capacity: np.ndarray) -> np.ndarray:
+    full = (free == capacity) & (capacity == GPUS_PER_SERVER)
+    return np.where(full, FREE_BIN, free)
+
+
+def machine_events(table: dict, capacity: np.ndarray) -> dict:
+    """Finds every change of the number of free GPUs of a server.
+
+    Args:
+        table: A job table (see job_table).
+        capacity: The GPUs of each server (see machine_capacities).
+
+    Returns:
+        A dict of arrays with one row per change, sorted by machine and
+        minute:
+            'machine': The server's code.
+            'minute': When it happens.
+            'old_bin', 'new_bin': The server's bin before and after.
+            'free_delta': The change of its free GPUs.
+    """
+    start = np.floor(table["attempt_start"] / 60)
+    end = np.floor(table["attempt_end"] / 60)
+    held = end > start
+    details = np.flatnonzero(held[table["detail_attempt"]])
+    masks = table["detail_gpu_mask"][details].astype(np.int64)
+    row, gpu = np.nonzero((masks[:, None] >> np.arange(MAX_GPUS)) & 1)
+    details = details[row]
+    attempts = table["detail_attempt"][details]
+    key = table["detail_machine"][details].astype(np.int64) * MAX_GPUS + gpu
+    key = np.concatenate([key, key])
+    minute = np.concatenate([start[attempts], end[attempts]]).astype(np.int64)
+    delta = np.repeat(np.array([1, -1]), len(attempts))
+    # Within a minute, GPUs are released before they are taken again, and
+    # every GPU's holds sum to 0, so one cumulative sum serves all GPUs.
+    order = np.lexsort((delta, minute, key))
+    holds = np.cumsum(delta[order])
+    flips = (holds > 0) != (holds - delta[order] > 0)
+    machine = key[order][flips] // MAX_GPUS
+    minute = minute[order][flips]
+    busy_delta = np.where(holds[flips] > 0, 1, -1)
+
+    order = np.lexsort((minute, machine))
+    machine, minute, busy_delta = machine[order], minute[order], busy_delta[order]
+    busy = np.cumsum(busy_delta)
+    cap = capacity[machine]
+    free_after = np.clip(cap - busy, 0, None)
+    free_before = np.clip(cap - (busy - busy_delta), 0, None)
+    return {
+        "machine": machine,
+        "minute": minute,
+        "old_bin": _bins(free_before, cap),
+        "new_bin": _bins(free_after, cap),
+        "free_delta": free_after - free_before,
+    }
+
+
+def fragmentation_series(
+    events: dict, capacity: np.ndarray, machines: np.ndarray = None
+) -> dict:
+    """Returns the fragmentation series (see above) of a set of servers.
+
+    Args:
+        events: The output of machine_events.
+        capacity: The GPUs of each server.
+        machines: A boolean mask of the servers, all servers if None.
+    """
+    if machines is None:
+        machines = np.ones(len(capacity), dtype=bool)
+    keep = machines[events["machine"]]
+    minute = events["minute"][keep]
+    points, index = np.unique(minute, return_inverse=True)
+    index = index.ravel()
+    num_points = len(points)
+
+    def per_point(bins, weights):
+        flat = index * NUM_BINS + bins[keep]
+        counts = np.bincount(flat, weights, minlength=num_points * NUM_BINS)
+        return counts.reshape(num_points, NUM_BINS)
+
+    initial = np.bincount(
+        _bins(capacity[machines], capacity[machines]), minlength=NUM_BINS
+    )
+    changes = per_point(events["new_bin"], None) - per_point(events["old_bin"], None)
+    hist = initial + np.cumsum(changes, axis=0)
+    free_gpus = capacity[machines].sum() + np.cumsum(
+        np.bincount(index, events["free_delta"][keep], minlength=num_points)
+    ).astype(np.int64)
+
+    free_servers = hist[:, FREE_BIN]
+    # The most free GPUs on any server that is not fully free.
+    partial = hist[:, :FREE_BIN] > 0
+    most_free = np.where(
+        partial.any(axis=1), FREE_BIN - 1 - np.argmax(partial[:, ::-1], axis=1), 0
+    )
+    return {
+        "minute": points,
+        "free_servers": free_servers,
+        "free_gpus": free_gpus,
+        "scattered_gpus": free_gpus - GPUS_PER_SERVER * free_servers,
+        "largest_job": GPUS_PER_SERVER * free_servers + most_free,
+    }
+
+
+def machine_vcs(table: dict, num_machines: int = None) -> np.ndarray:
+    """Assigns every server to the VC that used the most GPU time on it.
+
+    The trace does not say which servers belong to which VC, so this is the
+    best guess from the jobs.
+
+    Returns:
+        The VC code of each server, -1 for servers no job ran on.
+    """
+    if num_machines is None:
+        num_machines = len(table["machines"])
+    num_vcs = len(table["vcs"])
+    attempt = table["detail_attempt"]
+    duration = np.nan_to_num(table["attempt_end"] - table["attempt_start"])
+    flat = (
+        table["detail_machine"].astype(np.int64) * num_vcs
+        + table["vc"][table["attempt_job"][attempt]]
+    )
+    gpu_seconds = np.bincount(
+        flat,
+        table["detail_num_gpus"] * duration[attempt],
+        minlength=num_machines * num_vcs,
+    ).reshape(num_machines, num_vcs)
+    return np.where(gpu_seconds.max(axis=1) > 0, gpu_seconds.argmax(axis=1), -1)
+
+
+def durations(series: dict) -> np.ndarray:
+    """Returns the minutes each value of a series holds."""
+    return np.diff(series["minute"], append=series["minute"][-1:])
+
+
+def per_minute(series: dict, name: str) -> np.ndarray:
+    """Expands a measure of a series to one value per minute from its first
+    to its last change point."""
+    return np.repeat(series[name][:-1], durations(series)[:-1])
+
+
+def time_histogram(series: dict, name: str, max_value: int = None) -> np.ndarray:
+    """Returns the minutes a measure of a series spends at each value."""
+    return np.bincount(series[name], durations(series), minlength=max_value or 0)
+
+
+def histogram_quantile(counts: np.ndarray, q: float) -> int:
+    """Returns the smallest value at or below which a fraction q of the
+    minutes of a time_histogram lie."""
+    cum = np.cumsum(counts)
+    return int(np.searchsorted(cum, q * cum[-1]))
+
+
+def vc_series(table: dict, events: dict, capacity: np.ndarray) -> dict:
+    """Returns the fragmentation series of the servers of each VC (see
+    machine_vcs), keyed by VC name, for the VCs with servers."""
+    home = machine_vcs(table, len(capacity))
+    return {
+        table["vcs"][vc]: fragmentation_series(events, capacity, home == vc)
+        for vc in np.unique(home[home >= 0])
+    }
+
+
+def fragmentation_summary(series_by_group: dict) -> pd.DataFrame:
+    """Summarizes fragmentation series with time-weighted means and quantiles.
+
+    Returns:
+        A DataFrame indexed by group with the mean fully free servers, free
+        and scattered GPUs, the scattered share of the free GPUs, the median
+        and 10th percentile largest job and the fraction of the time no job
+        of 2 * GPUS_PER_SERVER GPUs fits.
+    """
+    rows = {}
+    for group, series in series_by_group.items():
+        minutes = durations(series)
+        total = max(minutes.sum(), 1)
+
+        def mean(name):
+            return float(np.dot(series[name], minutes) / total)
+
+        largest = time_histogram(series, "largest_job")
+        rows[group] = {
+            "free_servers": mean("free_servers"),
+            "free_gpus": mean("free_gpus"),
+            "scattered_gpus": mean("scattered_gpus"),
+            "scattered_share": mean("scattered_gpus") / max(mean("free_gpus"), 1e-9),
+            "largest_p50": histogram_quantile(largest, 0.5),
+            "largest_p10": histogram_quantile(largest, 0.1),
+            "blocked_16": largest[: 2 * GPUS_PER_SERVER].sum() / total,
+        }
+    return pd.DataFrame.from_dict(rows, orient="index").rename_axis("group")
+
+
+def fragmentation_figures(series_by_group: dict) -> list:
+    """Returns the figure specs of the cluster's free servers and scattered
+    GPUs over time and of the time-weighted CDF of the largest job per
+    group.
+
+    Args:
+        series_by_group: Fragmentation series keyed by group; the one keyed
+                         'cluster', if any, is drawn over time.
+    """
+    specs = []
+    cluster = series_by_group.get("cluster")
+    if cluster is not None:
+        days = (cluster["minute"] - cluster["minute"][0]) / (24 * 60)
+        specs.append(
+            {
+                "name": "fragmentation_over_time",
+                "lines": [
+                    {
+                        "x": np.repeat(days, 2)[1:],
+                        "y": np.repeat(cluster[name] * scale, 2)[:-1],
+                        "label": label,
+                    }
+                    for name, scale, label in [
+                        ("free_servers", GPUS_PER_SERVER, "GPUs on free servers"),
+                        ("scattered_gpus", 1, "Scattered free GPUs"),
+                    ]
+                ],
+                "legend_loc": "upper right",
+                "xlabel": "Time (days)",
+                "ylabel": "GPUs",
+                "grid": True,
+            }
+        )
+    lines = []
+    for group, series in series_by_group.items():
+        counts = time_histogram(series, "largest_job")
+        if counts.sum() == 0:
+            continue
+        lines.append(
+            {
+                "x": np.arange(len(counts)),
+                "y": 100.0 * np.cumsum(counts) / counts.sum(),
+                "label": str(group),
+            }
+        )
+    if lines:
+        specs.append(
+            {
+                "name": "largest_job",
+                "lines": lines,
+                "legend_loc": "lower right",
+                "ylim": (0, 100),
+                "xlabel": "Largest placeable job (GPUs)",
+                "ylabel": "CDF",
+                "grid": True,
+            }
+        )
+    return specs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Summarize GPU fragmentation of the cluster over time."
+    )
+    parser.add_argument("--by-vc", action="store_true")
+    parser.add_argument("--out-dir", default="figures")
+    args = parser.parse_args()
+
+    from render import render_figures
+
+    table = load_job_table()
+    servers = machine_capacities(table)
+    capacity = servers["capacity"]
+    events = machine_events(table, capacity)
+    series_by_group = {"cluster": fragmentation_series(events, capacity)}
+    if args.by_vc:
+        series_by_group.update(vc_series(table, events, capacity))
+    print(fragmentation_summary(series_by_group).to_string())
+    render_figures(fragmentation_figures(series_by_group), args.out_dir)
+
+
+if __name__ == "__main__":
+    main()
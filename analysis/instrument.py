@@ -0,0 +1,179 @@
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+# Setting PHILLY_PROFILE=1 enables instrumentation, PHILLY_PROFILE=time
+# enables it without memory tracing.
+PROFILE_ENV = "PHILLY_PROFILE"
+REPORT_PATH = "profile_report.json"
+
+_enabled = False
+_trace_memory = False
+_records = []
+_stack = []
+_started = None
+
+
+class _NullStage:
+    """The stage returned while instrumentation is disabled; does nothing."""
+
+    def set_items(self, items):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    """Measures wall time, CPU time and peak traced memory of one stage."""
+
+    def __init__(self, name, items=None):
+        self.name = name
+        self.items = items
+        self._peak = 0
+
+    def set_items(self, items):
+        """Records the number of items processed, for the throughput."""
+        self.items = items
+
+    def __enter__(self):
+        if _trace_memory:
+            # Resetting the peak would lose the enclosing stage's peak so
+            # far, so it is saved first.
+            if _stack:
+                parent = _stack[-1]
+                parent._peak = max(parent._peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self._start_memory = tracemalloc.get_traced_memory()[0]
+        _stack.append(self)
+        self._start_cpu = time.process_time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self._start
+        cpu_seconds = time.process_time() - self._start_cpu
+        _stack.pop()
+        record = {
+            "stage": self.name,
+            "parent": _stack[-1].name if _stack else None,
+            "seconds": seconds,
+            "cpu_seconds": cpu_seconds,
+            "items": self.items,
+            "items_per_second": (
+                self.items / seconds if self.items is not None and seconds > 0 else None
+            ),
+        }
+        if _trace_memory:
+            self._peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+            record["peak_memory_mb"] = (self._peak - self._start_memory) / 2**20
+            if _stack:
+                parent = _stack[-1]
+                parent._peak = max(parent._peak, self._peak)
+        _records.append(record)
+        return False
+
+
+def enable(trace_memory: bool = True):
+    """Turns instrumentation on for the rest of the process.
+
+    Args:
+        trace_memory: If True, also records the peak memory allocated by
+                      Python within each stage using tracemalloc, which slows
+                      allocation-heavy code down noticeably.
+    """
+    global _enabled, _trace_memory, _started
+    _enabled = True
+    _trace_memory = trace_memory
+    _started = time.time()
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def stage(name: str, items: int = None):
+    """Returns a context manager that measures the enclosed code as a stage.
+
+    While instrumentation is disabled this returns a shared no-op object, so
+    instrumented code pays for one function call per stage.
+
+    Example:
+        with stage("filter") as s:
+            jobs = filter_jobs(jobs)
+            s.set_items(len(jobs))
+    """
+    if not _enabled:
+        return _NULL_STAGE
+    return _Stage(name, items)
+
+
+def timed(name: str = None, items=None):
+    """Decorates a function so that each call is measured as a stage.
+
+    Args:
+        name: The stage name, the function's name if None.
+        items: An optional callable mapping the function's return value to
+               the number of items processed, e.g. len.
+    """
+
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Stage(stage_name) as s:
+                result = func(*args, **kwargs)
+                if items is not None:
+                    s.set_items(items(result))
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def report() -> dict:
+    """Returns the measurements recorded so far."""
+    return {
+        "started": (
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(_started))
+            if _started is not None
+            else None
+        ),
+        "argv": sys.argv,
+        "trace_memory": _trace_memory,
+        "stages": list(_records),
+    }
+
+
+def write_report(path: str = REPORT_PATH):
+    """Writes the measurements as JSON if instrumentation is enabled."""
+    if not _enabled:
+        return
+    with open(path, "w") as f:
+        json.dump(report(), f, indent=4)
+    for r in _records:
+        line = f"{r['stage']}: {r['seconds']:.3f} s"
+        if "peak_memory_mb" in r:
+            line += f", {r['peak_memory_mb']:.1f} MB peak"
+        if r["items_per_second"] is not None:
+            line += f", {r['items_per_second']:.0f} items/s"
+        print(line)
+
+
+if os.environ.get(PROFILE_ENV, "") not in ["", "0"]:
+    enable(trace_memory=os.environ[PROFILE_ENV] != "time")
@@ -0,0 +1,309 @@
+import contextlib
+import gzip
+import importlib.util
+import json
+
+import numpy as np
+
+from timeindex import local_seconds
+
+DATE_FORMAT_STR = "%Y-%m-%d %H:%M:%S"
+JSONL_PATH = "jobs.jsonl.gz"
+PARQUET_PATH = "jobs.parquet"
+PARQUET_BATCH_SIZE = 8192
+SCALAR_COLUMNS = ["id", "num_gpus", "runtime", "submitted_time"]
+TIME_COLUMNS = ["submitted_time"]
+
+# The JSON Lines export keeps the trace's naive local date strings, and the
+# Parquet export stores the same times as UTC timestamps. Both loaders
+# return UTC POSIX seconds, the convention of the job table and utilization
+# cube (see timeindex).
+
+
+def to_seconds(date_str: str) -> int:
+    """Converts a trace date string, a naive local time, to UTC POSIX seconds
+    (see timeindex.local_seconds)."""
+    return int(local_seconds([date_str])[0])
+
+
+def job_record(job) -> dict:
+    """Returns the exported record of a filtered Job."""
+    return {
+        "id": job.jobid,
+        "num_gpus": job.num_gpus,
+        "runtime": int(job.run_time * 60),  # from minutes to seconds
+        "attempts": [
+            {
+                "start_time": a["start_time"].strftime(DATE_FORMAT_STR),
+                "end_time": a["end_time"].strftime(DATE_FORMAT_STR),
+            }
+            for a in job.attempts
+        ],
+        "submitted_time": job.submitted_time.strftime(DATE_FORMAT_STR),
+    }
+
+
+def _batches(jobs, batch_size: int):
+    """Yields lists of up to batch_size jobs."""
+    batch = []
+    for job in jobs:
+        batch.append(job)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+@contextlib.contextmanager
+def _jsonl_sink(path: str):
+    with gzip.open(path, "wt") as f:
+
+        def write(jobs):
+            for job in jobs:
+                f.write(json.dumps(job_record(job)))
+                f.write("\n")
+
+        yield write
+
+
+def _parquet_schema():
+    import pyarrow as pa
+
+    ts = pa.timestamp("s", tz="UTC")
+    attempt = pa.struct([("start_time", ts), ("end_time", ts)])
+    return pa.schema(
+        [
+            ("id", pa.string()),
+            ("num_gpus", pa.int32()),
+            ("runtime", pa.int64()),
+            ("attempts", pa.list_(attempt)),
+            ("submitted_time", ts),
+        ]
+    )
+
+
+def _parquet_batch(jobs: list, schema):
+    """Returns the record batch of jobs, with the local times of all of them
+    converted to UTC in one call."""
+    import pyarrow as pa
+
+    times = [job.submitted_time for job in jobs]
+    for job in jobs:
+        for a in job.attempts:
+            times.extend([a["start_time"], a["end_time"]])
+    seconds = local_seconds(times).astype(np.int64).tolist()
+    attempts, pos = [], len(jobs)
+    for job in jobs:
+        attempts.append(
+            [
+                {
+                    "start_time": seconds[pos + 2 * i],
+                    "end_time": seconds[pos + 2 * i + 1],
+                }
+                for i in range(len(job.attempts))
+            ]
+        )
+        pos += 2 * len(job.attempts)
+    return pa.RecordBatch.from_pydict(
+        {
+            "id": [job.jobid for job in jobs],
+            "num_gpus": [job.num_gpus for job in jobs],
+            "runtime": [int(job.run_time * 60) for job in jobs],
+            "attempts": attempts,
+            "submitted_time": seconds[: len(jobs)],
+        },
+        schema=schema,
+    )
+
+
+@contextlib.contextmanager
+def _parquet_sink(path: str):
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema()
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        yield lambda jobs: writer.write_batch(_parquet_batch(jobs, schema))
+
+
+def _write_batches(jobs, sinks: list, batch_size: int) -> int:
+    """Writes jobs to every sink one batch at a time, so only one batch of
+    jobs is held in memory and jobs may be a generator over a trace that
+    does not fit in memory.
+
+    Returns:
+        The number of jobs written.
+    """
+    num_jobs = 0
+    with contextlib.ExitStack() as stack:
+        writers = [stack.enter_context(sink) for sink in sinks]
+        for batch in _batches(jobs, batch_size):
+            for write in writers:
+                write(batch)
+            num_jobs += len(batch)
+    return num_jobs
+
+
+def write_jobs_jsonl(
+    jobs, path: str = JSONL_PATH, batch_size: int = PARQUET_BATCH_SIZE
+) -> int:
+    """Streams jobs to a gzip-compressed JSON Lines file.
+
+    Args:
+        jobs: An iterable of filtered Jobs.
+        path: The output path.
+        batch_size: The number of jobs held in memory at a time.
+
+    Returns:
+        The number of jobs written.
+    """
+    return _write_batches(jobs, [_jsonl_sink(path)], batch_size)
+
+
+def write_jobs_parquet(
+    jobs, path: str = PARQUET_PATH, batch_size: int = PARQUET_BATCH_SIZE
+) -> int:
+    """Streams jobs to a Parquet file in record batches.
+
+    Times are stored as second-resolution UTC timestamps.
+
+    Args:
+        jobs: An iterable of filtered Jobs.
+        path: The output path.
+        batch_size: The number of jobs per record batch.
+
+    Returns:
+        The number of jobs written.
+    """
+    return _write_batches(jobs, [_parquet_sink(path)], batch_size)
+
+
+def export_jobs(
+    jobs,
+    jsonl_path: str = JSONL_PATH,
+    parquet_path: str = PARQUET_PATH,
+    batch_size: int = PARQUET_BATCH_SIZE,
+) -> int:
+    """Streams filtered jobs to JSON Lines and Parquet in a single pass.
+
+    pyarrow is optional: without it only the JSON Lines file is written.
+
+    Returns:
+        The number of jobs written.
+    """
+    sinks = [_jsonl_sink(jsonl_path)]
+    if importlib.util.find_spec("pyarrow") is None:
+        print(f"pyarrow is not installed, not writing {parquet_path}")
+    else:
+        sinks.append(_parquet_sink(parquet_path))
+    return _write_batches(jobs, sinks, batch_size)
+
+
+def iter_jobs_jsonl(path: str = JSONL_PATH):
+    """Yields the raw job records of a JSON Lines export one at a time."""
+    with gzip.open(path, "rt") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def _project(record: dict, columns) -> dict:
+    if columns is None:
+        return record
+    return {c: record[c] for c in columns}
+
+
+def _records_times_to_seconds(records: list) -> list:
+    """Converts the date strings of records to UTC seconds in one call."""
+    fields = []
+    for record in records:
+        if "submitted_time" in record:
+            fields.append((record, "submitted_time"))
+        for a in record.get("attempts", []):
+            fields.extend([(a, "start_time"), (a, "end_time")])
+    seconds = local_seconds([obj[key] for obj, key in fields])
+    for (obj, key), value in zip(fields, seconds.astype(np.int64).tolist()):
+        obj[key] = value
+    return records
+
+
+def _read_parquet(path: str, columns):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(path, columns=columns)
+    # Parquet stores second timestamps with millisecond resolution. They are
+    # cast back to seconds and then to integers before leaving Arrow, which
+    # avoids creating a datetime object per value.
+    for ts_type in (pa.timestamp("s"), pa.int64()):
+        schema = pa.schema(
+            [
+                pa.field(f.name, _replace_timestamps(f.type, ts_type, pa))
+                for f in table.schema
+            ]
+        )
+        table = table.cast(schema)
+    return table
+
+
+def _replace_timestamps(t, ts_type, pa):
+    if pa.types.is_timestamp(t):
+        return ts_type
+    if pa.types.is_list(t):
+        return pa.list_(_replace_timestamps(t.value_type, ts_type, pa))
+    if pa.types.is_struct(t):
+        return pa.struct(
+            [(f.name, _replace_timestamps(f.type, ts_type, pa)) for f in t]
+        )
+    return t
+
+
+def load_jobs(path: str = PARQUET_PATH, columns: list = None) -> list:
+    """Loads exported jobs as a list of dicts.
+
+    All times, including attempt start and end times, are returned as UTC
+    POSIX seconds (see to_seconds).
+
+    Args:
+        path: A Parquet or JSON Lines export.
+        columns: The keys to load, all keys if None. For Parquet exports,
+                 only these columns are read from disk.
+
+    Returns:
+        A list of job dicts.
+    """
+    if path.endswith(".parquet"):
+        return _read_parquet(path, columns).to_pylist()
+    return _records_times_to_seconds(
+        [_project(record, columns) for record in iter_jobs_jsonl(path)]
+    )
+
+
+def load_job_columns(path: str = PARQUET_PATH, columns: list = None) -> dict:
+    """Loads scalar job columns as numpy arrays.
+
+    Args:
+        path: A Parquet or JSON Lines export.
+        columns: A subset of SCALAR_COLUMNS, all of them if None.
+
+    Returns:
+        A dict mapping each column name to a numpy array. Times are float UTC
+        POSIX seconds.
+    """
+    if columns is None:
+        columns = SCALAR_COLUMNS
+    if path.endswith(".parquet"):
+        table = _read_parquet(path, columns)
+        data = {c: table.column(c).to_numpy() for c in columns}
+    else:
+        values = {c: [] for c in columns}
+        for record in iter_jobs_jsonl(path):
+            for c in columns:
+                values[c].append(record[c])
+        data = {c: np.array(v) for c, v in values.items()}
+        for c in TIME_COLUMNS:
+            if c in data:
+                data[c] = local_seconds(data[c])
+    for c in TIME_COLUMNS:
+        if c in data:
+            data[c] = data[c].astype(np.float64)
+    return data
@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import tempfile
+
+import numpy as np
+
+import trace_analysis_mw
+from trace_archive import CACHE_DIR, READ_SIZE, load_archive_index, open_member
+
+JOB_INDEX_PATH = os.path.join(CACHE_DIR, "job_index.npz")
+EXTRACTED_LOG_PATH = os.path.join(CACHE_DIR, "cluster_job_log")
+# Bumped when the index's columns change.
+FORMAT_VERSION = 1
+
+# A job index locates every job of cluster_job_log by its bytes, so single
+# jobs or subsets are parsed without reading the rest of the 6.6 GB log. It
+# is a flat dict of numpy arrays with one row per job, in log order:
+#     'offset', 'length': The job's JSON object is bytes
+#                         offset:offset + length of the log.
+#     'jobid': The job ids, '' for objects without one.
+#     'by_jobid': The rows in order of jobid, so ids are looked up with a
+#                 binary search (see find_jobs) that takes many ids at once.
+# Offsets are those of the uncompressed log, whether it is extracted to
+# LOGDIR or read from the archive.
+#
+# Reading at an offset of the archive needs its seek index, which only
+# exists with the optional indexed_gzip package (see
+# trace_archive.build_archive_index); without it every read would inflate
+# the log from its start. If the trace is not extracted and the archive has
+# no seek index, the log is therefore extracted once to EXTRACTED_LOG_PATH
+# (6.6 GB for the full trace) and read from there.
+
+_OPEN_BRACE, _CLOSE_BRACE = ord("{"), ord("}")
+_QUOTE, _BACKSLASH = ord('"'), ord("\\")
+_JOBID = re.compile(rb'"jobid"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def _extracted_log() -> str:
+    """Returns EXTRACTED_LOG_PATH, extracting the log from the archive first
+    if it is missing or was extracted from another archive."""
+    stamp_path = EXTRACTED_LOG_PATH + ".json"
+    fingerprint = trace_analysis_mw.trace_fingerprint()
+    if os.path.exists(EXTRACTED_LOG_PATH) and os.path.exists(stamp_path):
+        with open(stamp_path, "r") as f:
+            if json.load(f) == fingerprint:
+                return EXTRACTED_LOG_PATH
+    print(f"extracting cluster_job_log to {EXTRACTED_LOG_PATH}")
+    directory = os.path.dirname(EXTRACTED_LOG_PATH) or "."
+    os.makedirs(directory, exist_ok=True)
+    with open_member(
+        "cluster_job_log", trace_analysis_mw.ARCHIVE_PATH
+    ) as src, tempfile.NamedTemporaryFile(dir=directory, delete=False) as dst:
+        shutil.copyfileobj(src, dst, READ_SIZE)
+    os.replace(dst.name, EXTRACTED_LOG_PATH)
+    with open(stamp_path, "w") as f:
+        json.dump(fingerprint, f)
+    return EXTRACTED_LOG_PATH
+
+
+def _open_log(offset: int = 0):
+    """Opens cluster_job_log in binary mode at a byte offset."""
+    path = os.path.join(trace_analysis_mw.LOGDIR, "cluster_job_log")
+    if not os.path.exists(path):
+        index = load_archive_index(trace_analysis_mw.ARCHIVE_PATH)
+        if index is not None and index["seek_index"] is not None:
+            return open_member(
+                "cluster_job_log", trace_analysis_mw.ARCHIVE_PATH, offset=offset
+            )
+        path = _extracted_log()
+    f = open(path, "rb")
+    f.seek(offset)
+    return f
+
+
+def _object_spans(data: bytes) -> tuple:
+    """Finds the top-level JSON objects in a buffer that starts outside of
+    any object.
+
+    Braces inside strings are told apart by the parity of the unescaped
+    quotes before them, all with array operations except for a pass over the
+    backslashes, which are rare in the log.
+
+    Returns:
+        The start and end (exclusive) of every complete object, and the start
+        of the object that is cut off at the end of data, or None.
+    """
+    chars = np.frombuffer(data, dtype=np.uint8)
+    escaped = np.zeros(len(chars) + 1, dtype=bool)
+    for pos in np.flatnonzero(chars == _BACKSLASH):
+        if not escaped[pos]:
+            escaped[pos + 1] = True
+    quotes = (chars == _QUOTE) & ~escaped[:-1]
+    outside = np.cumsum(quotes) % 2 == 0
+    step = np.zeros(len(chars), dtype=np.int64)
+    step[(chars == _OPEN_BRACE) & outside] = 1
+    step[(chars == _CLOSE_BRACE) & outside] = -1
+    depth = np.cumsum(step)
+    starts = np.flatnonzero((step == 1) & (depth == 1))
+    ends = np.flatnonzero((step == -1) & (depth == 0)) + 1
+    cut = int(starts[len(ends)]) if len(starts) > len(ends) else None
+    return starts[: len(ends)], ends, cut
+
+
+def build_job_index(read_size: int = READ_SIZE) -> dict:
+    """Builds the job index (see above) in one pass over cluster_job_log.
+
+    Only the unfinished object at the end of each block is carried over to
+    the next.
+    """
+    offsets, lengths, jobids = [], [], []
+    base, buffer = 0, b""
+    with _open_log() as f:
+        while True:
+            block = f.read(read_size)
+            buffer += block
+            starts, ends, cut = _object_spans(buffer)
+            done = len(buffer) if cut is None else cut
+            ids = np.full(len(starts), "", dtype=object)
+            for match in _JOBID.finditer(buffer, 0, done):
+                row = np.searchsorted(starts, match.start(), side="right") - 1
+                if row >= 0 and match.end() <= ends[row] and not ids[row]:
+                    ids[row] = json.loads(b'"' + match.group(1) + b'"')
+            offsets.append(base + starts)
+            lengths.append(ends - starts)
+            jobids.append(ids)
+            if not block:
+                break
+            base += done
+            buffer = buffer[done:]
+    jobid = np.concatenate(jobids).astype(str)
+    return {
+        "offset": np.concatenate(offsets).astype(np.int64),
+        "length": np.concatenate(lengths).astype(np.int64),
+        "jobid": jobid,
+        "by_jobid": np.argsort(jobid, kind="stable"),
+    }
+
+
+def load_job_index(path: str = JOB_INDEX_PATH) -> dict:
+    """Returns the job index of the trace, building and caching it once.
+
+    The cache is rebuilt if the trace's cluster_job_log changed.
+    """
+    fingerprint = {**trace_analysis_mw.trace_fingerprint(), "version": FORMAT_VERSION}
+    if os.path.exists(path):
+        with np.load(path) as f:
+            if json.loads(str(f["fingerprint"])) == fingerprint:
+                return {k: f[k] for k in f.files if k != "fingerprint"}
+    index = build_job_index()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    np.savez(path, fingerprint=json.dumps(fingerprint), **index)
+    return index
+
+
+def find_jobs(index: dict, jobids) -> np.ndarray:
+    """Returns the rows of job ids in a job index.
+
+    Raises:
+        KeyError: If a job id is not in the log.
+    """
+    jobids = np.asarray(jobids, dtype=str)
+    sorted_ids = index["jobid"][index["by_jobid"]]
+    pos = np.minimum(np.searchsorted(sorted_ids, jobids), len(sorted_ids) - 1)
+    missing = sorted_ids[pos] != jobids
+    if missing.any():
+        raise KeyError(f"jobs not in cluster_job_log: {list(jobids[missing])}")
+    return index["by_jobid"][pos]
+
+
+def read_spans(index: dict, rows) -> list:
+    """Returns the raw bytes of rows of a job index, in the order given.
+
+    The rows are read in log order, seeking past the jobs in between when
+    the log is a file and skipping over them when it is read from an
+    indexed archive.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    spans = [None] * len(rows)
+    if len(rows) == 0:
+        return spans
+    order = np.argsort(index["offset"][rows], kind="stable")
+    offsets = index["offset"][rows][order]
+    lengths = index["length"][rows][order]
+    with _open_log(int(offsets[0])) as f:
+        pos = int(offsets[0])
+        for i, offset, length in zip(order, offsets, lengths):
+            offset, length = int(offset), int(length)
+            if f.seekable():
+                f.seek(offset)
+            else:
+                while pos < offset:
+                    pos += len(f.read(min(offset - pos, READ_SIZE)))
+            spans[i] = f.read(length)
+            pos = offset + length
+    return spans
+
+
+def load_jobs(jobids, index: dict = None) -> list:
+    """Parses jobs of cluster_job_log by id, in the order given.
+
+    Args:
+        jobids: The job ids.
+        index: The job index, that of the trace if None.
+
+    Returns:
+        A list of Jobs.
+    """
+    if index is None:
+        index = load_job_index()
+    return [
+        trace_analysis_mw.Job(**json.loads(span))
+        for span in read_spans(index, find_jobs(index, jobids))
+    ]
+
+
+def write_subtrace(index: dict, rows, path: str):
+    """Writes jobs of cluster_job_log to a smaller log, in log order.
+
+    The jobs' bytes are copied unchanged, so the sub-trace parses to the same
+    jobs.
+    """
+    rows = np.sort(np.asarray(rows, dtype=np.int64))
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "wb") as out:
+        out.write(b"[\n")
+        out.write(b",\n".join(read_spans(index, rows)))
+        out.write(b"\n]\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Prints jobs of the trace by id or cuts a sub-trace."
+    )
+    parser.add_argument("jobids", nargs="*", help="jobs to print or cut")
+    parser.add_argument(
+        "--sample", type=int, help="cut this many random jobs instead of jobids"
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="write the jobs as a cluster_job_log here")
+    args = parser.parse_args()
+
+    index = load_job_index()
+    print(f"{len(index['offset'])} jobs indexed")
+    if args.sample is not None:
+        rng = np.random.default_rng(args.seed)
+        rows = rng.choice(len(index["offset"]), args.sample, replace=False)
+    else:
+        rows = find_jobs(index, args.jobids)
+    if args.out is not None:
+        write_subtrace(index, rows, args.out)
+        print(f"wrote {len(rows)} jobs to {args.out}")
+        return
+    for span in read_spans(index, rows):
+        print(json.dumps(json.loads(span), indent=4))
+
+
+if __name__ == "__main__":
+    main()
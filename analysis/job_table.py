@@ -0,0 +1,263 @@
+import json
+import os
+
+import numpy as np
+
+import trace_analysis_mw
+from timeindex import local_seconds
+from trace_archive import CACHE_DIR
+
+JOB_TABLE_PATH = os.path.join(CACHE_DIR, "job_table.npz")
+NUM_BUCKETS = 4
+# Bumped when the table's columns or time convention change.
+FORMAT_VERSION = 2
+
+# A job table is a flat dict of numpy arrays describing jobs, their attempts
+# and the servers of each attempt, with no Python objects in it, so that it
+# can be saved with np.savez, shared between processes and processed with
+# vectorized operations.
+#
+# Per job (n rows):
+#     'jobid': The job ids.
+#     'vc', 'user', 'status': Codes into 'vcs', 'users' and 'statuses'.
+#     'submitted_time': POSIX seconds, NaN if missing.
+#     'num_gpus': The number of GPUs of the first attempt, 0 if unknown.
+#     'attempt_offsets': The attempts of job i are rows
+#                        attempt_offsets[i]:attempt_offsets[i + 1].
+# Per attempt (m rows):
+#     'attempt_job': The job row.
+#     'attempt_index': The position of the attempt within its job.
+#     'attempt_start', 'attempt_end': POSIX seconds, NaN if missing.
+#     'attempt_num_servers', 'attempt_num_gpus': The attempt's placement.
+#     'attempt_detail_offsets': The servers of attempt j are rows
+#                               attempt_detail_offsets[j]:[j + 1].
+# Per server of an attempt (k rows):
+#     'detail_attempt': The attempt row.
+#     'detail_machine': A code into 'machines'.
+#     'detail_num_gpus': The number of GPUs used on the server.
+#     'detail_gpu_mask': Bit g is set if GPU g is used.
+#
+# Trace times are naive local times; they are converted to UTC with
+# timeindex.local_seconds, which puts them on the same monotonic minute
+# index as the utilization data.
+
+JOB_COLUMNS = ["jobid", "vc", "user", "status", "submitted_time", "num_gpus"]
+ATTEMPT_COLUMNS = [
+    "attempt_index",
+    "attempt_start",
+    "attempt_end",
+    "attempt_num_servers",
+    "attempt_num_gpus",
+]
+DETAIL_COLUMNS = ["detail_machine", "detail_num_gpus", "detail_gpu_mask"]
+VOCABS = ["vcs", "users", "statuses", "machines"]
+
+
+def _offsets(counts: list) -> np.ndarray:
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+def build_job_table(jobs) -> dict:
+    """Flattens a list of Jobs into a job table (see above)."""
+    vocabs = {"vcs": {}, "users": {}, "statuses": {}, "machines": {}}
+
+    def code(vocab, name):
+        return vocabs[vocab].setdefault(name, len(vocabs[vocab]))
+
+    cols = {
+        name: []
+        for name in [
+            "jobid",
+            "vc",
+            "user",
+            "status",
+            "submitted_time",
+            "num_gpus",
+            "num_attempts",
+            "attempt_job",
+            "attempt_index",
+            "attempt_start",
+            "attempt_end",
+            "attempt_num_servers",
+            "attempt_num_gpus",
+            "detail_attempt",
+            "detail_machine",
+            "detail_num_gpus",
+            "detail_gpu_mask",
+        ]
+    }
+    for row, job in enumerate(jobs):
+        cols["jobid"].append(job.jobid)
+        cols["vc"].append(code("vcs", job.vc))
+        cols["user"].append(code("users", job.user))
+        cols["status"].append(code("statuses", job.status))
+        cols["submitted_time"].append(job.submitted_time)
+        cols["num_gpus"].append(job.num_gpus or 0)
+        cols["num_attempts"].append(len(job.attempts))
+        for index, attempt in enumerate(job.attempts):
+            attempt_row = len(cols["attempt_job"])
+            cols["attempt_job"].append(row)
+            cols["attempt_index"].append(index)
+            cols["attempt_start"].append(attempt["start_time"])
+            cols["attempt_end"].append(attempt["end_time"])
+            cols["attempt_num_servers"].append(len(attempt["detail"]))
+            num_gpus = 0
+            for detail in attempt["detail"]:
+                gpus = [int(gpu_id[3:]) for gpu_id in detail["gpus"]]
+                mask = 0
+                for g in gpus:
+                    mask |= 1 << g
+                cols["detail_attempt"].append(attempt_row)
+                cols["detail_machine"].append(code("machines", detail["ip"]))
+                cols["detail_num_gpus"].append(len(gpus))
+                cols["detail_gpu_mask"].append(mask)
+                num_gpus += len(gpus)
+            cols["attempt_num_gpus"].append(num_gpus)
+
+    table = {
+        "jobid": np.array(cols["jobid"], dtype=str),
+        "vc": np.array(cols["vc"], dtype=np.int16),
+        "user": np.array(cols["user"], dtype=np.int32),
+        "status": np.array(cols["status"], dtype=np.int8),
+        "submitted_time": local_seconds(cols["submitted_time"]),
+        "num_gpus": np.array(cols["num_gpus"], dtype=np.int32),
+        "attempt_offsets": _offsets(cols["num_attempts"]),
+        "attempt_job": np.array(cols["attempt_job"], dtype=np.int64),
+        "attempt_index": np.array(cols["attempt_index"], dtype=np.int32),
+        "attempt_start": local_seconds(cols["attempt_start"]),
+        "attempt_end": local_seconds(cols["attempt_end"]),
+        "attempt_num_servers": np.array(cols["attempt_num_servers"], dtype=np.int32),
+        "attempt_num_gpus": np.array(cols["attempt_num_gpus"], dtype=np.int32),
+        "attempt_detail_offsets": _offsets(cols["attempt_num_servers"]),
+        "detail_attempt": np.array(cols["detail_attempt"], dtype=np.int64),
+        "detail_machine": np.array(cols["detail_machine"], dtype=np.int32),
+        "detail_num_gpus": np.array(cols["detail_num_gpus"], dtype=np.int8),
+        "detail_gpu_mask": np.array(cols["detail_gpu_mask"], dtype=np.uint16),
+    }
+    for vocab, codes in vocabs.items():
+        table[vocab] = np.array(list(codes), dtype=str)
+    return table
+
+
+def _ranges(offsets: np.ndarray, rows: np.ndarray) -> tuple:
+    """Returns the concatenated ranges offsets[r]:offsets[r + 1] of the rows,
+    and the length of each."""
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    before = np.cumsum(lengths) - lengths
+    index = np.arange(lengths.sum()) - np.repeat(before - starts, lengths)
+    return index, lengths
+
+
+def table_subset(table: dict, jobs) -> dict:
+    """Returns the job table of a subset of the jobs of a table.
+
+    The subset keeps the vocabularies, so codes mean the same in both.
+
+    Args:
+        table: A job table.
+        jobs: A boolean mask or sorted row indices of the jobs to keep.
+    """
+    jobs = np.asarray(jobs)
+    if jobs.dtype == bool:
+        jobs = np.flatnonzero(jobs)
+    attempts, num_attempts = _ranges(table["attempt_offsets"], jobs)
+    details, num_details = _ranges(table["attempt_detail_offsets"], attempts)
+    subset = {name: table[name][jobs] for name in JOB_COLUMNS}
+    subset.update({name: table[name][attempts] for name in ATTEMPT_COLUMNS})
+    subset.update({name: table[name][details] for name in DETAIL_COLUMNS})
+    subset.update({name: table[name] for name in VOCABS})
+    subset["attempt_offsets"] = _offsets(num_attempts)
+    subset["attempt_job"] = np.repeat(np.arange(len(jobs)), num_attempts)
+    subset["attempt_detail_offsets"] = _offsets(num_details)
+    subset["detail_attempt"] = np.repeat(np.arange(len(attempts)), num_details)
+    return subset
+
+
+def save_job_table(table: dict, path: str = JOB_TABLE_PATH, fingerprint=None):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    np.savez(path, fingerprint=json.dumps(fingerprint), **table)
+
+
+def load_job_table(path: str = JOB_TABLE_PATH) -> dict:
+    """Returns the job table of the full trace, building and caching it once.
+
+    The cache is rebuilt if the trace's cluster_job_log changed.
+    """
+    fingerprint = {**trace_analysis_mw.trace_fingerprint(), "version": FORMAT_VERSION}
+    if os.path.exists(path):
+        with np.load(path) as f:
+            if json.loads(str(f["fingerprint"])) == fingerprint:
+                return {k: f[k] for k in f.files if k != "fingerprint"}
+    table = build_job_table(trace_analysis_mw.load_cluster_log())
+    save_job_table(table, path, fingerprint)
+    return table
+
+
+def gpu_buckets(num_gpus: np.ndarray) -> np.ndarray:
+    """Vectorized get_bucket_from_num_gpus, with -1 for unknown GPU counts."""
+    return np.select(
+        [
+            num_gpus == 1,
+            (num_gpus >= 2) & (num_gpus <= 4),
+            (num_gpus >= 5) & (num_gpus <= 8),
+            num_gpus > 8,
+        ],
+        [0, 1, 2, 3],
+        -1,
+    ).astype(np.int8)
+
+
+def attempt_queueing_delays(table: dict) -> np.ndarray:
+    """Returns the queueing delay of every attempt in minutes.
+
+    The first attempt of a job queues from the job's submission, every later
+    attempt from the end of the attempt before it. Delays are NaN if either
+    time is missing.
+    """
+    first = table["attempt_index"] == 0
+    previous_end = np.empty_like(table["attempt_end"])
+    previous_end[:1] = np.nan
+    previous_end[1:] = table["attempt_end"][:-1]
+    queued = np.where(
+        first, table["submitted_time"][table["attempt_job"]], previous_end
+    )
+    return (table["attempt_start"] - queued) / 60
+
+
+def sorted_groups(values: np.ndarray, groups: np.ndarray, num_groups: int) -> list:
+    """Splits values by group in one sort.
+
+    Returns:
+        A list with, for each group in range(num_groups), the sorted values
+        of that group.
+    """
+    order = np.lexsort((values, groups))
+    bounds = np.searchsorted(groups[order], np.arange(num_groups + 1))
+    values = values[order]
+    return [values[bounds[g] : bounds[g + 1]] for g in range(num_groups)]
+
+
+def queueing_delays_by_group(table: dict) -> dict:
+    """Groups the queueing delays of all attempts by VC and GPU bucket.
+
+    The bucket is that of the attempt's job, and attempts of jobs without
+    GPUs or with unknown delays are left out.
+
+    Returns:
+        A dict mapping (VC code, bucket) to the sorted delays in minutes, for
+        every non-empty group.
+    """
+    delays = attempt_queueing_delays(table)
+    job = table["attempt_job"]
+    bucket = gpu_buckets(table["num_gpus"])[job]
+    keep = (bucket >= 0) & ~np.isnan(delays)
+    group = table["vc"][job][keep].astype(np.int64) * NUM_BUCKETS + bucket[keep]
+    split = sorted_groups(delays[keep], group, len(table["vcs"]) * NUM_BUCKETS)
+    return {
+        divmod(g, NUM_BUCKETS): values
+        for g, values in enumerate(split)
+        if len(values) > 0
+    }
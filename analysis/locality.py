@@ -0,0 +1,228 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from job_table import NUM_BUCKETS, attempt_queueing_delays, gpu_buckets, load_job_table
+
+# Queueing delays are binned at DELAY_BINS_PER_DECADE log-spaced bins between
+# MIN_DELAY and MAX_DELAY minutes, plus an underflow bin (which holds the
+# attempts that started right away) and an overflow bin.
+MIN_DELAY = 10**-1
+MAX_DELAY = 10**4
+DELAY_BINS_PER_DECADE = 4
+# Server counts are binned exactly, with every count >= MAX_SERVERS in the
+# last bin.
+MAX_SERVERS = 32
+MIN_GPUS = 5
+
+
+def delay_edges() -> np.ndarray:
+    decades = int(round(np.log10(MAX_DELAY / MIN_DELAY)))
+    return np.logspace(
+        np.log10(MIN_DELAY),
+        np.log10(MAX_DELAY),
+        decades * DELAY_BINS_PER_DECADE + 1,
+    )
+
+
+def attempt_locality(table: dict) -> dict:
+    """Computes the placement and queueing delay of every attempt.
+
+    Args:
+        table: A job table (see job_table).
+
+    Returns:
+        A dict of arrays with one row per attempt:
+            'vc': The VC code of the attempt's job.
+            'bucket': The GPU bucket of the attempt, -1 if it has no GPUs.
+            'num_gpus': The number of GPUs of the attempt.
+            'num_servers': The number of servers the attempt ran on.
+            'min_gpus_per_server', 'max_gpus_per_server': The fewest and most
+                                                           GPUs used on one
+                                                           of its servers.
+            'spread': max_gpus_per_server - min_gpus_per_server, 0 for
+                      evenly spread attempts.
+            'queueing_delay': The queueing delay in minutes, NaN if unknown.
+    """
+    num_servers = table["attempt_num_servers"]
+    min_gpus = np.zeros(len(num_servers), dtype=np.int8)
+    max_gpus = np.zeros(len(num_servers), dtype=np.int8)
+    # reduceat would return a neighbour's value for empty segments, so it only
+    # runs over the attempts with servers, whose segments tile the details.
+    placed = num_servers > 0
+    starts = table["attempt_detail_offsets"][:-1][placed]
+    if len(starts) > 0:
+        detail_gpus = table["detail_num_gpus"]
+        min_gpus[placed] = np.minimum.reduceat(detail_gpus, starts)
+        max_gpus[placed] = np.maximum.reduceat(detail_gpus, starts)
+    return {
+        "vc": table["vc"][table["attempt_job"]],
+        "bucket": gpu_buckets(table["attempt_num_gpus"]),
+        "num_gpus": table["attempt_num_gpus"],
+        "num_servers": num_servers,
+        "min_gpus_per_server": min_gpus,
+        "max_gpus_per_server": max_gpus,
+        "spread": max_gpus - min_gpus,
+        "queueing_delay": attempt_queueing_delays(table),
+    }
+
+
+def locality_histograms(
+    loc: dict, by_vc: bool = False, num_vcs: int = None, min_gpus: int = MIN_GPUS
+) -> dict:
+    """Counts attempts by queueing delay and number of servers.
+
+    All groups are counted with a single bincount over a flat bin index.
+
+    Args:
+        loc: The output of attempt_locality.
+        by_vc: If True, counts per VC and GPU bucket, else per GPU bucket.
+        num_vcs: The number of VCs, one more than the largest code if None.
+        min_gpus: Attempts with fewer GPUs are left out.
+
+    Returns:
+        A dict with:
+            'counts': An int64 array of shape (groups, delay bins, server
+                      bins), where group g is bucket g, or with by_vc VC
+                      g // NUM_BUCKETS and bucket g % NUM_BUCKETS.
+            'delay_edges': The inner edges of the delay bins in minutes.
+            'servers': The server count of each server bin.
+    """
+    edges = delay_edges()
+    delay = loc["queueing_delay"]
+    keep = (loc["num_gpus"] >= min_gpus) & (loc["bucket"] >= 0) & ~np.isnan(delay)
+    delay_bin = np.searchsorted(edges, delay[keep], side="right")
+    server_bin = np.clip(loc["num_servers"][keep], 1, MAX_SERVERS) - 1
+    group = loc["bucket"][keep].astype(np.int64)
+    num_groups = NUM_BUCKETS
+    if by_vc:
+        if num_vcs is None:
+            num_vcs = int(loc["vc"].max()) + 1 if len(loc["vc"]) > 0 else 0
+        group += loc["vc"][keep].astype(np.int64) * NUM_BUCKETS
+        num_groups *= num_vcs
+    shape = (num_groups, len(edges) + 1, MAX_SERVERS)
+    flat = np.ravel_multi_index((group, delay_bin, server_bin), shape)
+    counts = np.bincount(flat, minlength=np.prod(shape)).reshape(shape)
+    return {
+        "counts": counts,
+        "delay_edges": edges,
+        "servers": np.arange(1, MAX_SERVERS + 1),
+    }
+
+
+def locality_summary(loc: dict, vcs=None, min_gpus: int = MIN_GPUS) -> pd.DataFrame:
+    """Summarizes locality and queueing delay per VC and GPU bucket.
+
+    Args:
+        loc: The output of attempt_locality.
+        vcs: The VC names indexed by code, e.g. a job table's 'vcs'.
+        min_gpus: Attempts with fewer GPUs are left out.
+
+    Returns:
+        A DataFrame indexed by (vc, bucket) with the number of attempts, the
+        median and 90th percentile queueing delay, the mean number of
+        servers and the fractions of attempts that ran on a single server and
+        that were spread unevenly.
+    """
+    keep = (loc["num_gpus"] >= min_gpus) & (loc["bucket"] >= 0)
+    df = pd.DataFrame(
+        {
+            "vc": loc["vc"][keep],
+            "bucket": loc["bucket"][keep],
+            "queueing_delay": loc["queueing_delay"][keep],
+            "num_servers": loc["num_servers"][keep],
+            "single_server": loc["num_servers"][keep] == 1,
+            "uneven": loc["spread"][keep] > 0,
+        }
+    )
+    if vcs is not None:
+        df["vc"] = np.asarray(vcs)[df["vc"].to_numpy()]
+    grouped = df.groupby(["vc", "bucket"])
+    return pd.DataFrame(
+        {
+            "attempts": grouped.size(),
+            "delay_p50": grouped["queueing_delay"].median(),
+            "delay_p90": grouped["queueing_delay"].quantile(0.9),
+            "mean_servers": grouped["num_servers"].mean(),
+            "single_server": grouped["single_server"].mean(),
+            "uneven": grouped["uneven"].mean(),
+        }
+    )
+
+
+def _bucket_label(bucket: int) -> str:
+    return ["1", "2-4", "5-8", ">8"][bucket]
+
+
+def locality_figures(table: dict, by_vc: bool = False, min_gpus: int = MIN_GPUS):
+    """Returns heatmap figure specs of queueing delay vs. number of servers.
+
+    There is one heatmap per GPU bucket, or with by_vc, per VC and bucket,
+    leaving out empty ones.
+    """
+    hist = locality_histograms(
+        attempt_locality(table), by_vc, len(table["vcs"]), min_gpus
+    )
+    return histogram_figures(hist["counts"], table["vcs"] if by_vc else None)
+
+
+def histogram_figures(counts: np.ndarray, vcs=None) -> list:
+    """Returns the heatmap figure specs of locality_histograms counts.
+
+    Args:
+        counts: The 'counts' of locality_histograms.
+        vcs: The VC names indexed by code if the counts are per VC and
+             bucket, None if they are per bucket.
+    """
+    edges = delay_edges()
+    # The underflow and overflow bins are drawn one bin wide.
+    step = edges[1] / edges[0]
+    x = np.concatenate([[edges[0] / step], edges, [edges[-1] * step]])
+    y = np.arange(0.5, MAX_SERVERS + 1)
+    specs = []
+    for group, group_counts in enumerate(counts):
+        if group_counts.sum() == 0:
+            continue
+        bucket = group % NUM_BUCKETS
+        title = "%s GPU" % _bucket_label(bucket)
+        name = "locality_bucket_%d" % bucket
+        if vcs is not None:
+            vc = vcs[group // NUM_BUCKETS]
+            title = "VC %s, %s" % (vc, title)
+            name = "locality_vc_%s_bucket_%d" % (vc, bucket)
+        specs.append(
+            {
+                "name": name,
+                "lines": [],
+                "mesh": {"x": x, "y": y, "counts": group_counts.T},
+                "title": title,
+                "xscale": "log",
+                "xlim": (x[0], x[-1]),
+                "ylim": (0.5, max(np.nonzero(group_counts.sum(axis=0))[0]) + 1.5),
+                "xlabel": "Time (min)",
+                "ylabel": "Num. Servers",
+            }
+        )
+    return specs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Summarize locality vs. queueing delay of the trace."
+    )
+    parser.add_argument("--by-vc", action="store_true")
+    parser.add_argument("--min-gpus", type=int, default=MIN_GPUS)
+    parser.add_argument("--out-dir", default="figures")
+    args = parser.parse_args()
+
+    from render import render_figures
+
+    table = load_job_table()
+    summary = locality_summary(attempt_locality(table), table["vcs"], args.min_gpus)
+    print(summary.to_string())
+    render_figures(locality_figures(table, args.by_vc, args.min_gpus), args.out_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import argparse
+import functools
+import os
+
+import numpy as np
+import scipy
+
+import arrival_model
+import shared
+from sample import ARRIVAL_SCALE, RUNTIME_SCALE
+from simulate_scheduler import SERIES_INTERVAL, simulate_metrics
+
+NUM_REPLICAS = 32
+NUM_JOBS = 1000
+SEED = 42
+CONFIDENCE = 0.95
+# Replicas are handed to the workers in batches, BATCHES_PER_PROCESS per
+# process, to spread uneven run times without paying for a task per replica.
+BATCHES_PER_PROCESS = 4
+
+# A workload model is a dict with the 'arrival_scale' and 'runtime_scale' in
+# seconds of exponential inter-arrival and run times (see sample.py), and
+# optionally an arrival model of the 'arrivals' (see arrival_model), which
+# then replaces the exponential inter-arrival times.
+#
+# Every replica draws its workload from its own random stream, a child of one
+# np.random.SeedSequence, so replicas are independent of each other and of
+# the number and order of processes, and the same seed gives the same
+# replicas.
+
+
+def fit_workload(columns: dict, weekly: bool = False) -> dict:
+    """Fits a workload model to jobs by maximum likelihood.
+
+    Args:
+        columns: A dict with 'submitted_time' and 'runtime' columns, as
+                 returned by load_job_columns.
+        weekly: Whether to fit an hour-of-week arrival model too.
+    """
+    arrivals = np.sort(columns["submitted_time"])
+    model = {
+        "arrival_scale": float(np.diff(arrivals).mean()),
+        "runtime_scale": float(np.mean(columns["runtime"])),
+    }
+    if weekly:
+        model["arrivals"] = arrival_model.fit_rates(
+            arrival_model.wall_seconds(arrivals)
+        )
+    return model
+
+
+def generate_workload(rng, num_jobs: int, model: dict) -> dict:
+    """Draws a workload as the columns simulate_scheduler takes.
+
+    The first job is submitted at 0.
+    """
+    if "arrivals" in model:
+        submitted, _ = arrival_model.first_arrivals(rng, model["arrivals"], num_jobs)
+        submitted = submitted - submitted[0]
+    else:
+        gaps = rng.exponential(model["arrival_scale"], size=num_jobs - 1)
+        submitted = np.concatenate([[0.0], np.cumsum(gaps)])
+    return {
+        "submitted_time": submitted,
+        "runtime": rng.exponential(model["runtime_scale"], size=num_jobs),
+    }
+
+
+def replica_metrics(summary: dict) -> dict:
+    """Returns the scalar metrics of a simulation summary."""
+    metrics = {
+        "makespan": summary["makespan"],
+        "gpu_utilization": summary["gpu_utilization"],
+        "scale_ops": summary["scale_up"] + summary["scale_down"],
+    }
+    for kind in ["scale_up", "scale_down"]:
+        metrics[kind] = summary[kind]
+    for name in ["jct", "queueing_delay"]:
+        for stat in ["mean", "p50", "p99"]:
+            metrics[f"{name}_{stat}"] = summary[name][stat]
+    for name in ["queued", "running"]:
+        metrics[f"mean_{name}"] = float(summary[name].mean())
+    return metrics
+
+
+def _run_batch(
+    seeds: list, num_jobs: int, model: dict, stretches: list, interval: float
+) -> list:
+    results = []
+    for seed in seeds:
+        rng = np.random.default_rng(seed)
+        jobs = generate_workload(rng, num_jobs, model)
+        results.append(
+            {
+                stretch: replica_metrics(
+                    simulate_metrics(jobs, interval=interval, stretch=stretch)
+                )
+                for stretch in stretches
+            }
+        )
+    return results
+
+
+def run_monte_carlo(
+    num_replicas: int = NUM_REPLICAS,
+    num_jobs: int = NUM_JOBS,
+    model: dict = None,
+    stretches: list = (1,),
+    seed: int = SEED,
+    processes: int = None,
+    interval: float = SERIES_INTERVAL,
+) -> dict:
+    """Simulates the scheduler on independent synthetic workloads.
+
+    Every replica is simulated at every stretch, so the stretches are
+    compared on the same workloads.
+
+    Args:
+        num_replicas: The number of workloads.
+        num_jobs: The number of jobs of each workload.
+        model: The workload model (see above), that of sample.py if None.
+        stretches: The stretch factors to simulate.
+        seed: The seed of the root SeedSequence.
+        processes: The number of worker processes, os.cpu_count() if None.
+        interval: The series interval of the simulations.
+
+    Returns:
+        A dict mapping each stretch to a dict mapping each metric (see
+        replica_metrics) to an array of its value per replica.
+    """
+    if model is None:
+        model = {"arrival_scale": ARRIVAL_SCALE, "runtime_scale": RUNTIME_SCALE}
+    seeds = np.random.SeedSequence(seed).spawn(num_replicas)
+    num_processes = processes or os.cpu_count()
+    num_batches = min(num_replicas, num_processes * BATCHES_PER_PROCESS)
+    batches = [
+        [seeds[i] for i in b]
+        for b in np.array_split(np.arange(num_replicas), num_batches)
+    ]
+    func = functools.partial(
+        _run_batch,
+        num_jobs=num_jobs,
+        model=model,
+        stretches=list(stretches),
+        interval=interval,
+    )
+    replicas = [
+        r
+        for batch in shared.run_sharded(func, batches, processes=processes)
+        for r in batch
+    ]
+    return {
+        stretch: {
+            name: np.array([r[stretch][name] for r in replicas])
+            for name in replicas[0][stretch]
+        }
+        for stretch in stretches
+    }
+
+
+def confidence_interval(values: np.ndarray, confidence: float = CONFIDENCE) -> dict:
+    """Returns the mean of values with a Student t confidence interval.
+
+    Returns:
+        A dict with the 'mean', the standard deviation 'std', the interval
+        'low' and 'high' and the number 'n' of values.
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    mean = values.mean()
+    std = values.std(ddof=1) if n > 1 else np.nan
+    half = scipy.stats.t.ppf((1 + confidence) / 2, n - 1) * std / np.sqrt(n)
+    return {"mean": mean, "std": std, "low": mean - half, "high": mean + half, "n": n}
+
+
+def aggregate(results: dict, confidence: float = CONFIDENCE) -> dict:
+    """Returns the confidence interval of every metric of every stretch."""
+    return {
+        stretch: {
+            name: confidence_interval(values, confidence)
+            for name, values in metrics.items()
+        }
+        for stretch, metrics in results.items()
+    }
+
+
+def print_aggregates(aggregates: dict, confidence: float = CONFIDENCE):
+    for stretch, metrics in aggregates.items():
+        print(f"stretch {stretch}")
+        for name, ci in metrics.items():
+            print(
+                f"    {name}: {ci['mean']:.4g}"
+                f" ({confidence:.0%} CI {ci['low']:.4g} - {ci['high']:.4g},"
+                f" n={ci['n']})"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Simulates the scheduler on synthetic workload replicas."
+    )
+    parser.add_argument("--replicas", type=int, default=NUM_REPLICAS)
+    parser.add_argument("--jobs", type=int, default=NUM_JOBS)
+    parser.add_argument("--stretch", type=int, nargs="+", default=[1, 20])
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--confidence", type=float, default=CONFIDENCE)
+    parser.add_argument(
+        "--fit",
+        action="store_true",
+        help="fit the workload model to the exported jobs instead of sample.py's",
+    )
+    parser.add_argument(
+        "--weekly",
+        action="store_true",
+        help="with --fit, draw submissions from an hour-of-week arrival model",
+    )
+    args = parser.parse_args()
+    if args.weekly and not args.fit:
+        parser.error("--weekly needs --fit")
+
+    model = None
+    if args.fit:
+        from job_export import load_job_columns
+
+        model = fit_workload(
+            load_job_columns(columns=["submitted_time", "runtime"]), args.weekly
+        )
+        print(f"runtime scale {model['runtime_scale']}")
+    results = run_monte_carlo(
+        args.replicas,
+        args.jobs,
+        model=model,
+        stretches=args.stretch,
+        seed=args.seed,
+        processes=args.processes,
+    )
+    print_aggregates(aggregate(results, args.confidence), args.confidence)
+
+
+if __name__ == "__main__":
+    main()
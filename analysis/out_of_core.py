@@ -0,0 +1,545 @@
+import argparse
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import utilization
+from job_export import export_jobs
+from job_table import NUM_BUCKETS, build_job_table, queueing_delays_by_group
+from locality import (
+    MAX_SERVERS,
+    MIN_GPUS,
+    attempt_locality,
+    delay_edges,
+    histogram_figures,
+    locality_histograms,
+)
+from render import cdf_line, render_figures
+from trace_analysis_mw import (
+    Job,
+    filter_jobs,
+    get_plot_config_from_bucket,
+    open_trace_file,
+    utilization_rows,
+)
+from trace_archive import CACHE_DIR, READ_SIZE
+
+SPILL_DIR = os.path.join(CACHE_DIR, "out_of_core")
+MEMORY_MB = 4096
+# Memory taken by the interpreter, numpy, pandas and matplotlib before any
+# data is loaded; the rest of the budget goes to one chunk at a time.
+BASE_MB = 512
+# Peak memory per parsed job (Job objects and their job table rows), per
+# line of a utilization file being parsed, and per GPU-minute gathered from
+# the utilization cube, with headroom over what the Philly trace needs.
+JOB_BYTES = 4 << 10
+ROW_BYTES = 512
+SAMPLE_BYTES = 64
+# CDFs are drawn from histograms with CDF_BINS_PER_DECADE log-spaced bins
+# between MIN_MINUTES and MAX_MINUTES for times, and UTIL_STEP percent wide
+# bins for utilization, plus an underflow and an overflow bin each (as in
+# locality). The drawn CDFs are exact at every bin edge.
+MIN_MINUTES = 10**-2
+MAX_MINUTES = 10**6
+CDF_BINS_PER_DECADE = 100
+UTIL_STEP = 0.1
+UTIL_SIZES = [1, 4, 8, 16]
+LARGE_SIZES = [8, 16]
+
+# In out-of-core mode, jobs are parsed from cluster_job_log in chunks of a
+# size derived from the memory budget, and each chunk is reduced to partial
+# aggregates before the next one is read. Its job table is spilled to disk,
+# so the GPU utilization pass can go over the same chunks without parsing
+# the log again. Utilization files are read in chunks of lines, which are in
+# time order; the GPU cube is built from chunks spilled to disk (see
+# utilization.build_utilization_cube) and memory-mapped.
+#
+# Partial aggregates are dicts mapping a key tuple, whose first element
+# names the aggregate, to an int64 or float64 array. They are combined by
+# adding up the arrays of equal keys (see merge_aggregates), so the result
+# does not depend on how the trace was chunked. Keys hold names rather than
+# codes, since codes differ between chunks' job tables:
+#     ('run_time', num_gpus): Run time histogram (minute edges) of jobs with
+#                             8 or more GPUs.
+#     ('queueing_delay', vc, bucket): Queueing delay histogram (minute
+#                                     edges) of attempts.
+#     ('locality', vc, bucket): locality_histograms counts of one group.
+#     ('locality_delay', vc, bucket): Queueing delay histogram (minute edges)
+#                                     of the attempts counted in 'locality'.
+#     ('locality_stats', vc, bucket): The number of those attempts, of them
+#                                     with a known delay, their total number
+#                                     of servers and the number of them on a
+#                                     single server and spread unevenly.
+#     ('gpu_util', status, num_gpus): Utilization histogram (utilization
+#                                     edges), as in get_utilization_data.
+#     ('gpu_util_dedicated', num_gpus): The same for large jobs on dedicated
+#                                       servers, summed over statuses.
+#     ('cpu_util',), ('mem_util',): Host utilization histograms.
+
+
+def minute_edges() -> np.ndarray:
+    decades = int(round(np.log10(MAX_MINUTES / MIN_MINUTES)))
+    return np.logspace(
+        np.log10(MIN_MINUTES),
+        np.log10(MAX_MINUTES),
+        decades * CDF_BINS_PER_DECADE + 1,
+    )
+
+
+def util_edges() -> np.ndarray:
+    # A bin holds the values below its edge, so 100% is in the last inner bin.
+    return UTIL_STEP * np.arange(1, int(round(100 / UTIL_STEP)) + 2)
+
+
+def histogram(values, edges: np.ndarray) -> np.ndarray:
+    """Counts values into the bins between edges, plus an underflow and an
+    overflow bin. NaNs are left out."""
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    return np.bincount(
+        np.searchsorted(edges, values, side="right"), minlength=len(edges) + 1
+    )
+
+
+def histogram_cdf(counts: np.ndarray, edges: np.ndarray) -> tuple:
+    """Returns the CDF of a histogram at its edges, as a pair of arrays (x, y)
+    like get_cdf's, with y in percent."""
+    below = np.cumsum(counts)[:-1]
+    return edges, 100.0 * below / counts.sum()
+
+
+def histogram_quantile(counts: np.ndarray, edges: np.ndarray, q: float) -> float:
+    """Returns the upper edge of the bin holding the q-quantile of a
+    histogram, NaN if it is empty and inf if it is the overflow bin."""
+    total = counts.sum()
+    if total == 0:
+        return np.nan
+    index = np.searchsorted(np.cumsum(counts), q * total)
+    return edges[index] if index < len(edges) else np.inf
+
+
+def merge_aggregates(total: dict, part: dict) -> dict:
+    """Adds the partial aggregates part to total in place and returns it."""
+    for key, value in part.items():
+        if key in total:
+            total[key] = total[key] + value
+        else:
+            total[key] = value
+    return total
+
+
+def chunk_sizes(memory_mb: float) -> dict:
+    """Derives the chunk sizes of every pass from the memory budget."""
+    available = max(memory_mb - BASE_MB, 1) * (1 << 20)
+    return {
+        "jobs": max(int(available // JOB_BYTES), 1),
+        "rows": max(int(available // ROW_BYTES), 1),
+        "samples": max(int(available // SAMPLE_BYTES), 1),
+    }
+
+
+def iter_json_array(f, read_size: int = READ_SIZE):
+    """Yields the elements of a JSON array of objects from a text file
+    without reading the whole file.
+
+    Only the unparsed tail of the current block is buffered, plus an element
+    if it spans blocks.
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+    while True:
+        # Between elements, only whitespace, separators and the brackets of
+        # the array can occur.
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,[":
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+        element = None
+        if pos < len(buffer):
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+        if element is None:
+            if eof:
+                return
+            block = f.read(read_size)
+            eof = not block
+            buffer, pos = buffer[pos:] + block, 0
+            continue
+        pos = end
+        yield element
+
+
+def iter_job_chunks(chunk_jobs: int):
+    """Yields the Jobs of cluster_job_log in lists of up to chunk_jobs."""
+    chunk = []
+    with open_trace_file("cluster_job_log") as f:
+        for record in iter_json_array(f):
+            chunk.append(Job(**record))
+            if len(chunk) == chunk_jobs:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def job_aggregates(jobs: list, table: dict, min_gpus: int = MIN_GPUS) -> dict:
+    """Returns the partial aggregates of the job analyses of one chunk."""
+    edges = minute_edges()
+    aggregates = {}
+
+    run_times = {}
+    for job in jobs:
+        if job.num_gpus is not None and job.num_gpus >= 8:
+            if job.run_time is not None:
+                run_times.setdefault(job.num_gpus, []).append(job.run_time)
+    for num_gpus, values in run_times.items():
+        aggregates[("run_time", num_gpus)] = histogram(values, edges)
+
+    vcs = table["vcs"].tolist()
+    for (vc, bucket), delays in queueing_delays_by_group(table).items():
+        aggregates[("queueing_delay", vcs[vc], bucket)] = histogram(delays, edges)
+
+    loc = attempt_locality(table)
+    counts = locality_histograms(loc, True, len(vcs), min_gpus)["counts"]
+    keep = (loc["num_gpus"] >= min_gpus) & (loc["bucket"] >= 0)
+    group = loc["vc"][keep].astype(np.int64) * NUM_BUCKETS + loc["bucket"][keep]
+    delay = loc["queueing_delay"][keep]
+    num_servers = loc["num_servers"][keep]
+    stats = np.stack(
+        [
+            np.ones(len(group)),
+            ~np.isnan(delay),
+            num_servers,
+            num_servers == 1,
+            loc["spread"][keep] > 0,
+        ]
+    ).astype(np.float64)
+    for g in np.unique(group):
+        vc, bucket = divmod(int(g), NUM_BUCKETS)
+        in_group = group == g
+        aggregates[("locality", vcs[vc], bucket)] = counts[g]
+        aggregates[("locality_delay", vcs[vc], bucket)] = histogram(
+            delay[in_group], edges
+        )
+        aggregates[("locality_stats", vcs[vc], bucket)] = stats[:, in_group].sum(1)
+    return aggregates
+
+
+def utilization_aggregates(table: dict, cube: dict, chunk_samples: int) -> dict:
+    """Returns the partial GPU utilization aggregates of one chunk.
+
+    The GPU ranges are gathered from the cube in batches of about
+    chunk_samples GPU-minutes, and each batch is counted into all groups
+    with a single bincount over a flat bin index.
+    """
+    edges = util_edges()
+    num_bins = len(edges) + 1
+    num_minutes = cube["util"].shape[2]
+    aggregates = {}
+    for name, large in [("gpu_util", False), ("gpu_util_dedicated", True)]:
+        sizes = LARGE_SIZES if large else UTIL_SIZES
+        num_groups = len(sizes) if large else len(sizes) * len(table["statuses"])
+        counts = np.zeros((num_groups, num_bins), dtype=np.int64)
+        rows = utilization_rows(table, cube, large, large)
+        start = np.clip(rows["start"], 0, num_minutes)
+        length = np.clip(rows["end"], start, num_minutes) - start
+        batch = (np.cumsum(length) - length) // chunk_samples
+        splits = np.flatnonzero(np.diff(batch)) + 1
+        for part in np.split(np.arange(len(batch)), splits):
+            row, values = utilization.range_samples(
+                cube,
+                rows["machine"][part],
+                rows["gpu"][part],
+                rows["start"][part],
+                rows["end"][part],
+            )
+            job = rows["job"][part][row]
+            # utilization_rows only keeps jobs of one of the sizes.
+            group = np.searchsorted(sizes, table["num_gpus"][job])
+            if not large:
+                group += len(sizes) * table["status"][job].astype(np.int64)
+            value_bin = np.searchsorted(edges, values, side="right")
+            flat = group * num_bins + value_bin
+            counts += np.bincount(flat, minlength=counts.size).reshape(counts.shape)
+        statuses = table["statuses"].tolist()
+        for g in np.flatnonzero(counts.sum(axis=1)):
+            code, size = divmod(int(g), len(sizes))
+            if large:
+                aggregates[(name, sizes[size])] = counts[g]
+            else:
+                aggregates[(name, statuses[code], sizes[size])] = counts[g]
+    return aggregates
+
+
+def host_aggregates(chunk_rows: int) -> dict:
+    """Returns the host CPU and memory utilization aggregates, reading the
+    trace files chunk_rows lines at a time."""
+    edges = util_edges()
+    aggregates = {("cpu_util",): np.zeros(len(edges) + 1, dtype=np.int64)}
+    aggregates[("mem_util",)] = aggregates[("cpu_util",)].copy()
+    with open_trace_file("cluster_cpu_util") as f:
+        for chunk in pd.read_csv(f, chunksize=chunk_rows):
+            cpu = chunk.iloc[:, 2].to_numpy(dtype=np.float64)
+            aggregates[("cpu_util",)] += histogram(cpu, edges)
+    with open_trace_file("cluster_mem_util") as f:
+        for chunk in pd.read_csv(f, chunksize=chunk_rows):
+            total = chunk.iloc[:, 2].to_numpy(dtype=np.float64)
+            free = chunk.iloc[:, 3].to_numpy(dtype=np.float64)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mem = np.where(total == 0, np.nan, 100.0 * (total - free) / total)
+            aggregates[("mem_util",)] += histogram(mem, edges)
+    return aggregates
+
+
+def _save(path: str, value):
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+
+
+def _load(path: str):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def run_out_of_core(
+    memory_mb: float = MEMORY_MB,
+    spill_dir: str = SPILL_DIR,
+    export: bool = True,
+    min_gpus: int = MIN_GPUS,
+) -> dict:
+    """Runs every analysis of the trace in chunks under a memory budget.
+
+    Args:
+        memory_mb: The memory budget in MB, which sets the chunk sizes (see
+                   chunk_sizes).
+        spill_dir: The directory chunk intermediates are spilled to, in a
+                   temporary directory that is removed when the run
+                   finishes.
+        export: If True, also exports the filtered jobs (see export_jobs)
+                to the working directory.
+        min_gpus: The smallest attempts counted by the locality analysis.
+
+    Returns:
+        The merged aggregates (see above).
+    """
+    sizes = chunk_sizes(memory_mb)
+    os.makedirs(spill_dir, exist_ok=True)
+    spill_dir = tempfile.mkdtemp(dir=spill_dir)
+    aggregates = {}
+    table_paths = []
+
+    def filtered_jobs():
+        for i, jobs in enumerate(iter_job_chunks(sizes["jobs"])):
+            table = build_job_table(jobs)
+            path = os.path.join(spill_dir, f"jobs-{i:05d}.pkl")
+            _save(path, table)
+            table_paths.append(path)
+            merge_aggregates(aggregates, job_aggregates(jobs, table, min_gpus))
+            yield from filter_jobs(jobs)
+
+    try:
+        if export:
+            export_jobs(filtered_jobs())
+        else:
+            for _ in filtered_jobs():
+                pass
+        cube = utilization.build_utilization_cube(
+            os.path.join(spill_dir, "gpu_util"),
+            spill_dir=os.path.join(spill_dir, "gpu_util_chunks"),
+            chunk_rows=sizes["rows"],
+        )
+        for path in table_paths:
+            merge_aggregates(
+                aggregates, utilization_aggregates(_load(path), cube, sizes["samples"])
+            )
+        del cube
+        merge_aggregates(aggregates, host_aggregates(sizes["rows"]))
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+    return aggregates
+
+
+def _groups(aggregates: dict, name: str) -> dict:
+    return {key[1:]: value for key, value in aggregates.items() if key[0] == name}
+
+
+def _cdf_spec(name: str, lines: list, **axes) -> dict:
+    return {
+        "name": name,
+        "lines": lines,
+        "legend_loc": "lower right",
+        "ylim": (0, 100),
+        "ylabel": "CDF",
+        "grid": True,
+        **axes,
+    }
+
+
+def aggregate_figures(aggregates: dict, by_vc: bool = False) -> list:
+    """Returns the figure specs of the analyses of trace_analysis_mw, drawn
+    from merged aggregates."""
+    minutes, util = minute_edges(), util_edges()
+    time_axes = {
+        "xscale": "log",
+        "xlim": (10**-1, 10**4),
+        "xlabel": "Time (min)",
+    }
+    util_axes = {"xlim": (0, 100), "xlabel": "Utilization (%)"}
+    specs = []
+
+    run_times = _groups(aggregates, "run_time")
+    lines = []
+    for (num_gpus,) in sorted(run_times):
+        counts = run_times[(num_gpus,)]
+        if counts.sum() <= 1:
+            continue
+        x, y = histogram_cdf(counts, minutes)
+        lines.append(cdf_line(x, y, log_x=True, label=f"{num_gpus} GPU"))
+    specs.append(_cdf_spec("job_runtimes", lines, **time_axes))
+
+    delays = _groups(aggregates, "queueing_delay")
+    for vc in sorted({vc for vc, _ in delays}):
+        lines = []
+        for bucket in range(NUM_BUCKETS):
+            counts = delays.get((vc, bucket))
+            if counts is None or counts.sum() <= 1:
+                continue
+            num_gpus, color, linestyle = get_plot_config_from_bucket(bucket)
+            x, y = histogram_cdf(counts, minutes)
+            lines.append(
+                cdf_line(
+                    x,
+                    y,
+                    log_x=True,
+                    label="%s GPU" % (num_gpus),
+                    color=color,
+                    linestyle=linestyle,
+                )
+            )
+        specs.append(
+            _cdf_spec(
+                "queueing_delays_vc_%s" % (vc), lines, title="VC %s" % (vc), **time_axes
+            )
+        )
+
+    locality = _groups(aggregates, "locality")
+    vcs = sorted({vc for vc, _ in locality})
+    counts = np.zeros(
+        (len(vcs) * NUM_BUCKETS, len(delay_edges()) + 1, MAX_SERVERS),
+        dtype=np.int64,
+    )
+    for (vc, bucket), group_counts in locality.items():
+        counts[vcs.index(vc) * NUM_BUCKETS + bucket] = group_counts
+    if not by_vc:
+        counts = counts.reshape(len(vcs), NUM_BUCKETS, *counts.shape[1:]).sum(0)
+    specs += histogram_figures(counts, vcs if by_vc else None)
+
+    styles = {1: ("green", "-"), 4: ("blue", "-."), 8: ("red", "--"), 16: ("cyan", ":")}
+    gpu_util = _groups(aggregates, "gpu_util")
+    for status in sorted({status for status, _ in gpu_util}):
+        lines = []
+        for num_gpus in UTIL_SIZES:
+            if (status, num_gpus) not in gpu_util:
+                continue
+            color, linestyle = styles[num_gpus]
+            x, y = histogram_cdf(gpu_util[(status, num_gpus)], util)
+            lines.append(
+                cdf_line(
+                    x, y, label="%s GPU" % (num_gpus), color=color, linestyle=linestyle
+                )
+            )
+        specs.append(
+            _cdf_spec("gpu_utilization_%s" % (status), lines, title=status, **util_axes)
+        )
+
+    dedicated = _groups(aggregates, "gpu_util_dedicated")
+    lines = []
+    for num_gpus, linestyle in zip(LARGE_SIZES, ["-", "-."]):
+        if (num_gpus,) in dedicated:
+            x, y = histogram_cdf(dedicated[(num_gpus,)], util)
+            lines.append(
+                cdf_line(
+                    x,
+                    y,
+                    label="%s GPU" % (num_gpus),
+                    color="black",
+                    linestyle=linestyle,
+                )
+            )
+    specs.append(_cdf_spec("gpu_utilization_dedicated", lines, **util_axes))
+
+    lines = []
+    for name, label, linestyle in [
+        ("cpu_util", "CPU", "-"),
+        ("mem_util", "Memory", "-."),
+    ]:
+        counts = aggregates.get((name,))
+        if counts is not None and counts.sum() > 0:
+            x, y = histogram_cdf(counts, util)
+            lines.append(
+                cdf_line(x, y, label=label, color="black", linestyle=linestyle)
+            )
+    specs.append(_cdf_spec("host_resource_utilization", lines, **util_axes))
+    return specs
+
+
+def locality_summary(aggregates: dict) -> pd.DataFrame:
+    """Like locality.locality_summary, from merged aggregates.
+
+    The delay quantiles are the upper edges of the histogram bins holding
+    them, so they are within a bin (10^(1/CDF_BINS_PER_DECADE)) of exact.
+    """
+    edges = minute_edges()
+    stats = _groups(aggregates, "locality_stats")
+    delays = _groups(aggregates, "locality_delay")
+    index = sorted(stats)
+    rows = []
+    for key in index:
+        attempts, _, servers, single, uneven = stats[key]
+        rows.append(
+            {
+                "attempts": int(attempts),
+                "delay_p50": histogram_quantile(delays[key], edges, 0.5),
+                "delay_p90": histogram_quantile(delays[key], edges, 0.9),
+                "mean_servers": servers / attempts,
+                "single_server": single / attempts,
+                "uneven": uneven / attempts,
+            }
+        )
+    return pd.DataFrame(
+        rows, index=pd.MultiIndex.from_tuples(index, names=["vc", "bucket"])
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the trace analyses in chunks under a memory budget."
+    )
+    parser.add_argument(
+        "--memory-mb", type=float, default=MEMORY_MB, help="the memory budget"
+    )
+    parser.add_argument("--spill-dir", default=SPILL_DIR)
+    parser.add_argument("--out-dir", default="figures")
+    parser.add_argument("--by-vc", action="store_true")
+    parser.add_argument("--min-gpus", type=int, default=MIN_GPUS)
+    parser.add_argument("--no-export", action="store_true")
+    args = parser.parse_args()
+
+    aggregates = run_out_of_core(
+        args.memory_mb, args.spill_dir, not args.no_export, args.min_gpus
+    )
+    print(locality_summary(aggregates).to_string())
+    render_figures(aggregate_figures(aggregates, args.by_vc), args.out_dir)
+
+
+if __name__ == "__main__":
+    main()
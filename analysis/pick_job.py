@@ -1,57 +1,67 @@
-import json
 import pprint
 
 import numpy as np
 
+from pipeline import run_pipeline
+from sampling import alias_draw, alias_table
+from simulate_scheduler import scale_events
+
 
 def to_hours(sec: float):
     return sec / 3600
 
 
-def pick_job(jobs: list, num: int = 1):
-    np.random.seed(42)
-    indices = np.random.randint(0, len(jobs), size=num)
+def pick_job(schedule: dict, num: int = 1, weighted: bool = False, seed: int = 42):
+    """Prints the simulated execution of random jobs.
+
+    Args:
+        schedule: A schedule (see simulate_scheduler).
+        num: The number of jobs.
+        weighted: Whether to pick jobs by their GPU time rather than
+                  uniformly.
+        seed: The seed of the picks.
+    """
+    starts = schedule["mw_start_time"]
+    ends = schedule["mw_end_time"]
+    rng = np.random.default_rng(seed)
+    if weighted:
+        # Rigid jobs all run on MIN_NUM_GPUS_JOB GPUs.
+        gpu_time = schedule.get("gpu_seconds", schedule["runtime"])
+        indices = alias_draw(rng, alias_table(gpu_time), num)
+    else:
+        indices = rng.integers(0, len(starts), size=num)
 
     for idx in indices:
-        jo = jobs[idx]
         print(f"Job index: {idx}")
         # pprint.pprint(jo)
 
-        start_time = jo["mw_start_time"]
+        start_time = starts[idx]
         print(f"start time: {to_hours(start_time)}")
-        runtime = jo["mw_end_time"] - start_time
+        runtime = ends[idx] - start_time
         print(f"runtime: {to_hours(runtime)}")
 
-        if "scale_up" in jo:
-            scale_ups = jo["scale_up"]
-            for j, su in enumerate(scale_ups):
-                scale_ups[j] = to_hours(su - start_time)
+        scale_ups = scale_events(schedule, "scale_up", idx)
+        if len(scale_ups) > 0:
+            scale_ups = to_hours(scale_ups - start_time).tolist()
             print(f"scale ups: {scale_ups}")
         else:
             print("no scale ups")
 
-        if "scale_down" in jo:
-            scale_downs = jo["scale_down"]
-            for j, sd in enumerate(scale_downs):
-                scale_downs[j] = to_hours(sd - start_time)
+        scale_downs = scale_events(schedule, "scale_down", idx)
+        if len(scale_downs) > 0:
+            scale_downs = to_hours(scale_downs - start_time).tolist()
             print(f"scale downs: {scale_downs}")
         else:
             print("no scale downs")
 
-        num_concurrent = 0
-        for other_j in jobs:
-            if (
-                other_j != jo
-                and other_j["mw_start_time"] < start_time < other_j["mw_end_time"]
-            ):
-                num_concurrent = num_concurrent + 1
+        # A job never starts strictly inside its own run.
+        num_concurrent = np.count_nonzero((starts < start_time) & (start_time < ends))
         print(f"concurrent jobs at start: {num_concurrent}")
         print("---")
 
 
 def main():
-    with open("jobs_executed_stretch16.json", "r") as json_file:
-        jobs = json.load(json_file)
+    jobs = run_pipeline(["simulate"])["simulate"]
     pick_job(jobs)
 
 
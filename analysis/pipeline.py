@@ -0,0 +1,286 @@
+import ast
+import contextlib
+import hashlib
+import inspect
+import io
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+import instrument
+import trace_analysis_mw
+from fit_scaling import FIGURE_DIR, fit_scaling
+from job_export import export_jobs
+from plot_first_jobs import plot_jobs
+from simulate_scheduler import simulate_scheduler
+from trace_analysis_mw import filter_jobs, jobs_to_dict, load_cluster_log
+from trace_archive import CACHE_DIR as TRACE_CACHE_DIR
+
+CACHE_DIR = os.path.join(TRACE_CACHE_DIR, "pipeline")
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+LOG_FILE = "stdout.txt"
+PARAMS = {
+    "sample_every": 1,
+    "stretch": 20,
+    "relative_runtime": True,
+    "num_plot_jobs": 128,
+}
+
+
+def _load(inputs, params):
+    return load_cluster_log()
+
+
+def _filter(inputs, params):
+    jobs = filter_jobs(inputs["load"])
+    jobs.sort(key=lambda x: x.submitted_time)
+    return jobs
+
+
+def _export(inputs, params):
+    export_jobs(inputs["filter"])
+
+
+def _simulate(inputs, params):
+    return simulate_scheduler(
+        jobs_to_dict(inputs["filter"]),
+        sample_every=params["sample_every"],
+        stretch=params["stretch"],
+    )
+
+
+def _fit(inputs, params):
+    fit_scaling(
+        inputs["simulate"], relative_runtime=params["relative_runtime"], out_dir="."
+    )
+
+
+def _plot(inputs, params):
+    plot_jobs(inputs["simulate"], params["num_plot_jobs"])
+
+
+# Each stage lists the stages it consumes, the parameters it depends on, the
+# modules whose code it runs (the local modules they import are found by
+# _local_modules) and how to count the items it processes for the
+# instrument report, from its inputs, parameters and value. Stages with
+# files set are run inside their artifact directory and their product is
+# the files they write there, either "data" that other scripts read from the
+# working directory or "figures"; the product of every other stage is its
+# return value, which is pickled.
+STAGES = {
+    "load": {
+        "func": _load,
+        "deps": [],
+        "params": [],
+        "modules": ["trace_analysis_mw"],
+        "items": lambda inputs, params, value: len(value),
+        "files": False,
+    },
+    "filter": {
+        "func": _filter,
+        "deps": ["load"],
+        "params": [],
+        "modules": ["trace_analysis_mw"],
+        "items": lambda inputs, params, value: len(inputs["load"]),
+        "files": False,
+    },
+    "export": {
+        "func": _export,
+        "deps": ["filter"],
+        "params": [],
+        "modules": ["job_export"],
+        "items": lambda inputs, params, value: len(inputs["filter"]),
+        "files": "data",
+    },
+    "simulate": {
+        "func": _simulate,
+        "deps": ["filter"],
+        "params": ["sample_every", "stretch"],
+        "modules": ["simulate_scheduler", "trace_analysis_mw"],
+        "items": lambda inputs, params, value: len(inputs["filter"]),
+        "files": False,
+    },
+    "fit": {
+        "func": _fit,
+        "deps": ["simulate"],
+        "params": ["relative_runtime"],
+        "modules": ["fit_scaling"],
+        "items": lambda inputs, params, value: len(inputs["simulate"]["mw_start_time"]),
+        "files": "figures",
+    },
+    "plot": {
+        "func": _plot,
+        "deps": ["simulate"],
+        "params": ["num_plot_jobs"],
+        "modules": ["plot_first_jobs"],
+        "items": lambda inputs, params, value: params["num_plot_jobs"],
+        "files": "figures",
+    },
+}
+
+
+def _local_modules(modules: list) -> list:
+    """Returns the modules and every module of MODULE_DIR they import,
+    directly or through each other, including imports inside functions."""
+    found = set()
+    pending = list(modules)
+    while pending:
+        module = pending.pop()
+        path = os.path.join(MODULE_DIR, f"{module}.py")
+        if module in found or not os.path.exists(path):
+            continue
+        found.add(module)
+        with open(path, "r") as f:
+            tree = ast.parse(f.read(), path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                pending.extend(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                pending.append(node.module)
+    return sorted(found)
+
+
+def _code_hash(stage: dict) -> str:
+    h = hashlib.sha256(inspect.getsource(stage["func"]).encode())
+    for module in _local_modules(stage["modules"]):
+        h.update(module.encode())
+        with open(os.path.join(MODULE_DIR, f"{module}.py"), "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def stage_keys(params: dict) -> dict:
+    """Computes the cache key of every stage.
+
+    A key hashes the stage's code, the parameters it depends on and the keys
+    of its inputs, so keys are known before anything runs and a parameter
+    change invalidates exactly the stages downstream of its use.
+    """
+    keys = {}
+
+    def key(name):
+        if name not in keys:
+            stage = STAGES[name]
+            content = {
+                "stage": name,
+                "code": _code_hash(stage),
+                "params": {p: params[p] for p in stage["params"]},
+                "inputs": {d: key(d) for d in stage["deps"]},
+            }
+            if name == "load":
+                content["trace"] = trace_analysis_mw.trace_fingerprint()
+            digest = hashlib.sha256(json.dumps(content, sort_keys=True).encode())
+            keys[name] = digest.hexdigest()[:16]
+        return keys[name]
+
+    for name in STAGES:
+        key(name)
+    return keys
+
+
+def _artifact_path(cache_dir: str, name: str, key: str) -> str:
+    if STAGES[name]["files"]:
+        return os.path.join(cache_dir, f"{name}-{key}")
+    return os.path.join(cache_dir, f"{name}-{key}.pkl")
+
+
+def _run_stage(name: str, inputs: dict, params: dict, path: str):
+    stage = STAGES[name]
+    cache_dir = os.path.dirname(path)
+    with instrument.stage(name) as s:
+        if not stage["files"]:
+            value = stage["func"](inputs, params)
+            s.set_items(stage["items"](inputs, params, value))
+            with tempfile.NamedTemporaryFile(dir=cache_dir, delete=False) as f:
+                try:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                except BaseException:
+                    f.close()
+                    os.remove(f.name)
+                    raise
+            os.replace(f.name, path)
+            return value
+        # A stage that fails leaves no partial artifact directory behind.
+        tmp = tempfile.mkdtemp(dir=cache_dir)
+        try:
+            cwd = os.getcwd()
+            out = io.StringIO()
+            os.chdir(tmp)
+            try:
+                with contextlib.redirect_stdout(out):
+                    value = stage["func"](inputs, params)
+            finally:
+                os.chdir(cwd)
+            s.set_items(stage["items"](inputs, params, value))
+            with open(os.path.join(tmp, LOG_FILE), "w") as f:
+                f.write(out.getvalue())
+            os.replace(tmp, path)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        return path
+
+
+def run_pipeline(
+    targets: list = None,
+    params: dict = None,
+    cache_dir: str = CACHE_DIR,
+    out_dir: str = ".",
+    figure_dir: str = FIGURE_DIR,
+) -> dict:
+    """Runs the stages needed for the targets, reusing cached artifacts.
+
+    A stage only runs if no artifact exists under its key (see stage_keys),
+    and an upstream stage is only loaded or run if a stage that needs it has
+    to run. Files written by file stages are copied to out_dir, or to
+    figure_dir for figures, and their captured output is printed, whether or
+    not they ran.
+
+    Args:
+        targets: The stages to produce, all stages if None.
+        params: Overrides of PARAMS.
+        cache_dir: The directory holding the artifacts.
+        out_dir: The directory data products are copied to, where the
+                 scripts reading them look for them.
+        figure_dir: The directory figures are copied to.
+
+    Returns:
+        A dict mapping each target to its value, or for file stages, to its
+        artifact directory.
+    """
+    params = {**PARAMS, **(params or {})}
+    if targets is None:
+        targets = list(STAGES)
+    os.makedirs(cache_dir, exist_ok=True)
+    keys = stage_keys(params)
+    values = {}
+
+    def get(name):
+        if name in values:
+            return values[name]
+        path = _artifact_path(cache_dir, name, keys[name])
+        if STAGES[name]["files"] and os.path.isdir(path):
+            values[name] = path
+        elif os.path.exists(path):
+            with open(path, "rb") as f:
+                values[name] = pickle.load(f)
+        else:
+            inputs = {d: get(d) for d in STAGES[name]["deps"]}
+            print(f"running {name} ({keys[name]})")
+            values[name] = _run_stage(name, inputs, params, path)
+        return values[name]
+
+    for name in targets:
+        get(name)
+        if STAGES[name]["files"]:
+            path = values[name]
+            with open(os.path.join(path, LOG_FILE), "r") as f:
+                print(f.read(), end="")
+            dest = out_dir if STAGES[name]["files"] == "data" else figure_dir
+            os.makedirs(dest, exist_ok=True)
+            for file_name in os.listdir(path):
+                if file_name != LOG_FILE:
+                    shutil.copy(os.path.join(path, file_name), dest)
+    return {name: values[name] for name in targets}
@@ -1,42 +1,47 @@
-import datetime
-import json
-
 import matplotlib.pyplot as plt
 
+from job_export import load_jobs
 
-def plot_first_jobs():
-    DATE_FORMAT_STR = "%Y-%m-%d %H:%M:%S"
 
+def plot_first_jobs():
     num_jobs = 128
     executed = True
 
     if executed:
-        file_name = "jobs_executed.json"
+        # pipeline imports this module for its plot stage.
+        from pipeline import run_pipeline
+
+        jobs = run_pipeline(["simulate"])["simulate"]
     else:
-        file_name = "jobs.json"
-    with open(file_name, "r") as json_file:
-        jobs = json.load(json_file)
+        jobs = load_jobs(columns=["runtime", "submitted_time"])
 
-    if not executed:
-        for jo in jobs:
-            arr_date = datetime.datetime.strptime(jo["submitted_time"], DATE_FORMAT_STR)
-            arr_time = arr_date.timestamp()
-            jo["submitted_time"] = arr_time
+    plot_jobs(jobs, num_jobs, executed)
 
+
+def plot_jobs(jobs, num_jobs: int = 128, executed: bool = True):
+    """Plots the first jobs, of a schedule if executed, else of a list of
+    jobs as submitted."""
+    if not executed:
         jobs = sorted(jobs, key=lambda x: x["submitted_time"])
 
         jo_zero_sub = jobs[0]["submitted_time"]
-        for jo in jobs:
-            jo["submitted_time"] = jo["submitted_time"] - jo_zero_sub
-            jo["submitted_time"] = jo["submitted_time"] / 60
+        jobs = [
+            {**jo, "submitted_time": (jo["submitted_time"] - jo_zero_sub) / 60}
+            for jo in jobs
+        ]
 
     fig, ax = plt.subplots()
 
-    for i in range(num_jobs):
-        jo = jobs[i]
-        if executed:
-            ax.hlines(i, jo["mw_start_time"] / 60, jo["mw_end_time"] / 60)
-        else:
+    if executed:
+        num_jobs = min(num_jobs, len(jobs["mw_start_time"]))
+        ax.hlines(
+            range(num_jobs),
+            jobs["mw_start_time"][:num_jobs] / 60,
+            jobs["mw_end_time"][:num_jobs] / 60,
+        )
+    else:
+        for i in range(min(num_jobs, len(jobs))):
+            jo = jobs[i]
             ax.hlines(i, jo["submitted_time"], jo["submitted_time"] + jo["runtime"])
 
     ax.set_xlabel("Time (min)")
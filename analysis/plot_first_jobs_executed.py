@@ -1,20 +1,21 @@
-import json
-
 import matplotlib.pyplot as plt
 import numpy as np
 
+from pipeline import run_pipeline
+
 
 def main():
     num_jobs = 64
 
-    with open("jobs_executed.json", "r") as json_file:
-        jobs = json.load(json_file)
+    jobs = run_pipeline(["simulate"])["simulate"]
 
     fig, ax = plt.subplots()
 
-    for i in range(num_jobs):
-        jo = jobs[i]
-        ax.hlines(i, jo["mw_start_time"] / 60, jo["mw_end_time"] / 60)
+    ax.hlines(
+        np.arange(num_jobs),
+        jobs["mw_start_time"][:num_jobs] / 60,
+        jobs["mw_end_time"][:num_jobs] / 60,
+    )
 
     ax.set_xlabel("Time (min)")
     ax.set_ylabel("Job ID")
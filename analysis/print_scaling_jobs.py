@@ -1,17 +1,16 @@
-import json
+import numpy as np
+
+from pipeline import run_pipeline
 
 
 def main():
-    with open("jobs_executed.json", "r") as json_file:
-        jobs = json.load(json_file)
+    jobs = run_pipeline(["simulate"])["simulate"]
 
-    print(f"num jobs {len(jobs)}")
+    print(f"num jobs {len(jobs['mw_start_time'])}")
 
-    jobs_with_scaling = 0
-    for jo in jobs:
-        if "scale_up" in jo or "scale_down" in jo:
-            #  print(jo)
-            jobs_with_scaling = jobs_with_scaling + 1
+    num_scale_ups = np.diff(jobs["scale_up_offsets"])
+    num_scale_downs = np.diff(jobs["scale_down_offsets"])
+    jobs_with_scaling = np.count_nonzero((num_scale_ups > 0) | (num_scale_downs > 0))
 
     print(f"jobs with scaling {jobs_with_scaling}")
 
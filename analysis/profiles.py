@@ -0,0 +1,206 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import trace_analysis_mw
+from job_table import load_job_table
+from trace_archive import CACHE_DIR
+
+PROFILE_DIR = os.path.join(CACHE_DIR, "profiles")
+# Bumped when the profile columns change.
+FORMAT_VERSION = 1
+GROUP_KEYS = {"user": "users", "vc": "vcs"}
+QUANTILES = [0.5, 0.9, 0.99]
+
+# A profile table is a flat dict of numpy arrays with one row per user or VC
+# that submitted jobs, in order of its code:
+#     'group': The code of the user or VC in the job table.
+#     'name': Its name.
+#     'jobs', 'attempts': The number of jobs and of their attempts.
+#     'retried': The number of jobs with more than one attempt.
+#     'retry_rate': retried / jobs.
+#     'gpu_hours': The GPU hours of all attempts with a start and end.
+#     'mean_num_gpus': The mean GPUs of the jobs' first attempts.
+#     'status_<status>': The number of jobs with each status, e.g.
+#                        'status_Pass'.
+#     'runtime_p50', 'runtime_p90', 'runtime_p99': Quantiles of the run time
+#         in minutes (see job_metrics), NaN without any known run time.
+#     'queueing_delay_p50': The median queueing delay of the first attempts
+#         in minutes.
+#     'first_submitted', 'last_submitted': UTC seconds.
+# Everything is computed from one sort of the job table by group (see
+# build_profiles).
+
+
+def job_metrics(table: dict) -> dict:
+    """Computes per-job metrics of a job table with segmented reductions over
+    the attempts.
+
+    Returns:
+        A dict of arrays with one row per job:
+            'num_attempts': The number of attempts.
+            'gpu_hours': The GPU hours of the attempts with a start and end.
+            'runtime': From the first attempt's start to the last attempt's
+                       end in minutes, NaN if unknown.
+            'queueing_delay': From submission to the first attempt's start in
+                              minutes, NaN if unknown.
+        Unlike Job.run_time and Job.queueing_delay these are UTC durations,
+        an hour longer across the end of PDT.
+    """
+    offsets = table["attempt_offsets"]
+    num_attempts = np.diff(offsets)
+    duration = table["attempt_end"] - table["attempt_start"]
+    gpu_seconds = np.nan_to_num(duration) * table["attempt_num_gpus"]
+    gpu_hours = (
+        np.bincount(table["attempt_job"], gpu_seconds, minlength=len(num_attempts))
+        / 3600
+    )
+
+    runtime = np.full(len(num_attempts), np.nan)
+    queueing_delay = np.full(len(num_attempts), np.nan)
+    attempted = num_attempts > 0
+    first = offsets[:-1][attempted]
+    last = offsets[1:][attempted] - 1
+    first_start = table["attempt_start"][first]
+    runtime[attempted] = (table["attempt_end"][last] - first_start) / 60
+    queueing_delay[attempted] = (first_start - table["submitted_time"][attempted]) / 60
+    return {
+        "num_attempts": num_attempts,
+        "gpu_hours": gpu_hours,
+        "runtime": runtime,
+        "queueing_delay": queueing_delay,
+    }
+
+
+def _segment_quantiles(values, starts, counts, quantiles) -> np.ndarray:
+    """Returns quantiles of sorted segments of values.
+
+    Segment i is values[starts[i]:starts[i] + counts[i]], sorted, and
+    quantiles interpolate linearly like np.quantile. Empty segments get NaN.
+
+    Returns:
+        An array of shape (len(quantiles), len(starts)).
+    """
+    result = np.full((len(quantiles), len(starts)), np.nan)
+    known = counts > 0
+    starts, counts = starts[known], counts[known]
+    for i, q in enumerate(quantiles):
+        position = q * (counts - 1)
+        lo = np.floor(position).astype(np.int64)
+        hi = np.minimum(lo + 1, counts - 1)
+        below = values[starts + lo]
+        above = values[starts + hi]
+        result[i, known] = below + (above - below) * (position - lo)
+    return result
+
+
+def build_profiles(table: dict, by: str = "user") -> dict:
+    """Builds the profile table (see above) of the users or VCs of a job
+    table.
+
+    The jobs are sorted once, by group and, within a group, by run time with
+    unknown run times last, so every count and sum is a reduceat over the
+    group's segment and run time quantiles are read off it.
+
+    Args:
+        table: A job table (see job_table).
+        by: One of GROUP_KEYS.
+    """
+    metrics = job_metrics(table)
+    key = table[by]
+    runtime = metrics["runtime"]
+    order = np.lexsort((runtime, np.isnan(runtime), key))
+    key = key[order]
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    counts = np.diff(np.r_[starts, len(key)])
+    groups = key[starts].astype(np.int64)
+
+    def total(values):
+        return np.add.reduceat(values[order], starts)
+
+    num_attempts = metrics["num_attempts"]
+    retried = total((num_attempts > 1).astype(np.int64))
+    num_gpus = table["num_gpus"]
+    profiles = {
+        "group": groups,
+        "name": table[GROUP_KEYS[by]][groups],
+        "jobs": counts,
+        "attempts": total(num_attempts),
+        "retried": retried,
+        "retry_rate": retried / counts,
+        "gpu_hours": total(metrics["gpu_hours"]),
+        "mean_num_gpus": total(num_gpus.astype(np.float64)) / counts,
+    }
+    status = table["status"][order]
+    for code, name in enumerate(table["statuses"]):
+        profiles[f"status_{name}"] = np.add.reduceat(
+            (status == code).astype(np.int64), starts
+        )
+
+    known = total((~np.isnan(runtime)).astype(np.int64))
+    quantiles = _segment_quantiles(runtime[order], starts, known, QUANTILES)
+    for q, values in zip(QUANTILES, quantiles):
+        profiles[f"runtime_p{round(q * 100)}"] = values
+
+    # The delays are not sorted by the one sort, so the median sorts within
+    # the segments, still without a group loop.
+    delay = metrics["queueing_delay"][order]
+    segment = np.repeat(np.arange(len(starts)), counts)
+    by_delay = np.lexsort((delay, np.isnan(delay), segment))
+    known = np.bincount(segment, ~np.isnan(delay), minlength=len(starts))
+    profiles["queueing_delay_p50"] = _segment_quantiles(
+        delay[by_delay], starts, known.astype(np.int64), [0.5]
+    )[0]
+
+    submitted = table["submitted_time"][order]
+    profiles["first_submitted"] = np.fmin.reduceat(submitted, starts)
+    profiles["last_submitted"] = np.fmax.reduceat(submitted, starts)
+    return profiles
+
+
+def profile_path(by: str, profile_dir: str = PROFILE_DIR) -> str:
+    return os.path.join(profile_dir, f"{by}.npz")
+
+
+def load_profiles(by: str = "user", profile_dir: str = PROFILE_DIR) -> dict:
+    """Returns the profile table of the full trace, building and caching it
+    once.
+
+    The cache is rebuilt if the trace's cluster_job_log changed.
+    """
+    path = profile_path(by, profile_dir)
+    fingerprint = {**trace_analysis_mw.trace_fingerprint(), "version": FORMAT_VERSION}
+    if os.path.exists(path):
+        with np.load(path) as f:
+            if json.loads(str(f["fingerprint"])) == fingerprint:
+                return {k: f[k] for k in f.files if k != "fingerprint"}
+    profiles = build_profiles(load_job_table(), by)
+    os.makedirs(profile_dir, exist_ok=True)
+    np.savez(path, fingerprint=json.dumps(fingerprint), **profiles)
+    return profiles
+
+
+def profile_frame(profiles: dict) -> pd.DataFrame:
+    """Returns a profile table as a DataFrame indexed by name."""
+    return pd.DataFrame({k: v for k, v in profiles.items() if k != "name"}).set_index(
+        pd.Index(profiles["name"], name="name")
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prints user or VC profiles.")
+    parser.add_argument("--by", choices=list(GROUP_KEYS), default="user")
+    parser.add_argument("--sort", default="gpu_hours", help="column to sort by")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    frame = profile_frame(load_profiles(args.by))
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(frame.sort_values(args.sort, ascending=False).head(args.top))
+
+
+if __name__ == "__main__":
+    main()
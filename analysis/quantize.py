@@ -0,0 +1,246 @@
+import numpy as np
+
+# Utilization is stored as integer codes of a uniform grid over [0, 100]
+# percent, with the largest code of the type reserved for NA:
+#
+#     codec     bytes  step          maximum error
+#     'uint8'   1      100 / 254     0.197 percentage points
+#     'uint16'  2      100 / 65534   0.00077 percentage points
+#
+# The maximum error is half a step. It holds for values within [0, 100];
+# values outside are clipped first. Compared to float32 minute data, 'uint8'
+# is 4x smaller and 'uint16' 2x (8x and 4x compared to float64).
+#
+# Prefix sums of codes are stored as their absolute values every BLOCK
+# positions plus offsets from the value of their block (see
+# block_prefix_encode). An offset sums at most BLOCK - 1 codes, so with
+# 'uint8' it fits a uint16, and counts of at most BLOCK - 1 fit a uint8.
+CODECS = {"uint8": np.uint8, "uint16": np.uint16}
+MAX_UTIL = 100.0
+BLOCK = 256
+
+
+def na_code(codec: str) -> int:
+    return np.iinfo(CODECS[codec]).max
+
+
+def step(codec: str) -> float:
+    return MAX_UTIL / (na_code(codec) - 1)
+
+
+def max_error(codec: str) -> float:
+    """Returns the largest difference between a value and its decoding."""
+    return step(codec) / 2
+
+
+def encode_util(values, codec: str) -> np.ndarray:
+    """Quantizes utilization percentages, mapping NaN to the NA code."""
+    values = np.asarray(values, dtype=np.float32)
+    codes = np.rint(np.clip(values, 0, MAX_UTIL) / step(codec))
+    codes[np.isnan(values)] = na_code(codec)
+    return codes.astype(CODECS[codec])
+
+
+def decode_util(codes, codec: str) -> np.ndarray:
+    """Returns the float32 utilization of codes, NaN for the NA code."""
+    codes = np.asarray(codes)
+    values = codes.astype(np.float32) * np.float32(step(codec))
+    values[codes == na_code(codec)] = np.nan
+    return values
+
+
+def sum_dtype(codec: str, length: int):
+    """Returns the smallest integer type that holds the sum of length codes."""
+    dtype = _smallest_uint((na_code(codec) - 1) * length)
+    return np.int64 if dtype == np.uint64 else dtype
+
+
+class DecodedArray:
+    """A read-only array that decodes its stored values when indexed.
+
+    Analyses index it like the decoded array, e.g. a['util'][m, g, t0:t1],
+    and get decoded numpy arrays back, so a memory-mapped encoded array only
+    ever decodes the part that is read.
+    """
+
+    def __init__(self, stored, decode, dtype):
+        self.stored = stored
+        self.decode = decode
+        self.dtype = np.dtype(dtype)
+
+    @property
+    def shape(self):
+        return self.stored.shape
+
+    @property
+    def ndim(self):
+        return self.stored.ndim
+
+    @property
+    def nbytes(self):
+        return self.stored.nbytes
+
+    def __len__(self):
+        return len(self.stored)
+
+    def __getitem__(self, key):
+        return self.decode(self.stored[key])
+
+    def __array__(self, dtype=None, copy=None):
+        values = self.decode(self.stored[...])
+        return values if dtype is None else values.astype(dtype)
+
+
+def decoded_util(codes, codec: str) -> DecodedArray:
+    return DecodedArray(codes, lambda c: decode_util(c, codec), np.float32)
+
+
+def scaled_sums(sums, codec: str) -> DecodedArray:
+    """Views prefix sums of codes as prefix sums of utilization."""
+    s = step(codec)
+    return DecodedArray(sums, lambda c: np.asarray(c, dtype=np.float64) * s, np.float64)
+
+
+def block_prefix_encode(prefix: np.ndarray, offset_dtype, block: int = BLOCK):
+    """Splits prefix sums along the last axis into the values at every
+    block-th position and the offsets of all positions from those.
+
+    Returns:
+        A pair (blocks, offsets), where offsets has the shape of prefix.
+    """
+    blocks = prefix[..., ::block]
+    base = np.repeat(blocks, block, axis=-1)[..., : prefix.shape[-1]]
+    return blocks, (prefix - base).astype(offset_dtype)
+
+
+class BlockPrefixArray:
+    """A read-only view of the output of block_prefix_encode as the int64
+    prefix sums.
+
+    It is indexed with integers or integer arrays, the last index being the
+    position, e.g. a[machine, gpu, end] - a[machine, gpu, start].
+    """
+
+    def __init__(self, blocks, offsets, block: int = BLOCK):
+        self.blocks = blocks
+        self.offsets = offsets
+        self.block = block
+        self.dtype = np.dtype(np.int64)
+
+    @property
+    def shape(self):
+        return self.offsets.shape
+
+    @property
+    def ndim(self):
+        return self.offsets.ndim
+
+    @property
+    def nbytes(self):
+        return self.blocks.nbytes + self.offsets.nbytes
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, key):
+        *rows, position = key
+        block = np.asarray(position) // self.block
+        values = self.blocks[(*rows, block)].astype(np.int64)
+        return values + self.offsets[key]
+
+
+def missing_runs(missing: np.ndarray, base: int = 0) -> tuple:
+    """Run-length encodes the True positions of a boolean array, flattened.
+
+    Args:
+        missing: The boolean array, e.g. of NA codes.
+        base: Added to the flat positions, to encode an array in parts.
+
+    Returns:
+        A tuple (starts, ends) of the flat positions [start, end) of the runs.
+    """
+    flat = np.concatenate([[False], np.ravel(missing), [False]])
+    edges = np.flatnonzero(flat[1:] != flat[:-1])
+    return edges[::2] + base, edges[1::2] + base
+
+
+class ValidCountArray:
+    """A read-only view of the prefix counts of valid samples of an array of
+    shape[:-1] rows of shape[-1] - 1 samples, from missing_runs of its NA
+    samples.
+
+    Missing samples are rare and come in long runs (servers that are off or
+    not yet in the cluster), so the runs take far less space than the
+    counts. It is indexed like BlockPrefixArray.
+    """
+
+    def __init__(self, starts, ends, shape: tuple):
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+        lengths = self.ends - self.starts
+        self.before = np.cumsum(lengths) - lengths
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(np.int64)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def nbytes(self):
+        return self.starts.nbytes + self.ends.nbytes + self.before.nbytes
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _missing_before(self, flat):
+        run = np.searchsorted(self.starts, flat, side="right") - 1
+        safe = np.maximum(run, 0)
+        inside = np.minimum(
+            flat - self.starts[safe], self.ends[safe] - self.starts[safe]
+        )
+        return np.where(run >= 0, self.before[safe] + inside, 0)
+
+    def __getitem__(self, key):
+        *rows, position = key
+        position = np.asarray(position, dtype=np.int64)
+        row = np.ravel_multi_index(np.broadcast_arrays(*rows), self.shape[:-1]).astype(
+            np.int64
+        )
+        base = row * (self.shape[-1] - 1)
+        return position - (
+            self._missing_before(base + position) - self._missing_before(base)
+        )
+
+
+def _smallest_uint(max_value: int):
+    for dtype in [np.uint8, np.uint16, np.uint32]:
+        if max_value <= np.iinfo(dtype).max:
+            return dtype
+    return np.uint64
+
+
+def delta_zigzag_encode(values, axis: int = -1) -> tuple:
+    """Losslessly encodes integer series that rarely change, e.g. mem_total.
+
+    The series are replaced by their first values and the zigzag-encoded
+    differences of consecutive values, which are mostly 0 and stored in the
+    smallest unsigned type that holds them; they compress very well.
+
+    Returns:
+        A pair (first, deltas).
+    """
+    values = np.asarray(values, dtype=np.int64)
+    first = np.take(values, [0], axis=axis)
+    deltas = np.diff(values, axis=axis)
+    zigzag = ((deltas << 1) ^ (deltas >> 63)).view(np.uint64)
+    max_value = int(zigzag.max()) if zigzag.size else 0
+    return first, zigzag.astype(_smallest_uint(max_value))
+
+
+def delta_zigzag_decode(first, deltas, axis: int = -1) -> np.ndarray:
+    """Inverts delta_zigzag_encode."""
+    zigzag = np.asarray(deltas, dtype=np.uint64)
+    one = np.uint64(1)
+    deltas = (zigzag >> one).astype(np.int64) ^ -(zigzag & one).astype(np.int64)
+    return np.cumsum(np.concatenate([first, deltas], axis=axis), axis=axis)
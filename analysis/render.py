@@ -0,0 +1,136 @@
+import concurrent.futures
+import os
+
+import numpy as np
+
+MAX_CDF_POINTS = 4000
+FIGURE_FORMAT = "png"
+
+
+def decimate_cdf(x, y, max_points: int = MAX_CDF_POINTS, log_x: bool = False):
+    """Thins a CDF to at most max_points points without visibly changing it.
+
+    Half of the points are taken at evenly spaced ranks, which bounds the
+    vertical error of the drawn curve by 100 / (max_points / 2) percentage
+    points. The other half are taken at evenly spaced x positions (in log
+    space if log_x), so that long flat tails keep their shape. The first and
+    last points are always kept.
+
+    Args:
+        x: The sorted data, as returned by get_cdf.
+        y: The CDF values, as returned by get_cdf.
+        max_points: The maximum number of points kept.
+        log_x: Whether the CDF is plotted on a log x axis.
+
+    Returns:
+        A pair of arrays (x, y).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n <= max_points:
+        return x, y
+    by_rank = np.linspace(0, n - 1, max_points // 2).astype(np.int64)
+    lo, hi = x[0], x[-1]
+    if log_x and lo > 0:
+        grid = np.geomspace(lo, hi, max_points - len(by_rank))
+    else:
+        grid = np.linspace(lo, hi, max_points - len(by_rank))
+    by_value = np.minimum(np.searchsorted(x, grid), n - 1)
+    keep = np.unique(np.concatenate([by_rank, by_value, [0, n - 1]]))
+    return x[keep], y[keep]
+
+
+def cdf_line(x, y, log_x: bool = False, **style) -> dict:
+    """Returns a decimated line spec for a CDF (see figure specs below)."""
+    x, y = decimate_cdf(x, y, log_x=log_x)
+    return {"x": x, "y": y, **style}
+
+
+# A figure spec is a picklable dict describing one figure:
+#     'name': The file name of the figure without extension.
+#     'lines': A list of dicts with 'x' and 'y' and optionally 'label',
+#              'color' and 'linestyle'.
+#     'mesh': Optionally a dict with bin edges 'x' and 'y' and a 2D array
+#             'counts' of shape (len(y) - 1, len(x) - 1), drawn as a heatmap
+#             with a log color scale and empty bins left blank, and
+#             optionally the colorbar 'label'.
+#     'title', 'xlabel', 'ylabel', 'xscale', 'xlim', 'ylim', 'legend_loc',
+#     'grid': Optional axes settings.
+
+
+def draw_figure(spec: dict, ax):
+    """Draws a figure spec into matplotlib axes."""
+    if "mesh" in spec:
+        from matplotlib.colors import LogNorm
+
+        mesh = spec["mesh"]
+        counts = np.ma.masked_equal(mesh["counts"], 0)
+        image = ax.pcolormesh(mesh["x"], mesh["y"], counts, norm=LogNorm())
+        ax.figure.colorbar(image, ax=ax, label=mesh.get("label", "Count"))
+    for line in spec["lines"]:
+        style = {k: line[k] for k in ["label", "color", "linestyle"] if k in line}
+        ax.plot(line["x"], line["y"], **style)
+    if "title" in spec:
+        ax.set_title(spec["title"])
+    if "legend_loc" in spec:
+        ax.legend(loc=spec["legend_loc"])
+    if "xscale" in spec:
+        ax.set_xscale(spec["xscale"])
+    if "xlim" in spec:
+        ax.set_xlim(*spec["xlim"])
+    if "ylim" in spec:
+        ax.set_ylim(*spec["ylim"])
+    if "xlabel" in spec:
+        ax.set_xlabel(spec["xlabel"])
+    if "ylabel" in spec:
+        ax.set_ylabel(spec["ylabel"])
+    if spec.get("grid"):
+        ax.grid(alpha=0.3, linestyle="--")
+
+
+def render_figure(spec: dict, out_dir: str, fmt: str = FIGURE_FORMAT) -> str:
+    """Renders a figure spec to a file without going through pyplot.
+
+    A bare Figure renders with the non-interactive Agg canvas, so this works
+    on headless nodes and never blocks.
+    """
+    from matplotlib.figure import Figure
+
+    fig = Figure()
+    draw_figure(spec, fig.subplots())
+    path = os.path.join(out_dir, f"{spec['name']}.{fmt}")
+    fig.savefig(path)
+    return path
+
+
+def render_figures(
+    specs: list, out_dir: str, fmt: str = FIGURE_FORMAT, processes: int = None
+) -> list:
+    """Renders figure specs to files in a process pool.
+
+    Args:
+        specs: A list of figure specs.
+        out_dir: The output directory.
+        fmt: The file format, e.g. 'png' or 'pdf'.
+        processes: The number of worker processes, os.cpu_count() if None.
+
+    Returns:
+        The paths of the written files.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    if len(specs) <= 1 or processes == 1:
+        return [render_figure(spec, out_dir, fmt) for spec in specs]
+    with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+        futures = [pool.submit(render_figure, spec, out_dir, fmt) for spec in specs]
+        return [f.result() for f in futures]
+
+
+def show_figures(specs: list):
+    """Draws figure specs into interactive pyplot windows."""
+    import matplotlib.pyplot as plt
+
+    for spec in specs:
+        fig, ax = plt.subplots()
+        draw_figure(spec, ax)
+    plt.show()
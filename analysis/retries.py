@@ -0,0 +1,267 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from job_table import load_job_table
+from trace_analysis_mw import get_cdf
+
+# Attempt counts are binned exactly, with every count >= MAX_ATTEMPTS in the
+# last bin.
+MAX_ATTEMPTS = 10
+# calc_deltas leaves out attempts shorter than this many seconds.
+SHORT_ATTEMPT = 2 * 60
+# How the servers of a retry compare with those of the attempt before it.
+MACHINE_CHANGES = ["same", "partial", "moved", "unknown"]
+
+# The analysis runs on the attempt rows of a job table (see job_table), which
+# are flat and grouped by job by 'attempt_offsets', so a retry is an attempt
+# with 'attempt_index' > 0 and the attempt before it is the previous row.
+# Nothing loops over jobs or attempts.
+
+
+def attempt_histogram(table: dict, max_attempts: int = MAX_ATTEMPTS) -> np.ndarray:
+    """Counts jobs by status and number of attempts.
+
+    Returns:
+        An int64 array of shape (statuses, max_attempts + 1), where column k
+        counts the jobs with k attempts and the last column those with
+        max_attempts or more.
+    """
+    num_attempts = np.minimum(np.diff(table["attempt_offsets"]), max_attempts)
+    shape = (len(table["statuses"]), max_attempts + 1)
+    flat = np.ravel_multi_index((table["status"].astype(np.int64), num_attempts), shape)
+    return np.bincount(flat, minlength=np.prod(shape)).reshape(shape)
+
+
+def retry_attempts(table: dict) -> dict:
+    """Compares every retry with the attempt before it.
+
+    The servers two attempts share are found with one np.isin over
+    (attempt, machine) keys of the details.
+
+    Returns:
+        A dict of arrays with one row per retry:
+            'attempt': The attempt row.
+            'job': The job row.
+            'index': The position of the attempt within its job.
+            'gap': From the end of the previous attempt to the start of
+                   this one in minutes, NaN if either time is missing.
+            'num_servers', 'previous_servers': The servers of this and the
+                                               previous attempt.
+            'shared_servers': The servers both ran on.
+            'change': A code into MACHINE_CHANGES: 'same' servers, 'partial'
+                      overlap, 'moved' to only new servers, or 'unknown' if
+                      either attempt has no servers.
+    """
+    attempt = np.flatnonzero(table["attempt_index"] > 0)
+    previous = attempt - 1
+    num_servers = table["attempt_num_servers"][attempt]
+    previous_servers = table["attempt_num_servers"][previous]
+
+    num_machines = len(table["machines"])
+    detail_attempt = table["detail_attempt"].astype(np.int64)
+    keys = detail_attempt * num_machines + table["detail_machine"]
+    # A server is shared if the previous attempt row has a detail on it; for
+    # first attempts the previous row is another job's and is ignored below.
+    shared = np.isin(keys - num_machines, keys)
+    shared_servers = np.bincount(
+        detail_attempt, shared, minlength=len(table["attempt_job"])
+    ).astype(np.int64)[attempt]
+
+    change = np.select(
+        [
+            (num_servers == 0) | (previous_servers == 0),
+            (shared_servers == num_servers) & (shared_servers == previous_servers),
+            shared_servers == 0,
+        ],
+        [3, 0, 2],
+        1,
+    ).astype(np.int8)
+    return {
+        "attempt": attempt,
+        "job": table["attempt_job"][attempt],
+        "index": table["attempt_index"][attempt],
+        "gap": (table["attempt_start"][attempt] - table["attempt_end"][previous]) / 60,
+        "num_servers": num_servers,
+        "previous_servers": previous_servers,
+        "shared_servers": shared_servers,
+        "change": change,
+    }
+
+
+def wasted_gpu_hours(table: dict) -> dict:
+    """Sums the GPU hours of attempts that did not complete their job, by VC
+    and status.
+
+    Every attempt but the last is wasted, and so is the last one of jobs that
+    did not pass. Attempts without a start or end count 0 hours.
+
+    Returns:
+        A dict with arrays of shape (VCs, statuses):
+            'wasted': The wasted GPU hours.
+            'total': The GPU hours of all attempts.
+            'short': The wasted GPU hours of attempts shorter than
+                     SHORT_ATTEMPT, which calc_deltas leaves out.
+    """
+    job = table["attempt_job"]
+    duration = table["attempt_end"] - table["attempt_start"]
+    gpu_hours = np.nan_to_num(duration) * table["attempt_num_gpus"] / 3600
+    # A table without a passed job, e.g. of a small sub-trace, has no 'Pass'
+    # status, and then no attempt completed its job.
+    passed = np.isin(table["status"][job], np.flatnonzero(table["statuses"] == "Pass"))
+    last = np.zeros(len(job), dtype=bool)
+    last[table["attempt_offsets"][1:][np.diff(table["attempt_offsets"]) > 0] - 1] = True
+    wasted = ~last | ~passed
+    short = wasted & (duration < SHORT_ATTEMPT)
+
+    shape = (len(table["vcs"]), len(table["statuses"]))
+    flat = np.ravel_multi_index(
+        (table["vc"][job].astype(np.int64), table["status"][job].astype(np.int64)),
+        shape,
+    )
+
+    def total(weights):
+        return np.bincount(flat, weights, minlength=np.prod(shape)).reshape(shape)
+
+    return {
+        "wasted": total(np.where(wasted, gpu_hours, 0)),
+        "total": total(gpu_hours),
+        "short": total(np.where(short, gpu_hours, 0)),
+    }
+
+
+def retry_summary(table: dict, retries: dict = None) -> pd.DataFrame:
+    """Summarizes retries per job status.
+
+    Returns:
+        A DataFrame indexed by status with the number of jobs, the fraction
+        retried, the mean attempts per job, the median and 90th percentile
+        gap in minutes, the fraction of retries of each MACHINE_CHANGES kind
+        and the wasted GPU hours and their share of the status's total.
+    """
+    if retries is None:
+        retries = retry_attempts(table)
+    num_attempts = np.diff(table["attempt_offsets"])
+    df = pd.DataFrame(
+        {
+            "status": table["status"],
+            "attempts": num_attempts,
+            "retried": num_attempts > 1,
+        }
+    )
+    grouped = df.groupby("status")
+    summary = pd.DataFrame(
+        {
+            "jobs": grouped.size(),
+            "retried": grouped["retried"].mean(),
+            "mean_attempts": grouped["attempts"].mean(),
+        }
+    )
+
+    status = table["status"][retries["job"]]
+    gaps = pd.Series(retries["gap"]).groupby(status)
+    summary["gap_p50"] = gaps.median()
+    summary["gap_p90"] = gaps.quantile(0.9)
+    changes = np.bincount(
+        status.astype(np.int64) * len(MACHINE_CHANGES) + retries["change"],
+        minlength=len(table["statuses"]) * len(MACHINE_CHANGES),
+    ).reshape(len(table["statuses"]), len(MACHINE_CHANGES))
+    num_retries = np.maximum(changes.sum(axis=1, keepdims=True), 1)
+    for i, name in enumerate(MACHINE_CHANGES):
+        summary[name] = (changes[:, i] / num_retries[:, 0])[summary.index]
+
+    hours = wasted_gpu_hours(table)
+    wasted = hours["wasted"].sum(axis=0)
+    total = hours["total"].sum(axis=0)
+    summary["wasted_gpu_hours"] = wasted[summary.index]
+    summary["wasted_share"] = (wasted / np.maximum(total, 1e-9))[summary.index]
+    summary.index = pd.Index(table["statuses"][summary.index], name="status")
+    return summary
+
+
+def wasted_frame(table: dict, hours: dict = None) -> pd.DataFrame:
+    """Returns the wasted GPU hours of wasted_gpu_hours as a DataFrame indexed
+    by VC, with a column per status and the wasted share of all GPU hours."""
+    if hours is None:
+        hours = wasted_gpu_hours(table)
+    df = pd.DataFrame(
+        hours["wasted"],
+        index=pd.Index(table["vcs"], name="vc"),
+        columns=table["statuses"],
+    )
+    df["short"] = hours["short"].sum(axis=1)
+    df["share"] = hours["wasted"].sum(axis=1) / np.maximum(
+        hours["total"].sum(axis=1), 1e-9
+    )
+    return df
+
+
+def histogram_frame(table: dict, counts: np.ndarray = None) -> pd.DataFrame:
+    """Returns attempt_histogram counts as a DataFrame indexed by status."""
+    if counts is None:
+        counts = attempt_histogram(table)
+    columns = [str(k) for k in range(counts.shape[1])]
+    columns[-1] = f">={counts.shape[1] - 1}"
+    return pd.DataFrame(
+        counts, index=pd.Index(table["statuses"], name="status"), columns=columns
+    )
+
+
+def retry_figures(table: dict, retries: dict = None) -> list:
+    """Returns the figure specs of the CDFs of the gaps before retries, per
+    job status.
+
+    Gaps that are missing or not positive are left out of the log-scale
+    plot.
+    """
+    from render import cdf_line
+
+    if retries is None:
+        retries = retry_attempts(table)
+    status = table["status"][retries["job"]]
+    lines = []
+    for code, name in enumerate(table["statuses"]):
+        gaps = retries["gap"][(status == code) & (retries["gap"] > 0)]
+        if len(gaps) < 2:
+            continue
+        x, y = get_cdf(gaps)
+        lines.append(cdf_line(x, y, log_x=True, label=name))
+    if not lines:
+        return []
+    return [
+        {
+            "name": "retry_gaps",
+            "lines": lines,
+            "xscale": "log",
+            "xlabel": "Gap before retry (min)",
+            "ylabel": "CDF",
+            "legend_loc": "lower right",
+            "grid": True,
+        }
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Summarize retries and failed attempts of the trace."
+    )
+    parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+    parser.add_argument("--out-dir", default="figures")
+    args = parser.parse_args()
+
+    from render import render_figures
+
+    table = load_job_table()
+    retries = retry_attempts(table)
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(histogram_frame(table, attempt_histogram(table, args.max_attempts)))
+        print()
+        print(retry_summary(table, retries))
+        print()
+        print(wasted_frame(table))
+    render_figures(retry_figures(table, retries), args.out_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import quantize
+import trace_analysis_mw
+import utilization
+from timeindex import local_minute, minutes_to_local
+from trace_archive import CACHE_DIR
+
+ROLLUP_DIR = os.path.join(CACHE_DIR, "rollups")
+METRICS = ["gpu", "cpu", "mem"]
+TRACE_FILES = {
+    "gpu": "cluster_gpu_util",
+    "cpu": "cluster_cpu_util",
+    "mem": "cluster_mem_util",
+}
+# The width of each level in minutes, finest first. Every level's width
+# divides the next one's, so each level is built from the one below it.
+LEVELS = {"minute": 1, "5min": 5, "hour": 60, "day": 24 * 60}
+STATS = ["mean", "max", "count"]
+# 00:00 PST in UTC minutes since the epoch, modulo a day.
+ALIGN_MINUTE = 8 * 60
+# Part of the cache key, like utilization.FORMAT_VERSION.
+FORMAT_VERSION = 2
+
+# The rollups of a metric hold, for every level, the mean, max and number of
+# valid samples of each machine's utilization (per GPU for 'gpu') in each
+# bin, as arrays of shape (machines, channels, bins):
+#     'machines': The sorted machine ids.
+#     'levels': A dict mapping each level to a dict with its 'start_minute',
+#               the minute the first bin starts at, and its arrays 'mean'
+#               (float32, NaN for empty bins), 'max' (float32) and 'count'
+#               (int32).
+# Bins of coarser levels start at multiples of their width after
+# ALIGN_MINUTE, so days run from midnight to midnight of local standard time
+# (PST), or from 1am to 1am while PDT is in effect. The minute level is
+# the minute data itself: the utilization cube's for 'gpu', and an array
+# stored with the rollups for 'cpu' and 'mem', both stored with the codec
+# they were built with and decoded when indexed (see quantize). Memory
+# utilization is the used fraction of mem_total in percent; the per-minute
+# mem_total of each machine is stored delta/zigzag-encoded in MEM_TOTALS and
+# read with load_mem_totals.
+MEM_TOTALS = "mem_total.npz"
+
+
+def _read_minutes(metric: str, path: str, codec: str = None):
+    """Writes the minute data of a metric, returns (machines, start, array)."""
+    # Memory is read as float64, which holds the totals exactly.
+    machines, codes, minutes, values = utilization.read_machine_series(
+        TRACE_FILES[metric], dtype=np.float64 if metric == "mem" else np.float32
+    )
+    if metric == "mem":
+        total, free = values[:, 0], values[:, 1]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            used = np.where(total > 0, 100 * (total - free) / total, np.nan)
+        _write_mem_totals(os.path.dirname(path), machines, codes, minutes, total)
+        values = used[:, None].astype(np.float32)
+    machines, start, util = utilization.write_minute_array(
+        path, machines, codes, minutes, values, codec
+    )
+    if codec is not None:
+        util = quantize.decoded_util(util, codec)
+    return machines, start, util
+
+
+def _write_mem_totals(rollup_dir: str, machines, codes, minutes, total):
+    """Stores the per-minute mem_total of each machine, 0 where it is NA.
+
+    Totals only change when a machine is reconfigured, so nearly all deltas
+    are 0 and the file is orders of magnitude smaller than the int64 series.
+    """
+    order = np.argsort(machines)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    start = int(minutes.min())
+    totals = np.zeros((len(machines), int(minutes.max()) - start + 1), np.int64)
+    totals[rank[codes], minutes - start] = np.nan_to_num(total).astype(np.int64)
+    first, deltas = quantize.delta_zigzag_encode(totals, axis=1)
+    np.savez_compressed(
+        os.path.join(rollup_dir, MEM_TOTALS),
+        machines=machines[order],
+        start_minute=start,
+        first=first,
+        deltas=deltas,
+    )
+
+
+def load_mem_totals(rollup_dir: str = ROLLUP_DIR) -> dict:
+    """Returns the 'machines', 'start_minute' and per-minute mem_total of
+    every machine as an int64 array 'total' of shape (machines, minutes)."""
+    load_rollups("mem", rollup_dir)
+    with np.load(os.path.join(rollup_dir, "mem", MEM_TOTALS)) as f:
+        return {
+            "machines": f["machines"],
+            "start_minute": int(f["start_minute"]),
+            "total": quantize.delta_zigzag_decode(f["first"], f["deltas"], axis=1),
+        }
+
+
+def _roll_up(mean, maximum, count, offset: int, ratio: int, num_bins: int):
+    """Combines groups of ratio consecutive bins of one machine's level.
+
+    Args:
+        mean, maximum, count: Arrays of shape (channels, bins) of the finer
+                              level.
+        offset: The number of finer bins missing before the first one, to
+                align the groups.
+        ratio: The number of finer bins per coarser bin.
+        num_bins: The number of coarser bins.
+    """
+    channels, bins = count.shape
+    padded = num_bins * ratio
+    sums = np.zeros((channels, padded))
+    maxes = np.full((channels, padded), -np.inf, dtype=np.float32)
+    counts = np.zeros((channels, padded), dtype=np.int64)
+    has = count > 0
+    sums[:, offset : offset + bins] = np.where(has, mean, 0) * count
+    maxes[:, offset : offset + bins] = np.where(has, maximum, -np.inf)
+    counts[:, offset : offset + bins] = count
+    sums = sums.reshape(channels, num_bins, ratio).sum(axis=2)
+    maxes = maxes.reshape(channels, num_bins, ratio).max(axis=2)
+    counts = counts.reshape(channels, num_bins, ratio).sum(axis=2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (sums / counts).astype(np.float32)
+    maxes[counts == 0] = np.nan
+    return mean, maxes, counts.astype(np.int32)
+
+
+def _fingerprint(metric: str, codec: str) -> dict:
+    # The gpu minute data is the utilization cube's, built with the same
+    # codec.
+    return {
+        **trace_analysis_mw.trace_fingerprint(TRACE_FILES[metric]),
+        "version": FORMAT_VERSION,
+        "codec": codec,
+    }
+
+
+def build_rollups(
+    metric: str, rollup_dir: str = ROLLUP_DIR, codec: str = utilization.CODEC
+) -> dict:
+    """Builds the rollup pyramid of a metric (see above) into rollup_dir.
+
+    The codec is that of the minute data of 'cpu' and 'mem'; 'gpu' uses the
+    utilization cube built with it.
+    """
+    fingerprint = _fingerprint(metric, codec)
+    os.makedirs(rollup_dir, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=rollup_dir)
+    if metric == "gpu":
+        cube = utilization.load_utilization_cube(codec=codec)
+        machines, start, util = cube["machines"], cube["start_minute"], cube["util"]
+    else:
+        machines, start, util = _read_minutes(
+            metric, os.path.join(tmp, "minute.npy"), codec
+        )
+    meta = {
+        "machines": machines.tolist(),
+        "levels": {},
+        "codec": None if metric == "gpu" else codec,
+        "fingerprint": fingerprint,
+    }
+    end = start + util.shape[2]
+    previous_level, previous_start = None, start
+    for level, width in LEVELS.items():
+        if width == 1:
+            meta["levels"][level] = start
+            previous_level = level
+            continue
+        level_start = start - (start - ALIGN_MINUTE) % width
+        num_bins = -(-(end - level_start) // width)
+        arrays = {
+            stat: np.lib.format.open_memmap(
+                os.path.join(tmp, f"{level}_{stat}.npy"),
+                mode="w+",
+                dtype=np.int32 if stat == "count" else np.float32,
+                shape=(util.shape[0], util.shape[1], num_bins),
+            )
+            for stat in STATS
+        }
+        ratio = width // LEVELS[previous_level]
+        offset = (previous_start - level_start) // LEVELS[previous_level]
+        for m in range(util.shape[0]):
+            if previous_level == "minute":
+                u = util[m]
+                fine = (u, u, (~np.isnan(u)).astype(np.int32))
+            else:
+                fine = tuple(previous[stat][m] for stat in STATS)
+            coarse = _roll_up(*fine, offset, ratio, num_bins)
+            for stat, values in zip(STATS, coarse):
+                arrays[stat][m] = values
+        for array in arrays.values():
+            array.flush()
+        meta["levels"][level] = level_start
+        previous, previous_level, previous_start = arrays, level, level_start
+    del previous, arrays
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    path = os.path.join(rollup_dir, metric)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+    return load_rollups(metric, rollup_dir, rebuild=False)
+
+
+def load_rollups(
+    metric: str,
+    rollup_dir: str = ROLLUP_DIR,
+    rebuild: bool = True,
+    codec: str = utilization.CODEC,
+):
+    """Memory-maps the rollups of a metric, building them first if they are
+    missing, the trace file changed or they were built with another
+    codec."""
+    path = os.path.join(rollup_dir, metric)
+    meta_path = os.path.join(path, "meta.json")
+    if os.path.exists(meta_path):
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        if not rebuild or meta["fingerprint"] == _fingerprint(metric, codec):
+            levels = {}
+            for level, start in meta["levels"].items():
+                if LEVELS[level] == 1:
+                    if metric == "gpu":
+                        cube = utilization.load_utilization_cube(codec=codec)
+                        util = cube["util"]
+                    else:
+                        util = np.load(os.path.join(path, "minute.npy"), mmap_mode="r")
+                        if meta.get("codec") is not None:
+                            util = quantize.decoded_util(util, meta["codec"])
+                    arrays = {"util": util}
+                else:
+                    arrays = {
+                        stat: np.load(
+                            os.path.join(path, f"{level}_{stat}.npy"), mmap_mode="r"
+                        )
+                        for stat in STATS
+                    }
+                levels[level] = {"start_minute": start, **arrays}
+            return {"machines": np.array(meta["machines"], dtype=str), "levels": levels}
+    return build_rollups(metric, rollup_dir, codec)
+
+
+def choose_level(start: int, end: int, resolution: int) -> str:
+    """Returns the coarsest level whose bins tile the requested bins.
+
+    Args:
+        start, end: The requested range in UTC minutes since the epoch.
+        resolution: The requested bin width in minutes.
+    """
+    for level in reversed(LEVELS):
+        width = LEVELS[level]
+        aligned = (start - ALIGN_MINUTE) % width == 0 and (end - start) % width == 0
+        if resolution % width == 0 and aligned:
+            return level
+    return "minute"
+
+
+def _level_bins(level: dict, rows, b0: int, b1: int):
+    """Returns the (mean, max, count) of bins b0:b1 of a level for some
+    machines, with empty bins outside of the data."""
+    source = level["util"] if "util" in level else level["count"]
+    shape = (len(rows), source.shape[1], b1 - b0)
+    mean = np.full(shape, np.nan, dtype=np.float32)
+    maximum = np.full(shape, np.nan, dtype=np.float32)
+    count = np.zeros(shape, dtype=np.int32)
+    lo, hi = max(b0, 0), min(b1, source.shape[2])
+    if hi > lo:
+        if "util" in level:
+            u = level["util"][rows, :, lo:hi]
+            data = (u, u, ~np.isnan(u))
+        else:
+            data = tuple(level[stat][rows, :, lo:hi] for stat in STATS)
+        for out, values in zip([mean, maximum, count], data):
+            out[:, :, lo - b0 : hi - b0] = values
+    return mean, maximum, count
+
+
+def query(
+    metric: str,
+    start,
+    end,
+    resolution: int = 60,
+    machines: list = None,
+    per_machine: bool = False,
+    rollups: dict = None,
+) -> dict:
+    """Returns utilization statistics of a time range at a given resolution.
+
+    The statistics are read from the coarsest level of the pyramid whose bins
+    tile the requested ones, so a month at daily resolution reads 30 bins per
+    machine rather than 43200 minutes.
+
+    Args:
+        metric: One of METRICS.
+        start, end: The range [start, end) in the trace's local time, e.g.
+                    '2017-11-01' or a datetime (see timeindex.local_seconds).
+        resolution: The width of the returned bins in minutes.
+        machines: The machine ids to include, all machines if None.
+        per_machine: If True, returns statistics per machine, else across all
+                     included machines (and GPUs).
+        rollups: The output of load_rollups(metric), loaded if None.
+
+    Returns:
+        A dict with 'time', the local start of each bin as datetime64[m],
+        'level', the level read, and the bins' 'mean', 'max' and 'count' of
+        valid samples, of shape (bins,), or (machines, bins) with per_machine.
+        Means and maxima are NaN for bins without samples.
+    """
+    if rollups is None:
+        rollups = load_rollups(metric)
+    start, end = local_minute(start), local_minute(end)
+    num_bins = -(-(end - start) // resolution)
+    end = start + num_bins * resolution
+    level_name = choose_level(start, end, resolution)
+    level = rollups["levels"][level_name]
+    width = LEVELS[level_name]
+    if machines is None:
+        rows = np.arange(len(rollups["machines"]))
+    else:
+        rows = np.searchsorted(rollups["machines"], machines)
+        rows = np.minimum(rows, len(rollups["machines"]) - 1)
+        missing = rollups["machines"][rows] != np.asarray(machines)
+        if missing.any():
+            raise ValueError(f"Unknown machines: {np.asarray(machines)[missing]}")
+    # With the minute level, start need not be aligned to anything.
+    b0 = (start - level["start_minute"]) // width
+    b1 = b0 + (end - start) // width
+    mean, maximum, count = _level_bins(level, rows, b0, b1)
+    ratio = resolution // width
+    shape = mean.shape[:2] + (num_bins, ratio)
+    count = count.reshape(shape)
+    sums = np.where(count > 0, mean.reshape(shape), 0) * count
+    maximum = np.where(count > 0, maximum.reshape(shape), -np.inf)
+    axes = (3, 1) if per_machine else (3, 1, 0)
+    sums, count, maximum = (
+        sums.sum(axis=axes),
+        count.sum(axis=axes),
+        maximum.max(axis=axes),
+    )
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = sums / count
+    maximum = np.where(count > 0, maximum, np.nan)
+    return {
+        "time": minutes_to_local(start + np.arange(num_bins) * resolution),
+        "level": level_name,
+        "mean": mean,
+        "max": maximum,
+        "count": count,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Query utilization rollups of the trace."
+    )
+    parser.add_argument("metric", choices=METRICS)
+    parser.add_argument("start", help="e.g. 2017-11-01")
+    parser.add_argument("end", help="e.g. 2017-12-01")
+    parser.add_argument("--resolution", type=int, default=60, help="minutes")
+    parser.add_argument("--machines", nargs="+")
+    parser.add_argument(
+        "--codec",
+        choices=list(quantize.CODECS),
+        help="store the minute data quantized (lossy, see quantize)",
+    )
+    args = parser.parse_args()
+
+    result = query(
+        args.metric,
+        args.start,
+        args.end,
+        args.resolution,
+        args.machines,
+        rollups=load_rollups(args.metric, codec=args.codec),
+    )
+    print(f"level: {result['level']}")
+    for t, mean, maximum, count in zip(
+        result["time"], result["mean"], result["max"], result["count"]
+    ):
+        print(f"{t}  mean {mean:6.2f}  max {maximum:6.2f}  samples {count}")
+
+
+if __name__ == "__main__":
+    main()
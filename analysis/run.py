@@ -1,23 +1,34 @@
-from fit_runtime import fit_runtime
-from fit_scaling import fit_scaling
+import argparse
+
+import instrument
 from pick_job import pick_job
-from simulate_scheduler import simulate_scheduler
-from trace_analysis_mw import filter_jobs, jobs_to_dict, load_cluster_log
+from pipeline import PARAMS, run_pipeline
 
 
-def run():
-    jobs = load_cluster_log()
-    jobs = filter_jobs(jobs)
-    jobs.sort(key=lambda x: x.submitted_time)
-    jobs_dict = jobs_to_dict(jobs)
-    # fit_runtime(jobs_dict)
+def run(stretch: int = PARAMS["stretch"], sample_every: int = PARAMS["sample_every"]):
     # grid search for stretch to max scaling operations gave stretch=20
-    jobs_executed = simulate_scheduler(jobs_dict, sample_every=1, stretch=20)
     # grid search for sample to max scaling operations gave sample_every=15
-    # jobs_executed = simulate_scheduler(jobs_dict, sample_every=15, stretch=1)
-    fit_scaling(jobs_executed, relative_runtime=True)
-    pick_job(jobs_executed, 10)
+    # (with stretch=1)
+    results = run_pipeline(
+        ["export", "simulate", "fit", "plot"],
+        {"stretch": stretch, "sample_every": sample_every},
+    )
+    with instrument.stage("pick_job") as s:
+        s.set_items(10)
+        pick_job(results["simulate"], 10)
+    instrument.write_report()
 
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stretch", type=int, default=PARAMS["stretch"])
+    parser.add_argument("--sample-every", type=int, default=PARAMS["sample_every"])
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=f"write per-stage timings to {instrument.REPORT_PATH}",
+    )
+    args = parser.parse_args()
+    if args.profile and not instrument.enabled():
+        instrument.enable()
+    run(args.stretch, args.sample_every)
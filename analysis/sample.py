@@ -2,21 +2,24 @@ import json
 
 import numpy as np
 
+# Scales of the exponential distributions fitted to the trace's inter-arrival
+# times (fit_arrivals.py) and run times (fit_runtime.py), in seconds.
+ARRIVAL_SCALE = 168.23665708228316
+RUNTIME_SCALE = 19550.609413406524
+
 
 def main():
     np.random.seed(42)
     size = 20
 
     # arrival
-    arr_scale = 168.23665708228316
-    arr_samp = np.random.exponential(scale=arr_scale, size=size - 1)
+    arr_samp = np.random.exponential(scale=ARRIVAL_SCALE, size=size - 1)
     helper = [0]
     helper.extend(arr_samp)
     arr_samp = helper
 
     # runtime
-    runt_scale = 19550.609413406524
-    runt_samp = np.random.exponential(scale=runt_scale, size=size)
+    runt_samp = np.random.exponential(scale=RUNTIME_SCALE, size=size)
 
     prev_start = 0
     jobs = []
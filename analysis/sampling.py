@@ -0,0 +1,281 @@
+import argparse
+import math
+
+import numpy as np
+
+SEED = 42
+FRACTION = 0.02
+ALPHA = 0.05
+METHODS = ["stratified", "weighted", "thin", "stride"]
+
+# An alias table is a dict with, per outcome i, the 'prob' of keeping i and
+# the 'alias' drawn instead, so every draw takes one uniform index and one
+# uniform number whatever the number of outcomes (Vose's alias method).
+#
+# The samplers return sorted row indices, so a sample keeps the submission
+# order and times of the population, and a weight per sampled row: the number
+# of population rows it stands for. Weighted statistics of a sample estimate
+# those of the population.
+
+
+def alias_table(weights: np.ndarray) -> dict:
+    """Builds the alias table of drawing i with probability proportional to
+    weights[i], in O(len(weights)).
+
+    Raises:
+        ValueError: If the weights do not sum to a positive number.
+    """
+    weights = np.asarray(weights, dtype=float)
+    num = len(weights)
+    total = weights.sum()
+    if not total > 0:
+        raise ValueError(f"cannot draw from weights that sum to {total}")
+    scaled = (weights * (num / total)).tolist()
+    prob = np.ones(num)
+    alias = np.arange(num)
+    small = [i for i, p in enumerate(scaled) if p < 1]
+    large = [i for i, p in enumerate(scaled) if p >= 1]
+    while small and large:
+        s = small.pop()
+        g = large.pop()
+        prob[s] = scaled[s]
+        alias[s] = g
+        scaled[g] += scaled[s] - 1
+        (small if scaled[g] < 1 else large).append(g)
+    # What is left has probability 1 up to rounding.
+    return {"prob": prob, "alias": alias}
+
+
+def alias_draw(rng, table: dict, size: int) -> np.ndarray:
+    """Draws size outcomes, with replacement, from an alias table."""
+    i = rng.integers(len(table["prob"]), size=size)
+    return np.where(rng.random(size) < table["prob"][i], i, table["alias"][i])
+
+
+def stratum_codes(*keys) -> np.ndarray:
+    """Returns a code per row for the combination of its keys, e.g. GPU
+    bucket, VC and status."""
+    keys = np.stack([np.asarray(k, dtype=np.int64) for k in keys], axis=1)
+    return np.unique(keys, axis=0, return_inverse=True)[1].ravel()
+
+
+def stratified_sample(
+    rng, strata: np.ndarray, fraction: float, min_per_stratum: int = 1
+) -> tuple:
+    """Samples the same fraction of every stratum, without replacement.
+
+    Counts are rounded by largest remainder, so the sample size is that of
+    fraction, and then raised to min_per_stratum rows in every stratum.
+
+    Returns:
+        The sorted rows and their weights (see above).
+    """
+    strata = np.asarray(strata)
+    _, inverse, counts = np.unique(strata, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+    want = counts * fraction
+    take = np.floor(want).astype(np.int64)
+    extra = int(round(want.sum())) - take.sum()
+    if extra > 0:
+        take[np.argsort(take - want, kind="stable")[:extra]] += 1
+    take = np.minimum(np.maximum(take, min_per_stratum), counts)
+    # A random order within each stratum, of which the first take are kept.
+    order = np.lexsort((rng.random(len(strata)), inverse))
+    rank = np.arange(len(strata)) - np.repeat(np.cumsum(counts) - counts, counts)
+    rows = np.sort(order[rank < np.repeat(take, counts)])
+    return rows, (counts / np.maximum(take, 1))[inverse[rows]]
+
+
+def weighted_sample(rng, weights: np.ndarray, size: int) -> tuple:
+    """Samples size rows with replacement, each with probability proportional
+    to its weight, e.g. its GPU hours.
+
+    Rows of weight 0, e.g. jobs that never ran, are never drawn, so the
+    Hansen-Hurwitz weights only estimate totals and means weighted by the
+    same weights, such as GPU hours by VC. They do not estimate distributions
+    over all rows, such as the share of jobs per GPU bucket or status.
+
+    Returns:
+        The sorted rows and their Hansen-Hurwitz weights (see above).
+
+    Raises:
+        ValueError: If the weights do not sum to a positive number.
+    """
+    weights = np.asarray(weights, dtype=float)
+    rows = np.sort(alias_draw(rng, alias_table(weights), size))
+    return rows, weights.sum() / (size * weights[rows])
+
+
+def thin(rng, num_rows: int, fraction: float) -> tuple:
+    """Keeps every row independently with probability fraction.
+
+    Thinning a Poisson arrival process this way leaves a Poisson process with
+    the same shape over time, at fraction of the rate.
+
+    Returns:
+        The sorted rows and their weights (see above).
+    """
+    rows = np.flatnonzero(rng.random(num_rows) < fraction)
+    return rows, np.full(len(rows), 1 / fraction)
+
+
+def stride(num_rows: int, fraction: float) -> tuple:
+    """Keeps every round(1 / fraction)-th row, like simulate_scheduler's
+    sample_every."""
+    every = max(int(round(1 / fraction)), 1)
+    rows = np.arange(0, num_rows, every)
+    return rows, np.full(len(rows), float(every))
+
+
+def effective_size(weights: np.ndarray) -> float:
+    """Returns Kish's effective sample size of weights."""
+    weights = np.asarray(weights, dtype=float)
+    return weights.sum() ** 2 / (weights**2).sum()
+
+
+def cdf_distance(population: np.ndarray, sample: np.ndarray, weights) -> float:
+    """Returns the Kolmogorov-Smirnov distance between the CDF of a population
+    and the weighted CDF of a sample of it."""
+    population = np.sort(population)
+    order = np.argsort(sample, kind="stable")
+    sample = sample[order]
+    cum = np.cumsum(weights[order]) / np.sum(weights)
+    grid = np.union1d(population, sample)
+    f_population = np.searchsorted(population, grid, side="right") / len(population)
+    index = np.searchsorted(sample, grid, side="right")
+    f_sample = np.where(index > 0, cum[np.maximum(index - 1, 0)], 0)
+    return float(np.abs(f_population - f_sample).max())
+
+
+def dkw_bound(num: float, alpha: float = ALPHA) -> float:
+    """Returns the distance a CDF of num independent draws stays within with
+    probability 1 - alpha (Dvoretzky-Kiefer-Wolfowitz)."""
+    return math.sqrt(math.log(2 / alpha) / (2 * num))
+
+
+def compare(columns: dict, rows: np.ndarray, weights: np.ndarray, alpha=ALPHA) -> dict:
+    """Compares the distributions of a sample with those of the population.
+
+    Args:
+        columns: A dict of numeric columns of the population; NaNs are left
+                 out.
+        rows, weights: The sample.
+        alpha: The error probability of the bounds.
+
+    Returns:
+        A dict mapping each column to a dict with the 'distance' between the
+        CDFs (see cdf_distance) and the DKW 'bound' at the sample's effective
+        size.
+    """
+    result = {}
+    for name, column in columns.items():
+        values = column[rows]
+        known = ~np.isnan(values)
+        result[name] = {
+            "distance": cdf_distance(
+                column[~np.isnan(column)], values[known], weights[known]
+            ),
+            "bound": dkw_bound(effective_size(weights[known]), alpha),
+        }
+    return result
+
+
+def gpu_hour_shares(
+    columns: dict, rows: np.ndarray, weights: np.ndarray, keys=("vc", "status")
+) -> dict:
+    """Compares the GPU-hour shares of a sample with those of the population.
+
+    Returns:
+        A dict mapping each key column of table_columns to the largest
+        difference between the share of GPU hours of a value in the
+        population and its estimate from the sample.
+    """
+    hours = columns["gpu_hours"]
+    result = {}
+    for name in keys:
+        codes = columns[name].astype(np.int64)
+        size = codes.max() + 1
+        population = np.bincount(codes, hours, minlength=size) / hours.sum()
+        sample_hours = hours[rows] * weights
+        estimate = np.bincount(codes[rows], sample_hours, minlength=size)
+        result[name] = float(np.abs(population - estimate / sample_hours.sum()).max())
+    return result
+
+
+def table_columns(table: dict) -> dict:
+    """Returns the columns of a job table that samples are compared on."""
+    from job_table import gpu_buckets
+
+    duration = table["attempt_end"] - table["attempt_start"]
+    gpu_seconds = np.nan_to_num(duration) * table["attempt_num_gpus"]
+    job_gpu_seconds = np.bincount(
+        table["attempt_job"], gpu_seconds, minlength=len(table["jobid"])
+    )
+    return {
+        "gpu_bucket": gpu_buckets(table["num_gpus"]).astype(float),
+        "vc": table["vc"].astype(float),
+        "status": table["status"].astype(float),
+        "num_gpus": table["num_gpus"].astype(float),
+        "submitted_time": table["submitted_time"],
+        "gpu_hours": job_gpu_seconds / 3600,
+    }
+
+
+def sample_rows(rng, columns: dict, method: str, fraction: float) -> tuple:
+    """Samples the rows of table_columns with one of METHODS.
+
+    Stratification is by GPU bucket, VC and status, and weighted sampling is
+    by GPU hours (see weighted_sample for what its weights estimate).
+    """
+    num_rows = len(columns["num_gpus"])
+    if method == "stratified":
+        strata = stratum_codes(columns["gpu_bucket"], columns["vc"], columns["status"])
+        return stratified_sample(rng, strata, fraction)
+    if method == "weighted":
+        return weighted_sample(
+            rng, columns["gpu_hours"], max(int(round(num_rows * fraction)), 1)
+        )
+    if method == "thin":
+        return thin(rng, num_rows, fraction)
+    if method == "stride":
+        order = np.argsort(columns["submitted_time"], kind="stable")
+        rows, weights = stride(num_rows, fraction)
+        return np.sort(order[rows]), weights
+    raise ValueError(f"unknown sampling method {method}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compares job samples with the full trace."
+    )
+    parser.add_argument("--fraction", type=float, default=FRACTION)
+    parser.add_argument("--method", choices=METHODS, nargs="+", default=METHODS)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--alpha", type=float, default=ALPHA)
+    args = parser.parse_args()
+
+    from job_table import load_job_table
+
+    columns = table_columns(load_job_table())
+    for method in args.method:
+        rng = np.random.default_rng(args.seed)
+        rows, weights = sample_rows(rng, columns, method, args.fraction)
+        print(
+            f"{method}: {len(rows)} jobs, effective size {effective_size(weights):.0f}"
+        )
+        if method == "weighted":
+            # Only GPU-hour-weighted quantities are estimated (see
+            # weighted_sample), so the job distributions are not compared.
+            for name, share in gpu_hour_shares(columns, rows, weights).items():
+                print(f"    {name}: GPU-hour share off by at most {share:.4f}")
+            continue
+        for name, error in compare(columns, rows, weights, args.alpha).items():
+            within = "ok" if error["distance"] <= error["bound"] else "OFF"
+            print(
+                f"    {name}: CDF distance {error['distance']:.4f}"
+                f" (bound {error['bound']:.4f}) {within}"
+            )
+
+
+if __name__ == "__main__":
+    main()
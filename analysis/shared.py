@@ -0,0 +1,183 @@
+import concurrent.futures
+import contextlib
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Arrays are placed at multiples of ALIGNMENT bytes within a block.
+ALIGNMENT = 64
+
+# Job tables and utilization cubes are handed to worker processes as small
+# picklable handles instead of being pickled themselves:
+#     Array handle: A dict with the 'name' of a shared memory block and, per
+#                   array, its 'dtype', 'shape' and byte 'offset' in the
+#                   block (see publish_arrays). It works for any dict of
+#                   numpy arrays, e.g. a job table.
+#     Cube handle: A dict with the 'cube_dir' of a utilization cube, whose
+#                  arrays are already memory-mapped files (see
+#                  publish_cube).
+# Workers attach to a handle once per process, and what they get are
+# read-only views of the shared pages, so nothing is copied.
+
+_attached = {}
+
+
+@contextlib.contextmanager
+def publish_arrays(arrays: dict):
+    """Copies a dict of numpy arrays into one shared memory block.
+
+    The block is removed when the context exits, so workers have to be done
+    with it by then.
+
+    Yields:
+        The array handle (see above).
+    """
+    layout = {}
+    size = 0
+    for key, array in arrays.items():
+        array = np.asarray(array)
+        size = -(-size // ALIGNMENT) * ALIGNMENT
+        layout[key] = {"dtype": array.dtype.str, "shape": array.shape, "offset": size}
+        size += array.nbytes
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        for key, array in arrays.items():
+            _view(block, layout[key])[...] = array
+        yield {"name": block.name, "arrays": layout}
+    finally:
+        # Views handed out in this process keep their own mapping alive.
+        _attached.pop(block.name, None)
+        block.close()
+        block.unlink()
+
+
+def _view(block, spec: dict) -> np.ndarray:
+    return np.ndarray(
+        spec["shape"], dtype=spec["dtype"], buffer=block.buf, offset=spec["offset"]
+    )
+
+
+def attach_arrays(handle: dict) -> dict:
+    """Returns read-only views of the arrays of an array handle.
+
+    The block is attached once per process and stays attached until the
+    process exits.
+    """
+    name = handle["name"]
+    if name not in _attached:
+        block = shared_memory.SharedMemory(name=name)
+        arrays = {}
+        for key, spec in handle["arrays"].items():
+            arrays[key] = _view(block, spec)
+            arrays[key].flags.writeable = False
+        _attached[name] = (block, arrays)
+    return dict(_attached[name][1])
+
+
+def publish_cube(cube_dir: str = None, codec: str = None) -> dict:
+    """Returns the cube handle of a utilization cube, building it if needed.
+
+    Args:
+        cube_dir: The cube's directory, utilization.CUBE_DIR if None.
+        codec: The codec the cube is stored with (see
+               utilization.load_utilization_cube).
+    """
+    import utilization
+
+    if cube_dir is None:
+        cube_dir = utilization.CUBE_DIR
+    utilization.load_utilization_cube(cube_dir, codec=codec)
+    return {"cube_dir": os.path.abspath(cube_dir)}
+
+
+def attach_cube(handle: dict) -> dict:
+    """Memory-maps the utilization cube of a cube handle, once per process."""
+    import utilization
+
+    key = ("cube", handle["cube_dir"])
+    if key not in _attached:
+        _attached[key] = utilization.load_utilization_cube(
+            handle["cube_dir"], rebuild=False
+        )
+    return dict(_attached[key])
+
+
+def _balance(weights: np.ndarray, num_shards: int) -> list:
+    """Assigns items to shards, heaviest first to the lightest shard so far.
+
+    Returns:
+        A list with the sorted item indices of each non-empty shard.
+    """
+    loads = np.zeros(num_shards)
+    shard = np.empty(len(weights), dtype=np.int64)
+    for item in np.argsort(-weights, kind="stable"):
+        shard[item] = np.argmin(loads)
+        loads[shard[item]] += weights[item]
+    return [np.flatnonzero(shard == s) for s in range(num_shards) if (shard == s).any()]
+
+
+def vc_shards(table: dict, num_shards: int) -> list:
+    """Splits the VCs of a job table into shards of about equal numbers of
+    attempts.
+
+    Returns:
+        A list with the VC codes of each shard; the jobs of a shard are
+        np.isin(table['vc'], shard).
+    """
+    attempts = np.diff(table["attempt_offsets"])
+    weights = np.bincount(table["vc"], attempts, minlength=len(table["vcs"]))
+    return _balance(weights, num_shards)
+
+
+def _even_ranges(length: int, num_shards: int) -> list:
+    bounds = np.linspace(0, length, min(num_shards, max(length, 1)) + 1)
+    bounds = bounds.round().astype(np.int64)
+    return [(int(lo), int(hi)) for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+
+def machine_shards(cube: dict, num_shards: int) -> list:
+    """Splits the machines of a cube into contiguous row ranges (lo, hi)."""
+    return _even_ranges(cube["util"].shape[0], num_shards)
+
+
+def time_shards(cube: dict, num_shards: int) -> list:
+    """Splits the minutes of a cube into contiguous column ranges (lo, hi)."""
+    return _even_ranges(cube["util"].shape[2], num_shards)
+
+
+def _run_shard(func, shard, table_handle, cube_handle):
+    kwargs = {}
+    if table_handle is not None:
+        kwargs["table"] = attach_arrays(table_handle)
+    if cube_handle is not None:
+        kwargs["cube"] = attach_cube(cube_handle)
+    return func(shard, **kwargs)
+
+
+def run_sharded(
+    func, shards: list, table_handle=None, cube_handle=None, processes: int = None
+) -> list:
+    """Runs func on every shard in a process pool.
+
+    Workers attach to the handles instead of receiving copies of the data.
+
+    Args:
+        func: A picklable function called as func(shard, table=..., cube=...),
+              with only the arguments whose handle is given.
+        shards: The shards, e.g. from vc_shards, machine_shards or
+                time_shards.
+        table_handle: An array handle of a job table.
+        cube_handle: A cube handle.
+        processes: The number of worker processes, os.cpu_count() if None.
+
+    Returns:
+        The results of func in the order of shards.
+    """
+    if len(shards) <= 1 or processes == 1:
+        return [_run_shard(func, s, table_handle, cube_handle) for s in shards]
+    with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+        futures = [
+            pool.submit(_run_shard, func, s, table_handle, cube_handle) for s in shards
+        ]
+        return [f.result() for f in futures]
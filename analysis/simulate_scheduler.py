@@ -1,118 +1,928 @@
-import datetime
-import copy
-import json
+import argparse
+import collections
+import hashlib
+import heapq
+import math
+import os
+import tempfile
+import time
 
 import numpy as np
 
+from job_export import load_job_columns
 
-def subsample(li: list, every: int):
+SCHEDULE_PATH = "jobs_executed.npz"
+# Checkpoints are written after every CHECKPOINT_EVERY submissions or
+# CHECKPOINT_SECONDS of wall time, whichever comes first.
+CHECKPOINT_EVERY = 100000
+CHECKPOINT_SECONDS = 300.0
+# Part of the checkpoint key, so that checkpoints of an older simulator are
+# not resumed.
+CHECKPOINT_VERSION = 3
+NUM_GPUS = 16
+MIN_NUM_GPUS_JOB = 2  # assume that every job can run with that many GPUs
+SCALE_EVENTS = ["scale_up", "scale_down"]
+# SimulatorMetrics bins completion times and queueing delays logarithmically,
+# METRIC_BINS_PER_DECADE bins per decade from METRIC_MIN_SECONDS to
+# METRIC_MAX_SECONDS, and samples the numbers of queued and running jobs every
+# SERIES_INTERVAL seconds of simulated time.
+METRIC_DELAYS = ["jct", "queueing_delay"]
+METRIC_SERIES = ["queued", "running"]
+METRIC_MIN_SECONDS = 1.0
+METRIC_MAX_SECONDS = 1e9
+METRIC_BINS_PER_DECADE = 20
+SERIES_INTERVAL = 3600.0
+# The speedup curves of simulate_elastic.
+SPEEDUP_CURVES = ["linear", "amdahl", "sqrt"]
+PARALLEL_FRACTION = 0.95
+
+# A schedule is a flat dict of numpy arrays with the simulated execution of
+# the (sorted and subsampled) jobs, in order of submission:
+#     'row': The row of the job in the simulator's input.
+#     'id': The job id, if the input has one.
+#     'runtime': The run time in seconds.
+#     'submitted_time', 'mw_start_time', 'mw_end_time': Seconds since the
+#         first submission, stretched by the stretch factor.
+#     'scale_up_offsets', 'scale_down_offsets': The scale ups of job i are
+#         scale_up[scale_up_offsets[i]:scale_up_offsets[i + 1]], and likewise
+#         for scale downs.
+#     'scale_up', 'scale_down': The times of the scale events, grouped by job
+#         and in the order they happened.
+#     'gpu_seconds': The GPU time of the job, only in elastic schedules (see
+#         simulate_elastic), where 'runtime' is the work on MIN_NUM_GPUS_JOB
+#         GPUs rather than the time from start to end.
+# It is saved with np.savez_compressed (see save_schedule).
+#
+# A checkpoint of a run is a .npz file with all state the simulation loop
+# carries from one submission to the next, so a resumed run computes exactly
+# what the interrupted one would have:
+#     'key': Identifies the input and parameters (see _checkpoint_key).
+#     'next_job': The number of jobs submitted so far.
+#     'cur_jobs': The running jobs, in the order of the running list.
+#     'cur_start', 'cur_end': The times of the running jobs, in the same
+#         order.
+#     'metrics_*': The metrics so far (see SimulatorMetrics.state).
+#     'mw_start_time', 'mw_end_time': The times of the submitted jobs, if the
+#         history is kept.
+#     'scale_up_job', 'scale_up_time', 'scale_down_job', 'scale_down_time':
+#         The scale events so far, in the order they happened, if the history
+#         is kept.
+# The upcoming submissions follow from the input and next_job. Checkpoints
+# of simulate_elastic hold its loop state instead of 'cur_*':
+#     'running': The running jobs, in the order of the running list.
+#     'run_start', 'run_gpus', 'run_work', 'run_since', 'run_gpu_seconds',
+#     'run_version': The running jobs' state, in the same order (see
+#         simulate_elastic).
+#     'waiting': The submitted jobs that have not started, in order.
+#     'finish_end', 'finish_job', 'finish_version': The heap of ends, in heap
+#         order.
+# Their history also has the 'gpu_seconds' of the submitted jobs.
+
+
+def subsample(li, every: int):
     return li[::every]
 
 
-def filter_earlier(submitted: float, jobs: list) -> list:
-    return list(filter(lambda x: x["mw_end_time"] < submitted, jobs))
+def validate(schedule: dict):
+    wrong = schedule["mw_start_time"] + schedule["runtime"] != schedule["mw_end_time"]
+    for _ in range(np.count_nonzero(wrong)):
+        print("job wrong")
 
 
-def validate(jobs: list):
-    for jo in jobs:
-        if not (jo["mw_start_time"] + jo["runtime"] == jo["mw_end_time"]):
-            print("job wrong")
+def job_columns(jobs) -> dict:
+    """Returns the columns of the simulator's input as numpy arrays.
 
+    Args:
+        jobs: A dict of columns, as returned by load_job_columns, or a list of
+              job dicts, as returned by jobs_to_dict or load_jobs, with at
+              least 'submitted_time' and 'runtime'.
+    """
+    if isinstance(jobs, dict):
+        return {name: np.asarray(column) for name, column in jobs.items()}
+    columns = {
+        "submitted_time": np.array([jo["submitted_time"] for jo in jobs], dtype=float),
+        "runtime": np.array([jo["runtime"] for jo in jobs]),
+    }
+    if len(jobs) > 0 and "id" in jobs[0]:
+        columns["id"] = np.array([jo["id"] for jo in jobs], dtype=str)
+    return columns
 
-def simulate_scheduler(jobs: list, sample_every: int = 1, stretch: int = 1) -> list:
-    assert sample_every == 1 or stretch == 1
-    num_gpus = 16
-    min_num_gpus_job = 2  # assume that every job can run with that many GPUs
-    max_num_jobs = num_gpus // min_num_gpus_job
 
-    jobs_executed = copy.deepcopy(jobs)
-    jobs_executed.sort(key=lambda x: x["submitted_time"])
+def _workload(jobs, sample_every: int, stretch: int) -> tuple:
+    """Returns the input columns and the rows, submission and run times of the
+    jobs to simulate, in order of submission."""
+    columns = job_columns(jobs)
+    rows = np.argsort(columns["submitted_time"], kind="stable")
     if sample_every > 1:
-        jobs_executed = subsample(jobs_executed, sample_every)
+        rows = subsample(rows, sample_every)
+    submitted = columns["submitted_time"][rows]
+    submitted = submitted - submitted[0]
+    if stretch > 1:
+        submitted = submitted * stretch
+    return columns, rows, submitted, columns["runtime"][rows]
+
+
+class _EventLog:
+    """Preallocated (job, time) pairs of one kind of scale event.
+
+    The arrays double when full, which a good capacity avoids.
+    """
+
+    def __init__(self, capacity: int):
+        self.job = np.empty(capacity, dtype=np.int64)
+        self.time = np.empty(capacity, dtype=np.float64)
+        self.size = 0
+
+    def append(self, job: int, time: float):
+        if self.size == len(self.job):
+            self.job = np.concatenate([self.job, np.empty_like(self.job)])
+            self.time = np.concatenate([self.time, np.empty_like(self.time)])
+        self.job[self.size] = job
+        self.time[self.size] = time
+        self.size += 1
+
+    def restore(self, job: np.ndarray, time: np.ndarray):
+        self.size = len(job)
+        self.job[: self.size] = job
+        self.time[: self.size] = time
+
+    def grouped(self, num_jobs: int) -> tuple:
+        """Returns the (offsets, times) of the events grouped by job."""
+        job = self.job[: self.size]
+        order = np.argsort(job, kind="stable")
+        offsets = np.zeros(num_jobs + 1, dtype=np.int64)
+        np.cumsum(np.bincount(job, minlength=num_jobs), out=offsets[1:])
+        return offsets, self.time[: self.size][order]
+
+
+def _checkpoint_key(submitted: np.ndarray, runtime: np.ndarray, params) -> str:
+    h = hashlib.sha256(repr((CHECKPOINT_VERSION, params)).encode())
+    for column in [submitted, runtime]:
+        h.update(str(column.dtype).encode())
+        h.update(np.ascontiguousarray(column).tobytes())
+    return h.hexdigest()
+
+
+def _save_checkpoint(path: str, state: dict):
+    # Written to a temporary file first, so an interruption while writing
+    # leaves the previous checkpoint intact.
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile(dir=directory, suffix=".npz", delete=False) as f:
+        np.savez(f, **state)
+    os.replace(f.name, path)
+
+
+def _history_state(num_jobs: int, times: dict, events: dict) -> dict:
+    """Returns the checkpoint state of the history of the first jobs."""
+    state = {name: array[:num_jobs] for name, array in times.items()}
+    for kind, log in events.items():
+        state[f"{kind}_job"] = log.job[: log.size]
+        state[f"{kind}_time"] = log.time[: log.size]
+    return state
+
+
+def _restore_history(checkpoint: dict, num_jobs: int, times: dict, events: dict):
+    for name, array in times.items():
+        array[:num_jobs] = checkpoint[name]
+    for kind, log in events.items():
+        log.restore(checkpoint[f"{kind}_job"], checkpoint[f"{kind}_time"])
+
+
+def _load_checkpoint(path: str, key: str) -> dict:
+    """Returns the checkpoint at path if it is one of the run with key."""
+    if path is None or not os.path.exists(path):
+        return None
+    with np.load(path) as f:
+        if str(f["key"]) != key:
+            print(f"ignoring checkpoint {path} of a different run")
+            return None
+        return {k: f[k] for k in f.files}
+
+
+class SimulatorMetrics:
+    """Running metrics of a simulation, updated in O(1) per job and event.
+
+    Nothing is kept per job: completion times (JCT, submission to end) and
+    queueing delays (submission to start) go into fixed logarithmic
+    histograms, and the queue length and number of running jobs into
+    difference arrays over the sample times, which only grow with the
+    simulated time span.
+    """
 
-    jo_zero_sub = jobs_executed[0]["submitted_time"]
-    for jo in jobs_executed:
-        jo["submitted_time"] = jo["submitted_time"] - jo_zero_sub
-        if stretch > 1:
-            jo["submitted_time"] = jo["submitted_time"] * stretch
+    def __init__(self, num_gpus: int = NUM_GPUS, interval: float = SERIES_INTERVAL):
+        self.num_gpus = num_gpus
+        self.interval = interval
+        num_bins = int(
+            round(
+                np.log10(METRIC_MAX_SECONDS / METRIC_MIN_SECONDS)
+                * METRIC_BINS_PER_DECADE
+            )
+        )
+        self.edges = METRIC_MIN_SECONDS * 10.0 ** (
+            np.arange(num_bins + 1) / METRIC_BINS_PER_DECADE
+        )
+        # Bin 0 is below edges[0], bin i is [edges[i - 1], edges[i]) and the
+        # last bin is from edges[-1] on. Counts are kept in lists, which are
+        # quicker to update one at a time than arrays.
+        self.hist = {name: [0] * (num_bins + 2) for name in METRIC_DELAYS}
+        self.delta = {name: [0] * 1024 for name in METRIC_SERIES}
+        self.stats = dict.fromkeys(
+            ["jobs", "makespan", "busy_until", "busy_seconds", "gpu_seconds"]
+            + [f"{name}_{stat}" for name in METRIC_DELAYS for stat in ["sum", "max"]]
+            + SCALE_EVENTS,
+            0.0,
+        )
 
+    def _bin(self, seconds: float) -> int:
+        if seconds < METRIC_MIN_SECONDS:
+            return 0
+        b = int(math.log10(seconds / METRIC_MIN_SECONDS) * METRIC_BINS_PER_DECADE) + 1
+        return min(b, len(self.edges))
+
+    def _step(self, name: str, lo: float, hi: float):
+        # Counts the samples k * interval with lo <= k * interval < hi.
+        first = math.ceil(lo / self.interval)
+        stop = math.ceil(hi / self.interval)
+        if first == stop:
+            return
+        delta = self.delta[name]
+        if stop >= len(delta):
+            delta.extend([0] * max(len(delta), stop + 1 - len(delta)))
+        delta[first] += 1
+        delta[stop] -= 1
+
+    def _add_delay(self, name: str, seconds: float):
+        self.hist[name][self._bin(seconds)] += 1
+        stats = self.stats
+        stats[name + "_sum"] += seconds
+        if seconds > stats[name + "_max"]:
+            stats[name + "_max"] = seconds
+
+    def add_job(
+        self, submit: float, start: float, end: float, gpu_seconds: float = None
+    ):
+        """Adds a job once its start and end are known.
+
+        Args:
+            submit, start, end: The times of the job.
+            gpu_seconds: The GPU time of the job, if the jobs do not share all
+                         GPUs whenever any of them runs. Either all or none
+                         of the jobs have it.
+        """
+        submit, start, end = float(submit), float(start), float(end)
+        stats = self.stats
+        stats["jobs"] += 1
+        self._add_delay("jct", end - submit)
+        self._add_delay("queueing_delay", start - submit)
+        if end > stats["makespan"]:
+            stats["makespan"] = end
+        # Otherwise all GPUs are busy while any job runs. Jobs start in order
+        # of submission (a delayed job waits for a running one, so every later
+        # job waits at least as long), so that time is a union of intervals
+        # sorted by start.
+        if gpu_seconds is not None:
+            stats["gpu_seconds"] += gpu_seconds
+        elif end > stats["busy_until"]:
+            stats["busy_seconds"] += end - max(start, stats["busy_until"])
+            stats["busy_until"] = end
+        self._step("queued", submit, start)
+        self._step("running", start, end)
+
+    def add_scale_events(self, kind: str, count: int = 1):
+        self.stats[kind] += count
+
+    def quantile(self, name: str, q: float) -> float:
+        """Returns an upper bound of the q-quantile of a histogram, tight to a
+        bin."""
+        hist = np.array(self.hist[name])
+        total = hist.sum()
+        if total == 0:
+            return np.nan
+        b = int(np.searchsorted(np.cumsum(hist), q * total))
+        upper = self.edges[b] if b < len(self.edges) else np.inf
+        return float(min(upper, self.stats[f"{name}_max"]))
+
+    def state(self) -> dict:
+        """Returns the metrics as a flat dict of arrays, e.g. for a checkpoint."""
+        state = {}
+        for name, counts in [*self.hist.items(), *self.delta.items()]:
+            state[f"metrics_{name}"] = np.array(counts, dtype=np.int64)
+        for name, value in self.stats.items():
+            state[f"metrics_{name}"] = np.float64(value)
+        return state
+
+    def load_state(self, state: dict):
+        for counts in [self.hist, self.delta]:
+            for name in counts:
+                counts[name] = state[f"metrics_{name}"].tolist()
+        for name in self.stats:
+            self.stats[name] = float(state[f"metrics_{name}"])
+
+    def summary(self) -> dict:
+        """Returns the metrics so far.
+
+        Returns:
+            A dict with the number of 'jobs'; the 'makespan' in seconds from
+            the first submission to the last end; the 'gpu_seconds' the jobs
+            ran, by default NUM_GPUS while any job runs, as running jobs share
+            all GPUs, and their share of the makespan, 'gpu_utilization'; the 'scale_up' and
+            'scale_down' counts; for 'jct' and 'queueing_delay' a dict with
+            the 'mean', 'max' and quantiles 'p50', 'p90', 'p99' in seconds;
+            and the 'queued' and 'running' jobs at every 'interval' seconds
+            up to the makespan.
+        """
+        stats = self.stats
+        jobs = int(stats["jobs"])
+        makespan = float(stats["makespan"])
+        gpu_seconds = float(
+            stats["busy_seconds"] * self.num_gpus + stats["gpu_seconds"]
+        )
+        summary = {
+            "jobs": jobs,
+            "makespan": makespan,
+            "gpu_seconds": gpu_seconds,
+            "gpu_utilization": (
+                gpu_seconds / (self.num_gpus * makespan) if makespan > 0 else np.nan
+            ),
+        }
+        for kind in SCALE_EVENTS:
+            summary[kind] = int(stats[kind])
+        for name in METRIC_DELAYS:
+            summary[name] = {
+                "mean": float(stats[f"{name}_sum"] / jobs) if jobs > 0 else np.nan,
+                "max": float(stats[f"{name}_max"]),
+            }
+            for q in [50, 90, 99]:
+                summary[name][f"p{q}"] = self.quantile(name, q / 100)
+        num_samples = max(math.ceil(makespan / self.interval), 1)
+        summary["interval"] = self.interval
+        for name, delta in self.delta.items():
+            series = np.zeros(num_samples, dtype=np.int64)
+            counts = np.cumsum(np.array(delta[:num_samples], dtype=np.int64))
+            series[: len(counts)] = counts
+            summary[name] = series
+        return summary
+
+
+def print_summary(summary: dict):
+    print(f"jobs: {summary['jobs']}")
+    print(f"makespan: {summary['makespan'] / 3600:.1f} h")
+    print(
+        f"GPU hours: {summary['gpu_seconds'] / 3600:.1f}"
+        f" ({summary['gpu_utilization']:.1%} utilization)"
+    )
+    for kind in SCALE_EVENTS:
+        print(f"{kind}: {summary[kind]}")
+    for name in METRIC_DELAYS:
+        stats = ", ".join(f"{k} {v / 3600:.2f}" for k, v in summary[name].items())
+        print(f"{name} (h): {stats}")
+    for name in METRIC_SERIES:
+        series = summary[name]
+        print(f"{name} jobs: mean {series.mean():.2f}, max {series.max()}")
+
+
+def simulate_scheduler(
+    jobs,
+    sample_every: int = 1,
+    stretch: int = 1,
+    checkpoint_path: str = None,
+    checkpoint_every: int = CHECKPOINT_EVERY,
+    checkpoint_seconds: float = CHECKPOINT_SECONDS,
+    metrics: SimulatorMetrics = None,
+    keep_history: bool = True,
+    on_summary=None,
+) -> dict:
+    """Simulates a malleable scheduler on NUM_GPUS GPUs.
+
+    The input is only read, and the only state besides the output and the
+    metrics is that of the running jobs, so without the history memory does
+    not grow with the number of jobs.
+
+    Args:
+        jobs: The jobs, in any form job_columns accepts.
+        sample_every: Only every sample_every-th job by submission is run.
+        stretch: Stretches the time between submissions by this factor.
+        checkpoint_path: If given, the run is checkpointed to this file (see
+                         above) and resumed from it if it holds a checkpoint
+                         of the same input and parameters. It is removed once
+                         the run is done.
+        checkpoint_every: Checkpoints after this many submissions.
+        checkpoint_seconds: Checkpoints after this much wall time.
+        metrics: SimulatorMetrics to update as the run goes, if given.
+        keep_history: Whether to keep the times and scale events of every
+                      job for the schedule.
+        on_summary: If given, called with the summary of the metrics so far
+                    whenever a checkpoint is due, with or without
+                    checkpoint_path.
+
+    Returns:
+        The schedule (see above), or None without keep_history.
+    """
+    assert sample_every == 1 or stretch == 1
+    max_num_jobs = NUM_GPUS // MIN_NUM_GPUS_JOB
+    if metrics is None:
+        metrics = SimulatorMetrics()
+
+    columns, rows, submitted, runtime = _workload(jobs, sample_every, stretch)
+    num_jobs = len(rows)
+    if keep_history:
+        start_time = np.empty(num_jobs)
+        end_time = np.empty(num_jobs)
+        times = {"mw_start_time": start_time, "mw_end_time": end_time}
+        # A job scales up or down at most once per other running job when a
+        # job starts or stops.
+        events = {
+            kind: _EventLog(num_jobs * (max_num_jobs - 1) + max_num_jobs)
+            for kind in SCALE_EVENTS
+        }
+    else:
+        times, events = {}, {}
+
+    # The start and end of the running jobs.
     cur_jobs = []
-    for i, jo in enumerate(jobs_executed):
-        jo_submit = jo["submitted_time"]
-        jo_runtime = jo["runtime"]
+    start = {}
+    end = {}
+
+    def scale(kind: str, job: int, at: float):
+        metrics.add_scale_events(kind)
+        if keep_history:
+            events[kind].append(job, at)
+
+    def remove(job: int):
+        cur_jobs.remove(job)
+        del start[job], end[job]
+
+    first_job = 0
+    key = _checkpoint_key(
+        submitted, runtime, (sample_every, stretch, keep_history, metrics.interval)
+    )
+    if checkpoint_path is not None:
+        checkpoint = _load_checkpoint(checkpoint_path, key)
+        if checkpoint is not None:
+            first_job = int(checkpoint["next_job"])
+            cur_jobs = checkpoint["cur_jobs"].tolist()
+            start = dict(zip(cur_jobs, checkpoint["cur_start"]))
+            end = dict(zip(cur_jobs, checkpoint["cur_end"]))
+            metrics.load_state(checkpoint)
+            _restore_history(checkpoint, first_job, times, events)
+            print(f"resuming from job {first_job} of {num_jobs}")
+    last_checkpoint = (first_job, time.monotonic())
+    report = checkpoint_path is not None or on_summary is not None
+
+    for jo in range(first_job, num_jobs):
+        if report and jo > last_checkpoint[0]:
+            due = jo - last_checkpoint[0] >= checkpoint_every
+            if due or time.monotonic() - last_checkpoint[1] >= checkpoint_seconds:
+                if checkpoint_path is not None:
+                    state = {
+                        "key": key,
+                        "next_job": jo,
+                        "cur_jobs": np.array(cur_jobs, dtype=np.int64),
+                        "cur_start": np.array([start[x] for x in cur_jobs]),
+                        "cur_end": np.array([end[x] for x in cur_jobs]),
+                        **metrics.state(),
+                        **_history_state(jo, times, events),
+                    }
+                    _save_checkpoint(checkpoint_path, state)
+                if on_summary is not None:
+                    on_summary(metrics.summary())
+                last_checkpoint = (jo, time.monotonic())
+
+        jo_submit = submitted[jo]
+        jo_runtime = runtime[jo]
 
         # jobs finish before new jobs -> scale up
-        cur_jobs = sorted(cur_jobs, key=lambda x: x["mw_end_time"])
-        stop_earlier = filter_earlier(jo_submit, cur_jobs)
+        cur_jobs.sort(key=lambda x: end[x])
+        stop_earlier = [x for x in cur_jobs if end[x] < jo_submit]
         for stop_ea in stop_earlier:
-            jo_stop_end = stop_ea["mw_end_time"]
+            jo_stop_end = end[stop_ea]
             for jo_oth in cur_jobs:
                 if jo_oth == stop_ea:
                     continue
-                if jo_stop_end > jo_oth["mw_start_time"]:
-                    jo_oth.setdefault("scale_up", [])
-                    jo_oth["scale_up"].append(jo_stop_end)
-            cur_jobs.remove(stop_ea)
+                if jo_stop_end > start[jo_oth]:
+                    scale("scale_up", jo_oth, jo_stop_end)
+            remove(stop_ea)
 
         if len(cur_jobs) < max_num_jobs:  # resources available
-            jo["mw_start_time"] = jo_submit
-            jo["mw_end_time"] = jo_submit + jo_runtime
-
-            if len(cur_jobs) > 0:  # scale down
-                for cur_jo in cur_jobs:
-                    cur_jo.setdefault("scale_down", [])
-                    cur_jo["scale_down"].append(jo_submit)
+            start[jo] = jo_submit
+            end[jo] = jo_submit + jo_runtime
 
-            cur_jobs.append(jo)
+            for cur_jo in cur_jobs:  # scale down
+                scale("scale_down", cur_jo, jo_submit)
         else:  # resources busy -> start delayed
             jo_first_fin = cur_jobs[0]
-            jo["mw_start_time"] = jo_first_fin["mw_end_time"]
-            jo["mw_end_time"] = jo_first_fin["mw_end_time"] + jo_runtime
+            start[jo] = end[jo_first_fin]
+            end[jo] = end[jo_first_fin] + jo_runtime
+
+            remove(jo_first_fin)
 
-            cur_jobs.remove(jo_first_fin)
-            cur_jobs.append(jo)
+        cur_jobs.append(jo)
+        metrics.add_job(jo_submit, start[jo], end[jo])
+        if keep_history:
+            start_time[jo] = start[jo]
+            end_time[jo] = end[jo]
 
     # no new jobs but scale ups
-    cur_jobs = sorted(cur_jobs, key=lambda x: x["mw_end_time"])
-    for i, cur_jo in enumerate(cur_jobs):
-        jo_stop_end = cur_jo["mw_end_time"]
-        if i + 1 < len(cur_jobs):
-            for jo_oth in cur_jobs[i + 1 :]:
-                if "scale_up" in cur_jobs:
-                    jo_oth["scale_up"].append(jo_stop_end)
-                else:
-                    jo_oth["scale_up"] = [jo_stop_end]
+    cur_jobs.sort(key=lambda x: end[x])
+    for i, stop_ea in enumerate(cur_jobs):
+        jo_stop_end = end[stop_ea]
+        for jo_oth in cur_jobs[i + 1 :]:
+            if jo_stop_end > start[jo_oth]:
+                scale("scale_up", jo_oth, jo_stop_end)
 
-    validate(jobs_executed)
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    if not keep_history:
+        return None
 
-    return jobs_executed
+    schedule = {
+        "row": rows,
+        "runtime": runtime,
+        "submitted_time": submitted,
+        "mw_start_time": start_time,
+        "mw_end_time": end_time,
+    }
+    if "id" in columns:
+        schedule["id"] = columns["id"][rows]
+    for kind, log in events.items():
+        schedule[f"{kind}_offsets"], schedule[kind] = log.grouped(num_jobs)
 
+    validate(schedule)
+    return schedule
 
-def main():
-    DATE_FORMAT_STR = "%Y-%m-%d %H:%M:%S"
 
-    sample_every = 1
-    stretch_factor = 20
+def speedup_curve(
+    kind: str = "linear",
+    num_gpus: int = NUM_GPUS,
+    parallel_fraction: float = PARALLEL_FRACTION,
+) -> np.ndarray:
+    """Returns the throughput of a job on 0 to num_gpus GPUs.
+
+    Args:
+        kind: One of SPEEDUP_CURVES, 'amdahl' being Amdahl's law with
+              parallel_fraction.
+        num_gpus: The most GPUs.
+        parallel_fraction: The fraction of the work that parallelizes.
+    """
+    gpus = np.arange(num_gpus + 1, dtype=float)
+    if kind == "linear":
+        return gpus
+    if kind == "amdahl":
+        with np.errstate(divide="ignore"):
+            return 1 / ((1 - parallel_fraction) + parallel_fraction / gpus)
+    if kind == "sqrt":
+        return np.sqrt(gpus)
+    raise ValueError(f"unknown speedup curve {kind}")
+
+
+def _allocations(max_gpus_job: int) -> list:
+    """Returns the GPUs of each of k running jobs, for every k."""
+    allocations = [[]]
+    for k in range(1, NUM_GPUS // MIN_NUM_GPUS_JOB + 1):
+        share, rest = divmod(NUM_GPUS, k)
+        allocations.append([min(share + (i < rest), max_gpus_job) for i in range(k)])
+    return allocations
+
+
+def simulate_elastic(
+    jobs,
+    sample_every: int = 1,
+    stretch: int = 1,
+    speedup="linear",
+    max_gpus_job: int = NUM_GPUS,
+    metrics: SimulatorMetrics = None,
+    keep_history: bool = True,
+    checkpoint_path: str = None,
+    checkpoint_every: int = CHECKPOINT_EVERY,
+    checkpoint_seconds: float = CHECKPOINT_SECONDS,
+    on_summary=None,
+) -> dict:
+    """Simulates an elastic scheduler on NUM_GPUS GPUs.
+
+    Up to NUM_GPUS // MIN_NUM_GPUS_JOB jobs run at a time, started in order
+    of submission, and whenever jobs start or finish the GPUs are split
+    again evenly among the running jobs, the earliest started getting the
+    remainder. A job's run time is its work on MIN_NUM_GPUS_JOB GPUs, which
+    it does at speedup[g] / speedup[MIN_NUM_GPUS_JOB] times that pace on g
+    GPUs, so its end moves with every change of its GPUs. The ends are kept
+    in a heap, where a job gets a new entry only when its GPUs change and
+    outdated entries are dropped as they come up.
+
+    Args:
+        jobs: The jobs, in any form job_columns accepts.
+        sample_every: Only every sample_every-th job by submission is run.
+        stretch: Stretches the time between submissions by this factor.
+        speedup: The throughput of a job on 0 to NUM_GPUS GPUs, or the kind
+                 of speedup_curve.
+        max_gpus_job: The most GPUs a job can use.
+        metrics: SimulatorMetrics to update as the run goes, if given.
+        keep_history: Whether to keep the times and scale events of every
+                      job for the schedule.
+        checkpoint_path: If given, the run is checkpointed to this file and
+                         resumed from it as in simulate_scheduler.
+        checkpoint_every: Checkpoints after this many jobs finish.
+        checkpoint_seconds: Checkpoints after this much wall time.
+        on_summary: If given, called with the summary of the metrics so far
+                    whenever a checkpoint is due, with or without
+                    checkpoint_path.
+
+    Returns:
+        The schedule (see above) with the 'gpu_seconds' of every job, or
+        None without keep_history.
+    """
+    assert sample_every == 1 or stretch == 1
+    if isinstance(speedup, str):
+        speedup = speedup_curve(speedup)
+    rate = (np.asarray(speedup, dtype=float) / speedup[MIN_NUM_GPUS_JOB]).tolist()
+    allocations = _allocations(max_gpus_job)
+    max_num_jobs = len(allocations) - 1
+    if metrics is None:
+        metrics = SimulatorMetrics()
+
+    columns, rows, submitted, runtime = _workload(jobs, sample_every, stretch)
+    num_jobs = len(rows)
+    params = (sample_every, stretch, keep_history, metrics.interval)
+    key = _checkpoint_key(submitted, runtime, ("elastic", rate, max_gpus_job, params))
+    submitted = submitted.tolist()
+    if keep_history:
+        start_time = np.empty(num_jobs)
+        end_time = np.empty(num_jobs)
+        gpu_time = np.empty(num_jobs)
+        times = {
+            "mw_start_time": start_time,
+            "mw_end_time": end_time,
+            "gpu_seconds": gpu_time,
+        }
+        events = {
+            kind: _EventLog(num_jobs * (max_num_jobs - 1) + max_num_jobs)
+            for kind in SCALE_EVENTS
+        }
+    else:
+        times, events = {}, {}
+
+    # The start, GPUs, work left at the last change of GPUs, time of that
+    # change, GPU time until then and version of the heap entry of the
+    # running jobs.
+    running = []
+    start, gpus, work, since, gpu_seconds, version = {}, {}, {}, {}, {}, {}
+    waiting = collections.deque()
+    finishes = []  # (end, job, version)
+    next_job = 0
+    run_state = {
+        "run_start": start,
+        "run_gpus": gpus,
+        "run_work": work,
+        "run_since": since,
+        "run_gpu_seconds": gpu_seconds,
+        "run_version": version,
+    }
+
+    if checkpoint_path is not None:
+        checkpoint = _load_checkpoint(checkpoint_path, key)
+        if checkpoint is not None:
+            next_job = int(checkpoint["next_job"])
+            running = checkpoint["running"].tolist()
+            for name, values in run_state.items():
+                values.update(zip(running, checkpoint[name].tolist()))
+            waiting.extend(checkpoint["waiting"].tolist())
+            finishes = list(
+                zip(
+                    checkpoint["finish_end"].tolist(),
+                    checkpoint["finish_job"].tolist(),
+                    checkpoint["finish_version"].tolist(),
+                )
+            )
+            metrics.load_state(checkpoint)
+            _restore_history(checkpoint, next_job, times, events)
+            print(f"resuming from job {next_job} of {num_jobs}")
+    # Jobs are finished once submitted and neither waiting nor running.
+    last_checkpoint = (next_job - len(waiting) - len(running), time.monotonic())
+    report = checkpoint_path is not None or on_summary is not None
+
+    while next_job < num_jobs or running:
+        finished = next_job - len(waiting) - len(running)
+        if report and finished > last_checkpoint[0]:
+            due = finished - last_checkpoint[0] >= checkpoint_every
+            if due or time.monotonic() - last_checkpoint[1] >= checkpoint_seconds:
+                if checkpoint_path is not None:
+                    end, job, ver = zip(*finishes) if finishes else ((), (), ())
+                    state = {
+                        "key": key,
+                        "next_job": next_job,
+                        "running": np.array(running, dtype=np.int64),
+                        "waiting": np.array(waiting, dtype=np.int64),
+                        "finish_end": np.array(end, dtype=np.float64),
+                        "finish_job": np.array(job, dtype=np.int64),
+                        "finish_version": np.array(ver, dtype=np.int64),
+                        **metrics.state(),
+                        **_history_state(next_job, times, events),
+                    }
+                    for name, values in run_state.items():
+                        state[name] = np.array([values[x] for x in running])
+                    _save_checkpoint(checkpoint_path, state)
+                if on_summary is not None:
+                    on_summary(metrics.summary())
+                last_checkpoint = (finished, time.monotonic())
+
+        while finishes and version.get(finishes[0][1]) != finishes[0][2]:
+            heapq.heappop(finishes)
+        now = min(
+            finishes[0][0] if finishes else np.inf,
+            submitted[next_job] if next_job < num_jobs else np.inf,
+        )
+
+        # finishes free their GPUs for the jobs submitted at the same time
+        while finishes and finishes[0][0] <= now:
+            _, jo, ver = heapq.heappop(finishes)
+            if version.get(jo) != ver:
+                continue
+            jo_gpu_seconds = gpu_seconds.pop(jo) + gpus.pop(jo) * (now - since.pop(jo))
+            running.remove(jo)
+            del work[jo], version[jo]
+            metrics.add_job(submitted[jo], start.pop(jo), now, jo_gpu_seconds)
+            if keep_history:
+                end_time[jo] = now
+                gpu_time[jo] = jo_gpu_seconds
+
+        while next_job < num_jobs and submitted[next_job] <= now:
+            waiting.append(next_job)
+            next_job += 1
+        while waiting and len(running) < max_num_jobs:
+            jo = waiting.popleft()
+            running.append(jo)
+            start[jo] = since[jo] = now
+            gpus[jo] = version[jo] = 0
+            work[jo] = float(runtime[jo])
+            gpu_seconds[jo] = 0.0
+            if keep_history:
+                start_time[jo] = now
 
-    with open("jobs.json", "r") as json_file:
-        jobs = json.load(json_file)
+        # redistribute the GPUs
+        for jo, jo_gpus in zip(running, allocations[len(running)]):
+            old_gpus = gpus[jo]
+            if jo_gpus == old_gpus:
+                continue
+            elapsed = now - since[jo]
+            work[jo] -= rate[old_gpus] * elapsed
+            gpu_seconds[jo] += old_gpus * elapsed
+            since[jo] = now
+            gpus[jo] = jo_gpus
+            version[jo] += 1
+            heapq.heappush(
+                finishes, (now + max(work[jo], 0.0) / rate[jo_gpus], jo, version[jo])
+            )
+            if old_gpus > 0:
+                kind = "scale_up" if jo_gpus > old_gpus else "scale_down"
+                metrics.add_scale_events(kind)
+                if keep_history:
+                    events[kind].append(jo, now)
 
-    for jo in jobs:
-        arr_date = datetime.datetime.strptime(jo["submitted_time"], DATE_FORMAT_STR)
-        jo["submitted_time"] = arr_date
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    if not keep_history:
+        return None
 
-    jobs_executed = simulate_scheduler(
-        jobs, sample_every=sample_every, stretch=stretch_factor
+    schedule = {
+        "row": rows,
+        "runtime": runtime,
+        "submitted_time": np.array(submitted),
+        "mw_start_time": start_time,
+        "mw_end_time": end_time,
+        "gpu_seconds": gpu_time,
+    }
+    if "id" in columns:
+        schedule["id"] = columns["id"][rows]
+    for kind, log in events.items():
+        schedule[f"{kind}_offsets"], schedule[kind] = log.grouped(num_jobs)
+    return schedule
+
+
+def simulate_metrics(jobs, interval: float = SERIES_INTERVAL, **kwargs) -> dict:
+    """Simulates the scheduler keeping only its running metrics.
+
+    Args:
+        jobs: The jobs, in any form job_columns accepts.
+        interval: The seconds between samples of the queue length and number
+                  of running jobs.
+        kwargs: Further arguments of simulate_scheduler.
+
+    Returns:
+        The summary of the metrics (see SimulatorMetrics.summary).
+    """
+    metrics = SimulatorMetrics(interval=interval)
+    simulate_scheduler(jobs, metrics=metrics, keep_history=False, **kwargs)
+    return metrics.summary()
+
+
+def scale_events(schedule: dict, kind: str, job: int) -> np.ndarray:
+    """Returns the times of the scale events of one kind of one job."""
+    offsets = schedule[f"{kind}_offsets"]
+    return schedule[kind][offsets[job] : offsets[job + 1]]
+
+
+def save_schedule(schedule: dict, path: str = SCHEDULE_PATH):
+    np.savez_compressed(path, **schedule)
+
+
+def load_schedule(path: str = SCHEDULE_PATH) -> dict:
+    with np.load(path) as f:
+        return {k: f[k] for k in f.files}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate the scheduler.")
+    parser.add_argument("--sample-every", type=int, default=1)
+    parser.add_argument("--stretch", type=int, default=20)
+    parser.add_argument("--checkpoint", help="checkpoint file to write and resume from")
+    parser.add_argument("--checkpoint-every", type=int, default=CHECKPOINT_EVERY)
+    parser.add_argument("--checkpoint-seconds", type=float, default=CHECKPOINT_SECONDS)
+    parser.add_argument(
+        "--series-interval",
+        type=float,
+        default=SERIES_INTERVAL,
+        help="seconds between samples of the queued and running jobs",
+    )
+    parser.add_argument(
+        "--metrics-only",
+        action="store_true",
+        help="only print the metrics, without keeping or saving the schedule",
+    )
+    parser.add_argument(
+        "--progress", action="store_true", help="print the metrics at every checkpoint"
     )
+    parser.add_argument(
+        "--elastic",
+        action="store_true",
+        help="redistribute the GPUs and rescale run times (see simulate_elastic)",
+    )
+    parser.add_argument("--speedup", choices=SPEEDUP_CURVES, default="linear")
+    parser.add_argument("--max-gpus-job", type=int, default=NUM_GPUS)
+    parser.add_argument(
+        "--sample-fraction",
+        type=float,
+        help="run a sample of the jobs stratified by GPU bucket instead",
+    )
+    parser.add_argument("--sample-seed", type=int, default=42)
+    args = parser.parse_args()
+    sample_every = args.sample_every
+    stretch_factor = args.stretch
 
-    if sample_every > 1:
-        file_name = f"jobs_executed_subsampled{sample_every}.json"
+    if args.sample_fraction is None:
+        jobs = load_job_columns(columns=["id", "runtime", "submitted_time"])
+    else:
+        from job_table import gpu_buckets
+        from sampling import stratified_sample
+
+        jobs = load_job_columns(columns=["id", "num_gpus", "runtime", "submitted_time"])
+        rows, _ = stratified_sample(
+            np.random.default_rng(args.sample_seed),
+            gpu_buckets(jobs["num_gpus"]),
+            args.sample_fraction,
+        )
+        jobs = {name: column[rows] for name, column in jobs.items()}
+
+    metrics = SimulatorMetrics(interval=args.series_interval)
+    if args.elastic:
+        jobs_executed = simulate_elastic(
+            jobs,
+            sample_every=sample_every,
+            stretch=stretch_factor,
+            speedup=args.speedup,
+            max_gpus_job=args.max_gpus_job,
+            metrics=metrics,
+            keep_history=not args.metrics_only,
+            checkpoint_path=args.checkpoint,
+            checkpoint_every=args.checkpoint_every,
+            checkpoint_seconds=args.checkpoint_seconds,
+            on_summary=print_summary if args.progress else None,
+        )
+    else:
+        jobs_executed = simulate_scheduler(
+            jobs,
+            sample_every=sample_every,
+            stretch=stretch_factor,
+            checkpoint_path=args.checkpoint,
+            checkpoint_every=args.checkpoint_every,
+            checkpoint_seconds=args.checkpoint_seconds,
+            metrics=metrics,
+            keep_history=not args.metrics_only,
+            on_summary=print_summary if args.progress else None,
+        )
+    print_summary(metrics.summary())
+    if args.metrics_only:
+        return
+
+    if args.sample_fraction is not None:
+        file_name = f"jobs_executed_sampled{args.sample_fraction:g}.npz"
+    elif sample_every > 1:
+        file_name = f"jobs_executed_subsampled{sample_every}.npz"
     elif stretch_factor > 1:
-        file_name = f"jobs_executed_stretch{stretch_factor}.json"
+        file_name = f"jobs_executed_stretch{stretch_factor}.npz"
     else:
-        file_name = "jobs_executed.json"
-    with open(file_name, "w") as json_file:
-        json.dump(jobs_executed, json_file, indent=4)
+        file_name = SCHEDULE_PATH
+    if args.elastic:
+        file_name = file_name.replace(".npz", f"_elastic_{args.speedup}.npz")
+    save_schedule(jobs_executed, file_name)
 
 
 if __name__ == "__main__":
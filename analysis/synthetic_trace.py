@@ -0,0 +1,256 @@
+import datetime
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+PHILLY_NUM_JOBS = 117325
+PHILLY_NUM_MACHINES = 552
+GPUS_PER_MACHINE = 8
+TRACE_START = datetime.datetime(2017, 8, 7)  # local time (PDT)
+TRACE_DAYS = 137
+# The trace is logged in US/Pacific time, which left PDT (UTC-7) for PST
+# (UTC-8) at 2017-11-05 09:00 UTC.
+DST_END_UTC = datetime.datetime(2017, 11, 5, 9)
+UTIL_CHUNK_MINUTES = 60
+
+NUM_GPUS_CHOICES = [1, 2, 4, 8, 16, 32]
+NUM_GPUS_PROBS = [0.6, 0.1, 0.13, 0.12, 0.04, 0.01]
+NUM_ATTEMPTS_CHOICES = [0, 1, 2, 3]
+NUM_ATTEMPTS_PROBS = [0.03, 0.82, 0.1, 0.05]
+STATUSES = ["Pass", "Killed", "Failed"]
+STATUS_PROBS = [0.65, 0.2, 0.15]
+NUM_VCS = 14
+NUM_USERS = 300
+
+
+def _to_epoch(t: datetime.datetime) -> int:
+    return int((t - datetime.datetime(1970, 1, 1)).total_seconds())
+
+
+def _trace_start_utc() -> int:
+    return _to_epoch(TRACE_START) + 7 * 3600
+
+
+def _utc_to_local(utc_seconds: np.ndarray):
+    """Maps UTC seconds to naive US/Pacific datetime64s and their zone names."""
+    pdt = utc_seconds < _to_epoch(DST_END_UTC)
+    local = utc_seconds - np.where(pdt, 7 * 3600, 8 * 3600)
+    return local.astype("datetime64[s]"), np.where(pdt, "PDT", "PST")
+
+
+def _format_local(utc_seconds: np.ndarray) -> np.ndarray:
+    local, _ = _utc_to_local(utc_seconds)
+    return np.char.replace(np.datetime_as_string(local, unit="s"), "T", " ")
+
+
+def _hashes(rng, num: int) -> list:
+    return [f"{h:06x}" for h in rng.choice(1 << 24, size=num, replace=False)]
+
+
+def generate_job_log(path: str, scale: float = 1.0, seed: int = 42) -> int:
+    """Writes a synthetic cluster_job_log with the schema of the Philly trace.
+
+    Jobs are submitted uniformly over the trace window onto a cluster of
+    PHILLY_NUM_MACHINES * scale 8-GPU machines. GPU counts, attempt counts
+    and statuses follow roughly the mix of the real trace, and a small
+    fraction of attempts has missing start or end times. The log is streamed
+    to disk one job at a time.
+
+    Args:
+        path: The output path.
+        scale: The size relative to the Philly trace.
+        seed: The seed of the random number generator.
+
+    Returns:
+        The number of jobs written.
+    """
+    rng = np.random.default_rng(seed)
+    num_jobs = max(1, int(round(PHILLY_NUM_JOBS * scale)))
+    num_machines = max(4, int(round(PHILLY_NUM_MACHINES * scale)))
+    vcs = _hashes(rng, NUM_VCS)
+    users = _hashes(rng, NUM_USERS)
+
+    start = _trace_start_utc()
+    submitted = np.sort(rng.integers(start, start + TRACE_DAYS * 86400, num_jobs))
+    num_gpus = rng.choice(NUM_GPUS_CHOICES, size=num_jobs, p=NUM_GPUS_PROBS)
+    num_attempts = rng.choice(NUM_ATTEMPTS_CHOICES, size=num_jobs, p=NUM_ATTEMPTS_PROBS)
+    statuses = rng.choice(len(STATUSES), size=num_jobs, p=STATUS_PROBS)
+    job_vcs = rng.integers(0, NUM_VCS, num_jobs)
+    job_users = rng.integers(0, NUM_USERS, num_jobs)
+    queueing_delays = np.exp(rng.normal(4.0, 2.0, num_jobs)).astype(np.int64)
+
+    num_att = int(num_attempts.sum())
+    durations = np.minimum(np.exp(rng.normal(7.5, 2.0, num_att)), 30 * 86400)
+    gaps = np.exp(rng.normal(4.0, 1.5, num_att))
+    missing_start = rng.random(num_att) < 0.005
+    missing_end = rng.random(num_att) < 0.005
+    att_offsets = np.concatenate([[0], np.cumsum(num_attempts)])
+    # Attempt i of a job starts after the job's queueing delay and the
+    # durations and gaps of the attempts before it.
+    steps = (durations + gaps).astype(np.int64)
+    att_job = np.repeat(np.arange(num_jobs), num_attempts)
+    before = np.cumsum(steps) - steps
+    before -= before[att_offsets[att_job]]
+    att_start = submitted[att_job] + queueing_delays[att_job] + before
+    att_end = att_start + durations.astype(np.int64)
+    att_start_str = _format_local(att_start)
+    att_end_str = _format_local(att_end)
+    submitted_str = _format_local(submitted)
+
+    with open(path, "w") as f:
+        f.write("[\n")
+        for i in range(num_jobs):
+            attempts = []
+            for a in range(att_offsets[i], att_offsets[i + 1]):
+                if num_gpus[i] <= GPUS_PER_MACHINE:
+                    gpus = np.sort(rng.permutation(GPUS_PER_MACHINE)[: num_gpus[i]])
+                    detail = [
+                        {
+                            "ip": f"m{rng.integers(num_machines)}",
+                            "gpus": [f"gpu{g}" for g in gpus],
+                        }
+                    ]
+                else:
+                    machines = rng.choice(
+                        num_machines, num_gpus[i] // GPUS_PER_MACHINE, replace=False
+                    )
+                    detail = [
+                        {
+                            "ip": f"m{m}",
+                            "gpus": [f"gpu{g}" for g in range(GPUS_PER_MACHINE)],
+                        }
+                        for m in machines
+                    ]
+                attempts.append(
+                    {
+                        "start_time": None if missing_start[a] else att_start_str[a],
+                        "end_time": None if missing_end[a] else att_end_str[a],
+                        "detail": detail,
+                    }
+                )
+            job = {
+                "status": STATUSES[statuses[i]],
+                "vc": vcs[job_vcs[i]],
+                "jobid": f"application_{1500000000000 + i // 10000}_{i % 10000}",
+                "attempts": attempts,
+                "submitted_time": submitted_str[i],
+                "user": users[job_users[i]],
+            }
+            if i > 0:
+                f.write(",\n")
+            f.write(json.dumps(job))
+        f.write("\n]\n")
+    return num_jobs
+
+
+def generate_utilization(
+    logdir: str, scale: float = 1.0, days: float = TRACE_DAYS, seed: int = 42
+) -> int:
+    """Writes synthetic per-minute GPU, CPU and memory utilization CSVs.
+
+    Covers the first days of the trace window for every machine of the
+    cluster generated by generate_job_log at the same scale, including the
+    repeated hour at the end of daylight saving time. Also writes
+    cluster_machine_list.
+
+    Args:
+        logdir: The output directory.
+        scale: The size relative to the Philly trace.
+        days: The number of days covered.
+        seed: The seed of the random number generator.
+
+    Returns:
+        The number of rows written per CSV.
+    """
+    rng = np.random.default_rng(seed)
+    num_machines = max(4, int(round(PHILLY_NUM_MACHINES * scale)))
+    machines = np.array([f"m{m}" for m in range(num_machines)])
+    # Machines have a persistent load level so that utilization is not white
+    # noise.
+    machine_load = rng.uniform(0, 100, (num_machines, GPUS_PER_MACHINE))
+    mem_total = rng.choice([264136336.0, 528272672.0], num_machines)
+
+    pd.DataFrame(
+        {
+            "machineId": machines,
+            "number of GPUs": GPUS_PER_MACHINE,
+            "single GPU mem": " 24GB",
+        }
+    ).to_csv(os.path.join(logdir, "cluster_machine_list"), index=False)
+
+    gpu_cols = [f"gpu{g}_util" for g in range(GPUS_PER_MACHINE)]
+    paths = {
+        "gpu": os.path.join(logdir, "cluster_gpu_util"),
+        "cpu": os.path.join(logdir, "cluster_cpu_util"),
+        "mem": os.path.join(logdir, "cluster_mem_util"),
+    }
+    with open(paths["gpu"], "w") as gpu_f, open(paths["cpu"], "w") as cpu_f, open(
+        paths["mem"], "w"
+    ) as mem_f:
+        gpu_f.write(",".join(["time", "machineId"] + gpu_cols) + "\n")
+        cpu_f.write("time,machine_id,cpu_util\n")
+        mem_f.write("time,machine_id,mem_total,mem_free\n")
+        start = _trace_start_utc()
+        num_minutes = int(days * 24 * 60)
+        num_rows = 0
+        for chunk_start in range(0, num_minutes, UTIL_CHUNK_MINUTES):
+            minutes = np.arange(
+                chunk_start, min(chunk_start + UTIL_CHUNK_MINUTES, num_minutes)
+            )
+            utc = np.repeat(start + 60 * minutes, num_machines)
+            local, zones = _utc_to_local(utc)
+            times = np.char.add(
+                np.char.add(
+                    np.char.replace(np.datetime_as_string(local, unit="s"), "T", " "),
+                    " ",
+                ),
+                zones,
+            )
+            ids = np.tile(machines, len(minutes))
+            rows = len(utc)
+            load = np.tile(machine_load, (len(minutes), 1))
+            gpu = np.clip(load + rng.normal(0, 10, load.shape), 0, 100)
+            gpu[rng.random(gpu.shape) < 0.01] = np.nan
+            gpu_df = pd.DataFrame(gpu, columns=gpu_cols)
+            gpu_df.insert(0, "machineId", ids)
+            gpu_df.insert(0, "time", times)
+            gpu_df[""] = ""  # The real file ends each row with a comma.
+            gpu_df.to_csv(
+                gpu_f, header=False, index=False, na_rep="NA", float_format="%.9g"
+            )
+            cpu = np.clip(load.mean(axis=1) / 2 + rng.normal(0, 5, rows), 0, 100)
+            cpu[rng.random(rows) < 0.01] = np.nan
+            pd.DataFrame({"time": times, "machine_id": ids, "cpu_util": cpu}).to_csv(
+                cpu_f, header=False, index=False, na_rep="NA", float_format="%.5g"
+            )
+            total = np.tile(mem_total, len(minutes))
+            free = total * rng.uniform(0.01, 0.9, rows)
+            offline = rng.random(rows) < 0.01
+            total[offline] = np.nan
+            free[offline] = np.nan
+            pd.DataFrame(
+                {"time": times, "machine_id": ids, "mem_total": total, "mem_free": free}
+            ).to_csv(
+                mem_f, header=False, index=False, na_rep="NA", float_format="%.11g"
+            )
+            num_rows += rows
+    return num_rows
+
+
+def generate_trace(
+    logdir: str, scale: float = 1.0, util_days: float = TRACE_DAYS, seed: int = 42
+):
+    """Writes a complete synthetic trace directory (see generate_job_log)."""
+    os.makedirs(logdir, exist_ok=True)
+    generate_job_log(os.path.join(logdir, "cluster_job_log"), scale, seed)
+    generate_utilization(logdir, scale, util_days, seed)
+
+
+def main():
+    generate_trace("../trace-data-synthetic", scale=0.01, util_days=7)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+DATE_FORMAT_STR = "%Y-%m-%d %H:%M:%S"
+# The trace was collected in Redmond. Utilization stamps carry the zone
+# abbreviation, job log times are naive local times.
+TIMEZONE = "America/Los_Angeles"
+UTC_OFFSET_MINUTES = {"PDT": -7 * 60, "PST": -8 * 60}
+
+# Every time is mapped to a single monotonic index: integer minutes (or float
+# seconds) since the epoch in UTC. Local clock times repeat an hour when PDT
+# ends and skip one when it starts, so indexing by local time would make
+# minutes collide or go missing.
+
+
+def stamp_minutes(stamps) -> np.ndarray:
+    """Converts utilization stamps such as '2017-10-03 00:08:00 PDT' to UTC
+    minutes since the epoch.
+
+    Each distinct stamp is parsed once, which makes this fast for the trace's
+    files, where every stamp is shared by all machines.
+    """
+    codes, uniques = pd.factorize(pd.Series(stamps, dtype=object))
+    uniques = pd.Series(uniques, dtype=str)
+    naive = pd.to_datetime(uniques.str[:-4], format=DATE_FORMAT_STR)
+    zones = uniques.str[-3:]
+    offsets = zones.map(UTC_OFFSET_MINUTES)
+    if offsets.isna().any():
+        raise ValueError(f"Unknown time zones: {sorted(set(zones[offsets.isna()]))}")
+    minutes = naive.values.astype("datetime64[m]").astype(np.int64)
+    minutes -= offsets.to_numpy(dtype=np.int64)
+    return minutes[codes]
+
+
+def local_seconds(times) -> np.ndarray:
+    """Converts naive local times to UTC POSIX seconds.
+
+    Times in the hour that repeats when PDT ends are taken to be in its first
+    (PDT) pass, since the job log cannot tell them apart; they are at most an
+    hour off. Times in the hour skipped when PDT starts are moved forward.
+
+    Args:
+        times: A sequence of naive datetimes, date strings or datetime64
+               values, with None or NaT for missing times.
+
+    Returns:
+        A float64 array, NaN for missing times.
+    """
+    index = pd.DatetimeIndex(pd.to_datetime(pd.Series(times, dtype=object)))
+    utc = index.tz_localize(
+        TIMEZONE,
+        ambiguous=np.ones(len(index), dtype=bool),
+        nonexistent="shift_forward",
+    )
+    seconds = utc.tz_convert(None).values.astype("datetime64[s]")
+    seconds = seconds.astype(np.int64).astype(np.float64)
+    seconds[index.isna()] = np.nan
+    return seconds
+
+
+def local_minute(t) -> int:
+    """Converts one naive local time to UTC minutes since the epoch."""
+    return int(local_seconds([t])[0] // 60)
+
+
+def minutes_to_local(minutes) -> np.ndarray:
+    """Converts UTC minutes since the epoch to naive local datetime64[m]."""
+    utc = pd.DatetimeIndex(np.asarray(minutes, dtype="datetime64[m]"), tz="UTC")
+    return utc.tz_convert(TIMEZONE).tz_localize(None).values.astype("datetime64[m]")
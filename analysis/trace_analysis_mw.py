@@ -8,7 +8,10 @@ import os
 
 import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
+
+from job_export import export_jobs
+from render import cdf_line, render_figures, show_figures
+from trace_archive import ARCHIVE_PATH, open_member
 
 LOGDIR = "../trace-data"
 DATE_FORMAT_STR = "%Y-%m-%d %H:%M:%S"
@@ -214,15 +217,55 @@ def get_plot_config_from_bucket(bucket):
         return (">8", "purple", ":")
 
 
+def open_trace_file(name):
+    """Opens a trace file for reading.
+
+    Reads the file from LOGDIR if the trace has been extracted, and otherwise
+    streams it straight out of ARCHIVE_PATH.
+
+    Args:
+        name: The name of the trace file, e.g. 'cluster_job_log'.
+
+    Returns:
+        A text file object.
+    """
+    path = os.path.join(LOGDIR, name)
+    if os.path.exists(path):
+        return open(path, "r")
+    return open_member(name, ARCHIVE_PATH, text=True)
+
+
+def trace_fingerprint(name="cluster_job_log"):
+    """Identifies a trace file by the size and mtime of its source file.
+
+    Hashing the 6.6 GB trace on every run would cost more than loading it.
+    """
+    path = os.path.join(LOGDIR, name)
+    if not os.path.exists(path):
+        path = ARCHIVE_PATH
+    stat = os.stat(path)
+    return {
+        "path": os.path.abspath(path),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+    }
+
+
 def load_cluster_log():
-    cluster_job_log_path = os.path.join(LOGDIR, "cluster_job_log")
-    with open(cluster_job_log_path, "r") as f:
+    with open_trace_file("cluster_job_log") as f:
         cluster_job_log = json.load(f)
     jobs = [Job(**job) for job in cluster_job_log]
     return jobs
 
 
-def job_runtimes(jobs):
+def _show_or_render(specs, out_dir):
+    if out_dir is None:
+        show_figures(specs)
+    else:
+        render_figures(specs, out_dir)
+
+
+def job_runtimes_figures(jobs):
     run_times = {}
     for job in jobs:
         num_gpus = job.num_gpus
@@ -237,184 +280,181 @@ def job_runtimes(jobs):
             run_times[num_gpus].append(run_time)
 
     num_gpus = sorted([ngs for ngs in run_times])
+    lines = []
     for ngs in num_gpus:
         if len(run_times[ngs]) <= 1:
             continue
         x, y = get_cdf(run_times[ngs])
-        plt.plot(x, y, label=f"{ngs} GPU")
-    plt.legend(loc="lower right")
-    plt.xscale("log")
-    plt.xlim(10**-1, 10**4)
-    plt.ylim(0, 100)
-    plt.xlabel("Time (min)")
-    plt.ylabel("CDF")
-    plt.grid(alpha=0.3, linestyle="--")
-    plt.show()
+        lines.append(cdf_line(x, y, log_x=True, label=f"{ngs} GPU"))
+    return [
+        {
+            "name": "job_runtimes",
+            "lines": lines,
+            "legend_loc": "lower right",
+            "xscale": "log",
+            "xlim": (10**-1, 10**4),
+            "ylim": (0, 100),
+            "xlabel": "Time (min)",
+            "ylabel": "CDF",
+            "grid": True,
+        }
+    ]
+
+
+def job_runtimes(jobs, out_dir=None):
+    """Plots the run time CDFs of large jobs, to files if out_dir is given."""
+    _show_or_render(job_runtimes_figures(jobs), out_dir)
 
 
-def queuing_delays(jobs):
+def queuing_delays_figures(jobs):
+    from job_table import build_job_table, queueing_delays_by_group
+
+    # NOTE: Each period between the job being placed on the queue
+    # and being scheduled on a machine is recorded as an individual
+    # queueing delay.
+    table = build_job_table(jobs)
     queueing_delays = {}
-    for job in jobs:
-        vc = job.vc
-        if vc not in queueing_delays:
-            queueing_delays[vc] = {}
-        bucket = get_bucket_from_num_gpus(job.num_gpus)
-        if bucket is None:
-            continue
-        if bucket not in queueing_delays[vc]:
-            queueing_delays[vc][bucket] = []
-        # NOTE: Each period between the job being placed on the queue
-        # and being scheduled on a machine is recorded as an individual
-        # queueing delay.
-        queueing_delay = 0.0
-        queue_time = job.submitted_time
-        for attempt in job.attempts:
-            start_time = attempt["start_time"]
-            if queue_time is not None and start_time is not None:
-                queueing_delay = timedelta_to_minutes(start_time - queue_time)
-                queue_time = attempt["end_time"]
-            queueing_delays[vc][bucket].append(queueing_delay)
-    for vc in queueing_delays:
-        for bucket in queueing_delays[vc]:
-            queueing_delays[vc][bucket] = filter(None, queueing_delays[vc][bucket])
+    for (vc, bucket), delays in queueing_delays_by_group(table).items():
+        queueing_delays.setdefault(table["vcs"][vc], {})[bucket] = delays
 
-    vcs = queueing_delays.keys()
-    for i, vc in enumerate(vcs):
+    specs = []
+    for vc in queueing_delays:
+        lines = []
         for bucket in queueing_delays[vc]:
+            if len(queueing_delays[vc][bucket]) <= 1:
+                continue
             num_gpus, color, linestyle = get_plot_config_from_bucket(bucket)
             x, y = get_cdf(queueing_delays[vc][bucket])
-            plt.plot(
-                x, y, label="%s GPU" % (num_gpus), color=color, linestyle=linestyle
+            lines.append(
+                cdf_line(
+                    x,
+                    y,
+                    log_x=True,
+                    label="%s GPU" % (num_gpus),
+                    color=color,
+                    linestyle=linestyle,
+                )
             )
-        plt.title("VC %s" % (vc))
-        plt.legend(loc="lower right")
-        plt.xscale("log")
-        plt.ylim(0, 100)
-        plt.xlim(10**-1, 10**4)
-        plt.xlabel("Time (min)")
-        plt.ylabel("CDF")
-        plt.grid(alpha=0.3, linestyle="--")
-        if i < len(vcs) - 1:
-            plt.figure()
-    plt.show()
+        specs.append(
+            {
+                "name": "queueing_delays_vc_%s" % (vc),
+                "lines": lines,
+                "title": "VC %s" % (vc),
+                "legend_loc": "lower right",
+                "xscale": "log",
+                "ylim": (0, 100),
+                "xlim": (10**-1, 10**4),
+                "xlabel": "Time (min)",
+                "ylabel": "CDF",
+                "grid": True,
+            }
+        )
+    return specs
 
 
-def locality_constraints():
-    data = {}
-    for i, job in enumerate(jobs):
-        if len(job.attempts) == 0:
-            continue
-        num_gpus = job.num_gpus
-        if num_gpus < 5:
-            continue
-        bucket = get_bucket_from_num_gpus(num_gpus)
-        if bucket not in data:
-            data[bucket] = {"x": [], "y": []}
-        queueing_delay = job.queueing_delay
-        num_servers = len(job.attempts[0]["detail"])
-        data[bucket]["x"].append(queueing_delay)
-        data[bucket]["y"].append(num_servers)
-    for bucket in data:
-        num_gpus, _, _ = get_plot_config_from_bucket(bucket)
-        if bucket == 2:
-            marker = "+"
-            facecolors = "black"
-            edgecolors = "none"
-        else:
-            marker = "o"
-            facecolors = "none"
-            edgecolors = "red"
-        plt.scatter(
-            data[bucket]["x"],
-            data[bucket]["y"],
-            label="%s GPU" % (num_gpus),
-            marker=marker,
-            facecolors=facecolors,
-            edgecolors=edgecolors,
-        )
-        plt.legend()
-    plt.xscale("log")
-    plt.xlabel("Time (min)")
-    plt.ylabel("Num. Servers")
-    plt.show()
+def queuing_delays(jobs, out_dir=None):
+    """Plots queueing delay CDFs per VC, to files if out_dir is given."""
+    _show_or_render(queuing_delays_figures(jobs), out_dir)
+
+
+def locality_constraints(jobs, by_vc=False, out_dir=None):
+    """Plots queueing delay vs. number of servers of large jobs' attempts.
+
+    Draws one log-binned heatmap per GPU bucket (or per VC and bucket) and
+    prints a summary table, to files if out_dir is given.
+    """
+    import locality
+    from job_table import build_job_table
+
+    table = build_job_table(jobs)
+    print(locality.locality_summary(locality.attempt_locality(table), table["vcs"]))
+    _show_or_render(locality.locality_figures(table, by_vc), out_dir)
 
 
 def gpu_utilization():
-    gpu_util_path = os.path.join(LOGDIR, "cluster_gpu_util")
-    gpu_util = {}
-    with open(gpu_util_path, "r") as f:
-        reader = csv.reader(f)
-        next(reader)
-        for row in reader:
-            time = row[0][:-4]  # Remove the timezone
-            machineId = row[1]
-            if machineId not in gpu_util:
-                gpu_util[machineId] = {}
-            gpu_util[machineId][time] = row[
-                2:-1
-            ]  # Ignore extra empty string at the end
+    """Returns the per-minute GPU utilization cube of the trace.
+
+    The cube is indexed by UTC minute (see utilization and timeindex), so the
+    hour that repeats when PDT ends neither collides nor goes missing.
+    """
+    import utilization
 
+    return utilization.load_utilization_cube()
 
-def get_utilization_data(jobs, only_large_jobs=False, only_dedicated_servers=False):
+
+def utilization_rows(
+    table, gpu_util, only_large_jobs=False, only_dedicated_servers=False
+):
+    """Selects the GPU ranges of a job table that get_utilization_data uses.
+
+    Args:
+        table: A job table (see job_table).
+        gpu_util: The utilization cube returned by gpu_utilization().
+        only_large_jobs, only_dedicated_servers: As for get_utilization_data.
+
+    Returns:
+        The rows of utilization.attempt_gpu_ranges of the selected jobs.
+    """
+    import utilization
+
+    num_gpus = table["num_gpus"]
+    sizes = [8, 16] if only_large_jobs else [1, 4, 8, 16]
+    selected = np.isin(num_gpus, sizes) & (np.diff(table["attempt_offsets"]) > 0)
+
+    rows = utilization.attempt_gpu_ranges(table, gpu_util)
+    keep = selected[rows["job"]]
+    if only_dedicated_servers:
+        servers = table["attempt_num_servers"][rows["attempt"]]
+        keep &= servers <= num_gpus[rows["job"]] / 8
+    return {k: v[keep] for k, v in rows.items()}
+
+
+def get_utilization_data(
+    jobs, gpu_util, only_large_jobs=False, only_dedicated_servers=False
+):
     """Aggregates GPU utilization data for a set of jobs.
 
     Args:
         jobs: A list of Jobs.
+        gpu_util: The utilization cube returned by gpu_utilization().
         only_large_jobs: If True, only considers jobs of size 8 or 16 GPUs.
                          Otherwise, considers jobs of size 1, 4, 8, or 16 GPUs.
         only_dedicated_servers: If True, only considers jobs that use all GPUs
                                 available on a server(s).
 
     Returns:
-        A dict indexed by 1) job completion status, 2) number of GPUs requested
-        by the job, and 3) timestamp. The value of each nested dict is a list of
+        A dict indexed by 1) job completion status and 2) number of GPUs
+        requested by the job. The value of each nested dict is an array of
         percentages indicating the utilization of each individual GPU on the
-        servers used by the job at the particular time requested.
+        servers used by the job, for every minute the job ran.
     """
+    import utilization
+    from job_table import build_job_table
+
+    table = build_job_table(jobs)
+    rows = utilization_rows(table, gpu_util, only_large_jobs, only_dedicated_servers)
+    row, values = utilization.range_samples(
+        gpu_util, rows["machine"], rows["gpu"], rows["start"], rows["end"]
+    )
+    job = rows["job"][row]
+
+    num_gpus = table["num_gpus"]
+    sizes = [8, 16] if only_large_jobs else [1, 4, 8, 16]
     data = {}
-    for job in jobs:
-        num_gpus = job.num_gpus
-        if len(job.attempts) == 0 or (
-            num_gpus != 1 and num_gpus != 4 and num_gpus != 8 and num_gpus != 16
-        ):
-            continue
-        if only_large_jobs and num_gpus < 8:
-            continue
-        status = job.status
-        if status not in data:
-            data[status] = {}
-        if num_gpus not in data[status]:
-            data[status][num_gpus] = []
-        for attempt in job.attempts:
-            if only_dedicated_servers and len(attempt["detail"]) > (num_gpus / 8):
-                continue
-            current_time = attempt["start_time"]
-            if current_time is None or attempt["end_time"] is None:
-                continue
-            current_minute = round_to_nearest_minute(current_time)
-            while current_minute < attempt["end_time"]:
-                current_minute_str = str(current_minute)
-                for detail in attempt["detail"]:
-                    machineId = detail["ip"]
-                    if current_minute_str in gpu_util[machineId]:
-                        for gpu_id in detail["gpus"]:
-                            gpu_num = int(gpu_id[3:])  # Remove the 'gpu' prefix
-                            try:
-                                u = gpu_util[machineId][current_minute_str][gpu_num]
-                                if u != "NA":
-                                    data[status][num_gpus].append(float(u))
-                            except Exception as e:
-                                print(gpu_util[machineId][current_minute_str])
-                                print(gpu_num)
-                                raise ValueError(e)
-                current_minute = add_minute(current_minute)
+    for code, status in enumerate(table["statuses"]):
+        for size in sizes:
+            group = (table["status"] == code) & (num_gpus == size)
+            group &= np.diff(table["attempt_offsets"]) > 0
+            if group.any():
+                data.setdefault(status, {})[size] = values[group[job]]
     return data
 
 
-def gpu_utilization_1():
-    data = get_utilization_data(jobs)
-    statuses = data.keys()
-    for i, status in enumerate(statuses):
+def gpu_utilization_1_figures(jobs, gpu_util):
+    data = get_utilization_data(jobs, gpu_util)
+    specs = []
+    for status in data:
+        lines = []
         all_num_gpus = sorted(data[status].keys())
         for num_gpus in all_num_gpus:
             if num_gpus == 1:
@@ -430,29 +470,56 @@ def gpu_utilization_1():
                 color = "cyan"
                 linestyle = ":"
             x, y = get_cdf(data[status][num_gpus])
-            plt.plot(
-                x, y, label="%s GPU" % (num_gpus), color=color, linestyle=linestyle
+            lines.append(
+                cdf_line(
+                    x, y, label="%s GPU" % (num_gpus), color=color, linestyle=linestyle
+                )
             )
-        plt.title(status)
-        plt.xlim(0, 100)
-        plt.ylim(0, 100)
-        plt.legend(loc="lower right")
-        plt.xlabel("Utilization (%)")
-        plt.ylabel("CDF")
-        plt.grid(alpha=0.3, linestyle="--")
-        if i < len(statuses) - 1:
-            plt.figure()
-    plt.show()
+        specs.append(
+            {
+                "name": "gpu_utilization_%s" % (status),
+                "lines": lines,
+                "title": status,
+                "xlim": (0, 100),
+                "ylim": (0, 100),
+                "legend_loc": "lower right",
+                "xlabel": "Utilization (%)",
+                "ylabel": "CDF",
+                "grid": True,
+            }
+        )
+    return specs
+
 
+def gpu_utilization_1(jobs, out_dir=None):
+    """Plots GPU utilization CDFs per status, to files if out_dir is given."""
+    _show_or_render(gpu_utilization_1_figures(jobs, gpu_utilization()), out_dir)
 
-def gpu_utilization_2():
-    data = get_utilization_data(jobs, only_large_jobs=True, only_dedicated_servers=True)
+
+def render_figures_batch(jobs, out_dir="figures", processes=None):
+    """Renders the job run time, queueing delay and GPU utilization figures.
+
+    All figure data is computed first, and the figures are then rendered to
+    out_dir in a single process pool.
+    """
+    specs = job_runtimes_figures(jobs)
+    specs += queuing_delays_figures(jobs)
+    specs += gpu_utilization_1_figures(jobs, gpu_utilization())
+    return render_figures(specs, out_dir, processes=processes)
+
+
+def gpu_utilization_2(jobs):
+    data = get_utilization_data(
+        jobs, gpu_utilization(), only_large_jobs=True, only_dedicated_servers=True
+    )
     aggregate_data = {}
     for status in data:
         for num_gpus in data[status]:
             if num_gpus not in aggregate_data:
                 aggregate_data[num_gpus] = []
-            aggregate_data[num_gpus] += data[status][num_gpus]
+            aggregate_data[num_gpus].append(data[status][num_gpus])
+    for num_gpus in aggregate_data:
+        aggregate_data[num_gpus] = np.concatenate(aggregate_data[num_gpus])
     all_num_gpus = sorted(aggregate_data.keys())
     for num_gpus in all_num_gpus:
         if num_gpus == 8:
@@ -471,9 +538,8 @@ def gpu_utilization_2():
 
 
 def host_resource_utilization():
-    mem_util_path = os.path.join(LOGDIR, "cluster_mem_util")
     mem_util = []
-    with open(mem_util_path, "r") as f:
+    with open_trace_file("cluster_mem_util") as f:
         reader = csv.reader(f)
         next(reader)
         for row in reader:
@@ -485,9 +551,8 @@ def host_resource_utilization():
                 continue
             mem_util.append(100.0 * (mem_total - mem_free) / mem_total)
 
-    cpu_util_path = os.path.join(LOGDIR, "cluster_cpu_util")
     cpu_util = []
-    with open(cpu_util_path, "r") as f:
+    with open_trace_file("cluster_cpu_util") as f:
         reader = csv.reader(f)
         next(reader)
         for row in reader:
@@ -549,55 +614,6 @@ def calc_deltas(att):
     return ats
 
 
-def write_to_csv(jobs):
-    ids = []
-    ngpus = []
-    runtimes = []
-    attempts = []
-    for j in jobs:
-        ats = calc_deltas(j.attempts)
-        if not ats:
-            continue
-        attempts.append(ats)
-        ids.append(j.jobid)
-        ngpus.append(j.num_gpus)
-        runtimes.append(int(j.run_time))
-
-    df = pd.DataFrame(
-        {"id": ids, "num_gpus": ngpus, "runtime": runtimes, "attempts": attempts}
-    )
-    df.to_csv("jobs.csv", index=False)
-
-
-def attempts_time_str(att):
-    atts = []
-    for a in att:
-        atts.append(
-            {
-                "start_time": a["start_time"].strftime(DATE_FORMAT_STR),
-                "end_time": a["end_time"].strftime(DATE_FORMAT_STR),
-            }
-        )
-    return atts
-
-
-def write_to_json(jobs):
-    js = []
-    for j in jobs:
-        js.append(
-            {
-                "id": j.jobid,
-                "num_gpus": j.num_gpus,
-                "runtime": int(j.run_time * 60),  # from minutes to seconds
-                "attempts": attempts_time_str(j.attempts),
-                "submitted_time": j.submitted_time.strftime(DATE_FORMAT_STR),
-            }
-        )
-
-    with open("jobs.json", "w") as json_file:
-        json.dump(js, json_file, indent=4)
-
-
 def jobs_to_dict(jobs):
     job_dicts = []
     for j in jobs:
@@ -615,7 +631,7 @@ def jobs_to_dict(jobs):
 def main():
     js = load_cluster_log()
     js = filter_jobs(js)
-    write_to_json(js)
+    export_jobs(js)
 
 
 if __name__ == "__main__":
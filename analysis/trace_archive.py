@@ -0,0 +1,281 @@
+import gzip
+import io
+import json
+import os
+import posixpath
+import queue
+import tarfile
+import threading
+
+try:
+    import indexed_gzip
+except ImportError:
+    indexed_gzip = None
+
+ARCHIVE_PATH = "../trace-data.tar.gz"
+CACHE_DIR = "../trace-cache"
+READ_SIZE = 1 << 20  # bytes
+PREFETCH_DEPTH = 16  # chunks of READ_SIZE
+SEEK_POINT_SPACING = 16 << 20  # bytes of uncompressed data
+
+
+class PrefetchReader(io.RawIOBase):
+    """Reads a binary stream ahead in a background thread.
+
+    zlib releases the GIL while inflating, so wrapping a decompressing stream
+    lets decompression of the next chunks overlap with parsing of the current
+    one. At most depth chunks are buffered.
+    """
+
+    def __init__(
+        self,
+        raw,
+        limit: int = None,
+        on_close: list = None,
+        chunk_size: int = READ_SIZE,
+        depth: int = PREFETCH_DEPTH,
+    ):
+        """Starts prefetching.
+
+        Args:
+            raw: The binary stream to read from.
+            limit: The maximum number of bytes to read, or None to read to EOF.
+            on_close: Callables invoked once the reader is closed.
+            chunk_size: The size of each read from raw.
+            depth: The maximum number of chunks buffered ahead.
+        """
+        self._raw = raw
+        self._limit = limit
+        self._on_close = on_close or []
+        self._chunk_size = chunk_size
+        self._queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._pending = memoryview(b"")
+        self._eof = False
+        self._thread = threading.Thread(target=self._fill, daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _fill(self):
+        remaining = self._limit
+        try:
+            while not self._stop.is_set():
+                size = self._chunk_size
+                if remaining is not None:
+                    size = min(size, remaining)
+                if size == 0:
+                    break
+                chunk = self._raw.read(size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                self._put(chunk)
+        except Exception as e:
+            self._put(e)
+        self._put(None)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while len(self._pending) == 0:
+            if self._eof:
+                return 0
+            item = self._queue.get()
+            if item is None:
+                self._eof = True
+                return 0
+            if isinstance(item, Exception):
+                self._eof = True
+                raise item
+            self._pending = memoryview(item)
+        n = min(len(b), len(self._pending))
+        b[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def close(self):
+        if self.closed:
+            return
+        self._stop.set()
+        self._thread.join()
+        for callback in self._on_close:
+            callback()
+        super().close()
+
+
+def _member_matches(member_name: str, name: str) -> bool:
+    return member_name == name or posixpath.basename(member_name) == name
+
+
+def _index_paths(archive: str, cache_dir: str):
+    base = os.path.join(cache_dir, os.path.basename(archive))
+    return base + ".members.json", base + ".gzidx"
+
+
+def build_archive_index(
+    archive: str = ARCHIVE_PATH,
+    cache_dir: str = CACHE_DIR,
+    spacing: int = SEEK_POINT_SPACING,
+) -> dict:
+    """Builds the one-time seek index of a trace archive.
+
+    Records the uncompressed offset and size of every tar member. If the
+    optional indexed_gzip package is installed, additionally stores a seek
+    point (compressed offset plus 32 KiB inflate window) every spacing bytes
+    of uncompressed data, so that decompression can restart at the closest
+    seek point instead of at the beginning of the archive.
+
+    Args:
+        archive: The path of the .tar.gz archive.
+        cache_dir: The directory to store the index in.
+        spacing: The distance between seek points in uncompressed bytes.
+
+    Returns:
+        The index as a dict.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    members_path, seek_index_path = _index_paths(archive, cache_dir)
+    if indexed_gzip is not None:
+        gz = indexed_gzip.IndexedGzipFile(archive, spacing=spacing)
+        gz.build_full_index()
+        gz.export_index(seek_index_path)
+        mode = "r:"
+    else:
+        gz = gzip.open(archive, "rb")
+        seek_index_path = None
+        mode = "r|"
+    with gz, tarfile.open(fileobj=gz, mode=mode) as tar:
+        members = [
+            {"name": m.name, "offset_data": m.offset_data, "size": m.size}
+            for m in tar
+            if m.isfile()
+        ]
+    stat = os.stat(archive)
+    index = {
+        "archive_size": stat.st_size,
+        "archive_mtime": stat.st_mtime,
+        "members": members,
+        "seek_index": seek_index_path,
+    }
+    with open(members_path, "w") as f:
+        json.dump(index, f, indent=4)
+    return index
+
+
+def load_archive_index(archive: str = ARCHIVE_PATH, cache_dir: str = CACHE_DIR):
+    """Returns the seek index of an archive, or None if it is missing or stale."""
+    members_path, _ = _index_paths(archive, cache_dir)
+    if not os.path.exists(members_path):
+        return None
+    with open(members_path, "r") as f:
+        index = json.load(f)
+    stat = os.stat(archive)
+    if index["archive_size"] != stat.st_size or index["archive_mtime"] != stat.st_mtime:
+        return None
+    if index["seek_index"] is not None and not os.path.exists(index["seek_index"]):
+        return None
+    return index
+
+
+def _open_indexed(archive: str, index: dict, name: str, offset: int):
+    for member in index["members"]:
+        if _member_matches(member["name"], name):
+            break
+    else:
+        raise FileNotFoundError(f"{name} is not a member of {archive}")
+    gz = indexed_gzip.IndexedGzipFile(archive, index_file=index["seek_index"])
+    gz.seek(member["offset_data"] + offset)
+    return PrefetchReader(gz, limit=member["size"] - offset, on_close=[gz.close])
+
+
+def _open_streaming(archive: str, name: str, offset: int):
+    gz = gzip.open(archive, "rb")
+    tar = tarfile.open(fileobj=gz, mode="r|")
+    for member in tar:
+        if member.isfile() and _member_matches(member.name, name):
+            break
+    else:
+        tar.close()
+        gz.close()
+        raise FileNotFoundError(f"{name} is not a member of {archive}")
+    f = tar.extractfile(member)
+    # A streamed member cannot seek, so the bytes before offset are
+    # decompressed and discarded.
+    while offset > 0:
+        skipped = len(f.read(min(offset, READ_SIZE)))
+        if skipped == 0:
+            break
+        offset -= skipped
+    return PrefetchReader(f, on_close=[tar.close, gz.close])
+
+
+def open_member(
+    name: str,
+    archive: str = ARCHIVE_PATH,
+    offset: int = 0,
+    text: bool = False,
+    cache_dir: str = CACHE_DIR,
+):
+    """Opens a member of a trace archive without extracting it.
+
+    Uses the seek index (see build_archive_index) to jump to the member if
+    available, and otherwise streams the archive up to the member.
+    Decompression runs ahead of the reader in a background thread.
+
+    Args:
+        name: The member's name or basename, e.g. 'cluster_job_log'.
+        archive: The path of the .tar.gz archive.
+        offset: The byte offset within the member to start reading at.
+        text: If True, returns a text stream instead of a binary one.
+        cache_dir: The directory the seek index is stored in.
+
+    Returns:
+        A readable file object.
+    """
+    index = load_archive_index(archive, cache_dir)
+    if index is not None and index["seek_index"] is not None:
+        raw = _open_indexed(archive, index, name, offset)
+    else:
+        raw = _open_streaming(archive, name, offset)
+    f = io.BufferedReader(raw, buffer_size=READ_SIZE)
+    if text:
+        return io.TextIOWrapper(f, encoding="utf-8", newline="")
+    return f
+
+
+def iter_members(archive: str = ARCHIVE_PATH, text: bool = False):
+    """Yields (name, file object) for every file in a trace archive.
+
+    The archive is read in a single streaming pass, so each file object is
+    only valid until the next member is yielded.
+    """
+    with gzip.open(archive, "rb") as gz, tarfile.open(fileobj=gz, mode="r|") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            f = io.BufferedReader(
+                PrefetchReader(tar.extractfile(member)), buffer_size=READ_SIZE
+            )
+            if text:
+                f = io.TextIOWrapper(f, encoding="utf-8", newline="")
+            yield posixpath.basename(member.name), f
+            f.close()
+
+
+def main():
+    index = build_archive_index()
+    for member in index["members"]:
+        print(f"{member['name']} {member['size']} bytes at {member['offset_data']}")
+
+
+if __name__ == "__main__":
+    main()
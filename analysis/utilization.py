@@ -0,0 +1,621 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import quantize
+import trace_analysis_mw
+from job_table import load_job_table, table_subset
+from timeindex import stamp_minutes
+from trace_archive import CACHE_DIR
+
+CUBE_DIR = os.path.join(CACHE_DIR, "gpu_util")
+CHUNK_ROWS = 1 << 20
+# A GPU-minute counts as idle if its utilization is at most IDLE_UTIL percent.
+IDLE_UTIL = 0.0
+# The median utilization of a job is estimated from at most P50_SAMPLES evenly
+# spaced minutes of each of its GPUs in each attempt, so it is exact for
+# attempts of up to P50_SAMPLES minutes.
+P50_SAMPLES = 64
+SUMMARY_PATH = "job_utilization.csv"
+# Part of the cache key, so that cubes of an older layout are rebuilt.
+FORMAT_VERSION = 3
+# The codec new minute data is stored with by default, None for float32.
+# 'uint8' and 'uint16' (see quantize) are lossy and opt-in.
+CODEC = None
+
+# A utilization cube holds the per-minute utilization of every GPU in the
+# trace, together with prefix sums over time that make the sum, the number of
+# valid samples and the number of idle samples of any GPU over any time range
+# two lookups each:
+#     'machines': The sorted machine ids; machine i is row i of the arrays.
+#     'start_minute': The minute of column 0, in UTC minutes since the epoch
+#                     (see timeindex), the index the job table's times map
+#                     to as well.
+#     'util': float32 (machines, GPUs, minutes), NaN where the trace has NA
+#             or no sample.
+#     'sum': float64 (machines, GPUs, minutes + 1), where sum[m, g, t] is the
+#            sum of the valid samples of GPU g of machine m before minute t.
+#     'count', 'idle': int32 (machines, GPUs, minutes + 1), the number of
+#                      valid and of idle samples before minute t.
+# The arrays are stored as .npy files and memory-mapped, since the full
+# trace's cube is several GB. Cubes built with a codec store 'util' as codes
+# and the prefix sums compactly, all of which decode transparently when
+# indexed (see quantize):
+#     'sum', 'idle': Sums of codes and idle counts as block_prefix_encode
+#                    blocks ('sum_blocks', 'idle_blocks') and offsets.
+#     'count': Derived from the runs of NA codes ('na_starts', 'na_ends').
+# With 'uint8' that is about 4 bytes per GPU-minute (codes 1, sum offsets 2,
+# idle offsets 1) against 20 for float32 minute data, float64 sums and int32
+# counts, and about 7 with 'uint16'. With a codec, sums and medians are those
+# of the decoded samples, and idle samples are those that quantize to 0, i.e.
+# below quantize.max_error rather than at most IDLE_UTIL.
+CUBE_ARRAYS = ["util", "sum", "count", "idle"]
+COMPACT_CUBE_ARRAYS = [
+    "util",
+    "sum",
+    "sum_blocks",
+    "idle",
+    "idle_blocks",
+    "na_starts",
+    "na_ends",
+]
+
+
+def iter_machine_series(name: str, chunk_rows: int = CHUNK_ROWS, dtype=np.float32):
+    """Reads a per-machine utilization trace file chunk by chunk.
+
+    Args:
+        name: The trace file, e.g. 'cluster_gpu_util', whose first two
+              columns are the time and the machine id.
+        chunk_rows: The number of lines parsed at a time.
+        dtype: The float type of the values.
+
+    Yields:
+        Tuples (machines, machine codes, minutes, values) of up to chunk_rows
+        lines each, where machines are the ids of all codes seen so far (so
+        the last chunk's are those of the whole file), minutes are UTC
+        minutes since the epoch and values holds the remaining columns as
+        dtype with NaN for NA.
+    """
+    machines = {}
+    with trace_analysis_mw.open_trace_file(name) as f:
+        # Rows of cluster_gpu_util end in an extra comma, so there is one
+        # more field than there are header names.
+        reader = pd.read_csv(f, chunksize=chunk_rows, index_col=False)
+        for chunk in reader:
+            minutes = stamp_minutes(chunk.iloc[:, 0].to_numpy())
+            machine_codes, names = pd.factorize(chunk.iloc[:, 1])
+            names = np.array([machines.setdefault(n, len(machines)) for n in names])
+            yield (
+                np.array(list(machines), dtype=str),
+                names[machine_codes].astype(np.int32),
+                minutes,
+                chunk.iloc[:, 2:].to_numpy(dtype=dtype),
+            )
+
+
+def read_machine_series(name: str, chunk_rows: int = CHUNK_ROWS, dtype=np.float32):
+    """Reads a per-machine utilization trace file into flat arrays.
+
+    Returns:
+        A tuple (machines, machine codes, minutes, values) with one row per
+        line of the file (see iter_machine_series).
+
+    Raises:
+        ValueError: If the file has no rows.
+    """
+    codes, minutes, values = [], [], []
+    for machines, c, m, v in iter_machine_series(name, chunk_rows, dtype):
+        codes.append(c)
+        minutes.append(m)
+        values.append(v)
+    minutes = np.concatenate(minutes) if minutes else np.empty(0, dtype=np.int64)
+    if len(minutes) == 0:
+        raise ValueError(f"{name} has no rows")
+    return machines, np.concatenate(codes), minutes, np.concatenate(values)
+
+
+def spill_machine_series(
+    name: str, spill_dir: str, chunk_rows: int = CHUNK_ROWS, dtype=np.float32
+) -> tuple:
+    """Reads a per-machine utilization trace file into .npy files in
+    spill_dir, so that only one chunk is in memory at a time.
+
+    Returns:
+        A tuple (machines, chunks, first minute, last minute), where chunks
+        lists the chunks in file order as dicts of the paths of their
+        'codes', 'minutes' and 'values' (see iter_machine_series).
+
+    Raises:
+        ValueError: If the file has no rows.
+    """
+    os.makedirs(spill_dir, exist_ok=True)
+    chunks = []
+    first, last = None, None
+    for i, (machines, *arrays) in enumerate(
+        iter_machine_series(name, chunk_rows, dtype)
+    ):
+        if len(arrays[1]) == 0:
+            continue
+        paths = {}
+        for key, array in zip(["codes", "minutes", "values"], arrays):
+            paths[key] = os.path.join(spill_dir, f"{name}-{i:05d}-{key}.npy")
+            np.save(paths[key], array)
+        chunks.append(paths)
+        minutes = arrays[1]
+        first = int(minutes.min()) if first is None else min(first, minutes.min())
+        last = int(minutes.max()) if last is None else max(last, minutes.max())
+    if first is None:
+        raise ValueError(f"{name} has no rows")
+    return machines, chunks, int(first), int(last)
+
+
+def _machine_ranks(machines) -> tuple:
+    order = np.argsort(machines)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return order, rank
+
+
+def _open_minute_array(path: str, shape: tuple, codec: str = None):
+    if codec is None:
+        dtype, fill = np.float32, np.nan
+    else:
+        dtype, fill = quantize.CODECS[codec], quantize.na_code(codec)
+    array = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+    array[:] = fill
+    return array
+
+
+def _scatter(array, rank, start_minute: int, codes, minutes, values, codec: str):
+    if codec is not None:
+        values = quantize.encode_util(values, codec)
+    rows = rank[codes][:, None]
+    columns = np.arange(array.shape[1])[None, :]
+    array[rows, columns, (minutes - start_minute)[:, None]] = values
+
+
+def write_minute_array(
+    path: str, machines, codes, minutes, values, codec: str = None
+) -> tuple:
+    """Scatters the output of read_machine_series into a dense array.
+
+    Args:
+        path: The .npy file the array is memory-mapped to.
+        codec: A quantize codec to store the values with, None for float32.
+
+    Returns:
+        A tuple (sorted machines, start minute, array), where the array has
+        shape (machines, columns, minutes) and NaN (or the NA code) where
+        there is no sample. Later lines overwrite earlier ones of the same
+        minute.
+    """
+    order, rank = _machine_ranks(machines)
+    start_minute = int(minutes.min())
+    shape = (len(machines), values.shape[1], int(minutes.max()) - start_minute + 1)
+    array = _open_minute_array(path, shape, codec)
+    _scatter(array, rank, start_minute, codes, minutes, values, codec)
+    return machines[order], start_minute, array
+
+
+def write_spilled_minute_array(
+    path: str, machines, chunks, first: int, last: int, codec: str = None
+) -> tuple:
+    """Like write_minute_array, for the output of spill_machine_series.
+
+    The chunks are loaded and scattered one at a time.
+    """
+    order, rank = _machine_ranks(machines)
+    num_columns = np.load(chunks[0]["values"], mmap_mode="r").shape[1]
+    array = _open_minute_array(
+        path, (len(machines), num_columns, last - first + 1), codec
+    )
+    for chunk in chunks:
+        codes, minutes, values = (
+            np.load(chunk[key]) for key in ["codes", "minutes", "values"]
+        )
+        _scatter(array, rank, first, codes, minutes, values, codec)
+    return machines[order], first, array
+
+
+def _cube_fingerprint(codec: str) -> dict:
+    return {
+        **trace_analysis_mw.trace_fingerprint("cluster_gpu_util"),
+        "version": FORMAT_VERSION,
+        "codec": codec,
+    }
+
+
+def _prefix_sums(values: np.ndarray, dtype) -> np.ndarray:
+    prefix = np.zeros(values.shape[:-1] + (values.shape[-1] + 1,), dtype=dtype)
+    np.cumsum(values, axis=-1, out=prefix[..., 1:])
+    return prefix
+
+
+def _write_prefix_sums(cube_dir: str, util):
+    """Writes the float64 'sum' and int32 'count' and 'idle' prefix sums of
+    float32 minute data."""
+    shape = util.shape[:2] + (util.shape[2] + 1,)
+    arrays = {
+        name: np.lib.format.open_memmap(
+            os.path.join(cube_dir, f"{name}.npy"), mode="w+", dtype=dtype, shape=shape
+        )
+        for name, dtype in [
+            ("sum", np.float64),
+            ("count", np.int32),
+            ("idle", np.int32),
+        ]
+    }
+    # One machine at a time, to bound the temporaries.
+    for m in range(util.shape[0]):
+        u = util[m]
+        valid = ~np.isnan(u)
+        arrays["sum"][m] = _prefix_sums(np.where(valid, u, 0), np.float64)
+        arrays["count"][m] = _prefix_sums(valid, np.int32)
+        arrays["idle"][m] = _prefix_sums(u <= IDLE_UTIL, np.int32)
+    for array in arrays.values():
+        array.flush()
+
+
+def _write_compact_prefix_sums(cube_dir: str, util, codec: str):
+    """Writes the compact prefix sums (see above) of minute data stored as
+    codes."""
+    num_machines, num_gpus, num_minutes = util.shape
+    block = quantize.BLOCK
+    num_blocks = num_minutes // block + 1
+    layout = {
+        "sum": (quantize.sum_dtype(codec, block - 1), num_minutes + 1),
+        "sum_blocks": (quantize.sum_dtype(codec, num_minutes), num_blocks),
+        "idle": (np.uint8, num_minutes + 1),
+        "idle_blocks": (np.int32, num_blocks),
+    }
+    arrays = {
+        name: np.lib.format.open_memmap(
+            os.path.join(cube_dir, f"{name}.npy"),
+            mode="w+",
+            dtype=dtype,
+            shape=(num_machines, num_gpus, length),
+        )
+        for name, (dtype, length) in layout.items()
+    }
+    na = quantize.na_code(codec)
+    starts, ends = [], []
+    # One machine at a time, to bound the temporaries.
+    for m in range(num_machines):
+        u = util[m]
+        valid = u != na
+        for name, values in [
+            ("sum", np.where(valid, u, 0)),
+            ("idle", quantize.decode_util(u, codec) <= IDLE_UTIL),
+        ]:
+            blocks, offsets = quantize.block_prefix_encode(
+                _prefix_sums(values, np.int64), arrays[name].dtype, block
+            )
+            arrays[name][m] = offsets
+            arrays[f"{name}_blocks"][m] = blocks
+        run_starts, run_ends = quantize.missing_runs(~valid, m * num_gpus * num_minutes)
+        starts.append(run_starts)
+        ends.append(run_ends)
+    for array in arrays.values():
+        array.flush()
+    np.save(os.path.join(cube_dir, "na_starts.npy"), np.concatenate(starts))
+    np.save(os.path.join(cube_dir, "na_ends.npy"), np.concatenate(ends))
+
+
+def build_utilization_cube(
+    cube_dir: str = CUBE_DIR,
+    codec: str = CODEC,
+    spill_dir: str = None,
+    chunk_rows: int = CHUNK_ROWS,
+) -> dict:
+    """Builds the utilization cube of the trace (see above) into cube_dir.
+
+    Args:
+        cube_dir: The output directory.
+        codec: A quantize codec to store the minute data with, None for
+               float32.
+        spill_dir: If given, the trace file is first read into chunks in this
+                   directory (see spill_machine_series), so that memory use
+                   is bounded by chunk_rows rather than the size of the
+                   trace.
+        chunk_rows: The number of lines of the trace file read at a time.
+    """
+    fingerprint = _cube_fingerprint(codec)
+    parent = os.path.dirname(os.path.abspath(cube_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent)
+    if spill_dir is None:
+        machines, start_minute, util = write_minute_array(
+            os.path.join(tmp, "util.npy"),
+            *read_machine_series("cluster_gpu_util", chunk_rows),
+            codec=codec,
+        )
+    else:
+        machines, start_minute, util = write_spilled_minute_array(
+            os.path.join(tmp, "util.npy"),
+            *spill_machine_series("cluster_gpu_util", spill_dir, chunk_rows),
+            codec=codec,
+        )
+    if codec is None:
+        _write_prefix_sums(tmp, util)
+    else:
+        _write_compact_prefix_sums(tmp, util, codec)
+    util.flush()
+    del util
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(
+            {
+                "machines": machines.tolist(),
+                "start_minute": start_minute,
+                "codec": codec,
+                "fingerprint": fingerprint,
+            },
+            f,
+        )
+    if os.path.exists(cube_dir):
+        shutil.rmtree(cube_dir)
+    os.replace(tmp, cube_dir)
+    return load_utilization_cube(cube_dir, rebuild=False)
+
+
+def load_utilization_cube(
+    cube_dir: str = CUBE_DIR, rebuild: bool = True, codec: str = CODEC
+) -> dict:
+    """Memory-maps the utilization cube, building it first if it is missing,
+    the trace's cluster_gpu_util changed or it was built with another
+    codec."""
+    meta_path = os.path.join(cube_dir, "meta.json")
+    if os.path.exists(meta_path):
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        if not rebuild or meta["fingerprint"] == _cube_fingerprint(codec):
+            cube = {
+                "machines": np.array(meta["machines"], dtype=str),
+                "start_minute": meta["start_minute"],
+            }
+            stored_codec = meta.get("codec")
+            names = CUBE_ARRAYS if stored_codec is None else COMPACT_CUBE_ARRAYS
+            for name in names:
+                path = os.path.join(cube_dir, f"{name}.npy")
+                cube[name] = np.load(path, mmap_mode="r")
+            if stored_codec is not None:
+                _decode_compact(cube, stored_codec)
+            return cube
+    return build_utilization_cube(cube_dir, codec)
+
+
+def _decode_compact(cube: dict, codec: str):
+    """Replaces the arrays of a compact cube with views that decode them."""
+    util = cube["util"]
+    sums = quantize.BlockPrefixArray(cube.pop("sum_blocks"), cube["sum"])
+    cube["sum"] = quantize.scaled_sums(sums, codec)
+    cube["idle"] = quantize.BlockPrefixArray(cube.pop("idle_blocks"), cube["idle"])
+    cube["count"] = quantize.ValidCountArray(
+        cube.pop("na_starts"),
+        cube.pop("na_ends"),
+        util.shape[:2] + (util.shape[2] + 1,),
+    )
+    cube["util"] = quantize.decoded_util(util, codec)
+
+
+def range_totals(cube: dict, machine, gpu, start, end) -> tuple:
+    """Returns the utilization totals of GPUs over minute ranges.
+
+    All arguments are broadcast against each other, so this looks up any
+    number of ranges at once.
+
+    Args:
+        cube: A utilization cube.
+        machine: Row indices into cube['machines'].
+        gpu: GPU numbers.
+        start, end: The ranges [start, end) as column indices, clipped to the
+                    cube.
+
+    Returns:
+        A tuple (sum, count, idle) of the sum of the valid samples, the number
+        of valid samples and the number of idle samples in each range.
+    """
+    num_minutes = cube["util"].shape[2]
+    start = np.clip(start, 0, num_minutes)
+    end = np.clip(end, start, num_minutes)
+    return tuple(
+        cube[name][machine, gpu, end] - cube[name][machine, gpu, start]
+        for name in ["sum", "count", "idle"]
+    )
+
+
+def range_samples(cube: dict, machine, gpu, start, end) -> tuple:
+    """Gathers the valid samples of GPUs over minute ranges.
+
+    All samples are gathered with one integer index into the cube.
+
+    Args:
+        cube: A utilization cube.
+        machine, gpu, start, end: Arrays with one range per element, as for
+                                  range_totals.
+
+    Returns:
+        A pair of arrays (range, values), the index of the range of each
+        sample and its value.
+    """
+    num_minutes = cube["util"].shape[2]
+    start = np.clip(start, 0, num_minutes)
+    length = np.clip(end, start, num_minutes) - start
+    row = np.repeat(np.arange(len(length)), length)
+    minute = start[row] + np.arange(len(row)) - (np.cumsum(length) - length)[row]
+    values = cube["util"][machine[row], gpu[row], minute]
+    valid = ~np.isnan(values)
+    return row[valid], values[valid]
+
+
+def attempt_gpu_ranges(table: dict, cube: dict) -> dict:
+    """Expands the attempts of a job table into one row per GPU used.
+
+    Attempts with a missing start or end time and servers missing from the
+    cube are left out.
+
+    Returns:
+        A dict of arrays with one element per row: the 'job' and 'attempt'
+        rows of the table, the cube row 'machine', the 'gpu' and the range
+        of cube columns 'start':'end' the attempt ran in (not clipped).
+    """
+    attempt = table["detail_attempt"]
+    start = table["attempt_start"][attempt]
+    end = table["attempt_end"][attempt]
+    machine = np.searchsorted(cube["machines"], table["machines"])
+    found = machine < len(cube["machines"])
+    found[found] = cube["machines"][machine[found]] == table["machines"][found]
+    detail_machine = table["detail_machine"]
+    keep = ~np.isnan(start) & ~np.isnan(end) & found[detail_machine]
+    # A range covers the minutes from the one the attempt started in up to
+    # the last one that starts before it ended.
+    first = np.floor(start[keep] / 60).astype(np.int64) - cube["start_minute"]
+    last = np.ceil(end[keep] / 60).astype(np.int64) - cube["start_minute"]
+    mask = table["detail_gpu_mask"][keep]
+    rows = {"job": [], "attempt": [], "machine": [], "gpu": [], "start": [], "end": []}
+    for g in range(cube["util"].shape[1]):
+        used = (mask >> g) & 1 == 1
+        rows["job"].append(table["attempt_job"][attempt[keep][used]])
+        rows["attempt"].append(attempt[keep][used])
+        rows["machine"].append(machine[detail_machine[keep][used]])
+        rows["gpu"].append(np.full(used.sum(), g))
+        rows["start"].append(first[used])
+        rows["end"].append(last[used])
+    return {name: np.concatenate(values) for name, values in rows.items()}
+
+
+def _weighted_medians(group, values, weights, num_groups: int) -> np.ndarray:
+    """Returns the weighted median of the values of each group, NaN if empty."""
+    order = np.lexsort((values, group))
+    group, values, weights = group[order], values[order], weights[order]
+    cumulative = np.cumsum(weights)
+    totals = np.bincount(group, weights, minlength=num_groups)
+    before = np.cumsum(totals) - totals
+    medians = np.full(num_groups, np.nan)
+    nonempty = totals > 0
+    index = np.searchsorted(cumulative, before[nonempty] + totals[nonempty] / 2)
+    medians[nonempty] = values[np.minimum(index, len(values) - 1)]
+    return medians
+
+
+def job_utilization_summary(table: dict, cube: dict) -> pd.DataFrame:
+    """Summarizes the GPU utilization of every job.
+
+    The mean utilization and idle fraction come from two prefix sum lookups
+    per GPU and attempt, and are exact for a float32 cube. With a codec they
+    are those of the quantized samples (see above). The median is the
+    weighted median of a systematic sample of at most P50_SAMPLES minutes per
+    GPU and attempt.
+
+    Args:
+        table: A job table.
+        cube: A utilization cube.
+
+    Returns:
+        A DataFrame with one row per job and its 'jobid', 'vc', 'status',
+        'num_gpus', 'gpu_minutes' (the number of valid samples),
+        'mean_util', 'p50_util' and 'idle_fraction'. Utilizations are in
+        percent and NaN for jobs without samples.
+    """
+    num_jobs = len(table["jobid"])
+    rows = attempt_gpu_ranges(table, cube)
+    sums, counts, idle = range_totals(
+        cube, rows["machine"], rows["gpu"], rows["start"], rows["end"]
+    )
+    job_sum = np.bincount(rows["job"], sums, minlength=num_jobs)
+    job_count = np.bincount(rows["job"], counts, minlength=num_jobs)
+    job_idle = np.bincount(rows["job"], idle, minlength=num_jobs)
+
+    num_minutes = cube["util"].shape[2]
+    start = np.clip(rows["start"], 0, num_minutes)
+    length = np.clip(rows["end"], start, num_minutes) - start
+    num_samples = np.minimum(length, P50_SAMPLES)
+    row = np.repeat(np.arange(len(length)), num_samples)
+    offsets = np.cumsum(num_samples) - num_samples
+    j = np.arange(len(row)) - offsets[row]
+    minute = start[row] + (2 * j + 1) * length[row] // (2 * num_samples[row])
+    samples = cube["util"][rows["machine"][row], rows["gpu"][row], minute]
+    weights = length[row] / num_samples[row]
+    valid = ~np.isnan(samples)
+    p50 = _weighted_medians(
+        rows["job"][row][valid], samples[valid], weights[valid], num_jobs
+    )
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = job_sum / job_count
+        idle_fraction = job_idle / job_count
+    return pd.DataFrame(
+        {
+            "jobid": table["jobid"],
+            "vc": table["vcs"][table["vc"]],
+            "status": table["statuses"][table["status"]],
+            "num_gpus": table["num_gpus"],
+            "gpu_minutes": job_count.astype(np.int64),
+            "mean_util": mean,
+            "p50_util": p50,
+            "idle_fraction": idle_fraction,
+        }
+    )
+
+
+def _summary_shard(vcs, table: dict, cube: dict) -> pd.DataFrame:
+    return job_utilization_summary(table_subset(table, np.isin(table["vc"], vcs)), cube)
+
+
+def sharded_job_utilization_summary(
+    table: dict, cube_dir: str = CUBE_DIR, processes: int = None, codec: str = CODEC
+) -> pd.DataFrame:
+    """Computes job_utilization_summary in a process pool, one shard of VCs
+    per worker, with the job table and cube shared rather than copied.
+
+    Returns:
+        The summary, with the jobs grouped by shard.
+    """
+    import shared
+
+    processes = processes or os.cpu_count()
+    with shared.publish_arrays(table) as table_handle:
+        parts = shared.run_sharded(
+            _summary_shard,
+            shared.vc_shards(table, processes),
+            table_handle,
+            shared.publish_cube(cube_dir, codec),
+            processes,
+        )
+    return pd.concat(parts, ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Summarize the GPU utilization of every job."
+    )
+    parser.add_argument("--out", default=SUMMARY_PATH)
+    parser.add_argument(
+        "--processes", type=int, default=1, help="worker processes, sharded by VC"
+    )
+    parser.add_argument(
+        "--codec",
+        choices=list(quantize.CODECS),
+        help="store the cube quantized (lossy, see quantize) instead of as float32",
+    )
+    args = parser.parse_args()
+
+    if args.processes == 1:
+        summary = job_utilization_summary(
+            load_job_table(), load_utilization_cube(codec=args.codec)
+        )
+    else:
+        summary = sharded_job_utilization_summary(
+            load_job_table(), processes=args.processes, codec=args.codec
+        )
+    summary.to_csv(args.out, index=False)
+    print(summary.describe().to_string())
+
+
+if __name__ == "__main__":
+    main()